@@ -0,0 +1,188 @@
+"""
+File: m_benchmark_drug_validation.py
+Purpose: Offline benchmark of the drug validators on synthetic intake data.
+         Records throughput (rows/s) and peak memory per campaign ID.
+Logic Overview:
+    1. For each campaign, start a fresh process so peak memory and the module-level
+       configuration of the validators belong to that campaign alone.
+    2. In that process, write a shared_variable.yaml into a work directory, install the
+       m_local_data_operations stand-in and seed its SQLite database with a synthetic
+       intake (and v_drug_denorm extract) from m_synthetic_drug_intake.
+    3. Import and time m_validation_drug_quality (and optionally m_validation_drug_intake);
+       an abend for the seeded errors is the expected outcome and is recorded.
+    4. Report rows/s, peak RSS and the abend per campaign; optionally save them as CSV or JSON.
+Notes:
+    - Peak RSS is the process high-water mark (getrusage), so it includes the data load;
+      setup_peak_rss_mb is the mark before validation started. With workers > 1,
+      worker_peak_rss_mb is the largest of the worker processes.
+    - Example: python m_benchmark_drug_validation.py --rows 200000 --error-rate 0.01
+"""
+
+import argparse
+import gc
+import logging
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import yaml
+
+import m_synthetic_drug_intake as msdi
+from m_dqi_run_context import DqiRunContext
+
+VALIDATORS = ('quality', 'intake')
+
+
+def _peak_rss_mb(who=resource.RUSAGE_SELF):
+    # ru_maxrss is reported in KiB on Linux
+    return resource.getrusage(who).ru_maxrss / 1024
+
+
+def _shared_variables(campaign_id, work_dir):
+    return {
+        'macro_test_flag': 'no',
+        'tdname': f"bench_{campaign_id}",
+        'c_s_tdtempx': 'tdtempx',
+        'c_s_schema': 'schema',
+        'table_out': f"tdtempx.drug_intake_bench_{campaign_id}",
+        'c_s_dqi_campaign_id': campaign_id,
+        'c_s_filedir': work_dir,
+        'dqi_storage_project': 'local',
+        'c_s_rootdir': work_dir,
+        'c_s_program': 'benchmark',
+        'c_s_proj': 'benchmark',
+        'c_s_ticket': f"bench_{campaign_id}",
+        'c_s_opioid_daily_dose_bypass': 'N',
+    }
+
+
+def _run_campaign(campaign_id, validator, rows, error_rate, seed, work_dir, options):
+    """Runs one validator for one campaign; executed in a fresh process."""
+    logging.basicConfig(level=logging.WARNING, force=True)
+    os.makedirs(work_dir, exist_ok=True)
+    os.chdir(work_dir)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    shared_variables = _shared_variables(campaign_id, work_dir)
+    with open('shared_variable.yaml', 'w') as f:
+        yaml.safe_dump(shared_variables, f)
+
+    import m_local_data_operations as mldo
+    mldo.install(os.path.join(work_dir, 'benchmark.db'))
+
+    options = dict(options)
+    local_match = options.pop('local_match', False)
+    drug_denorm_cache = os.path.join(work_dir, 'drug_denorm_cache') if local_match else ''
+    intake_df = msdi.generate_drug_intake(campaign_id, rows, error_rate, seed)
+    mldo.load_table(shared_variables['table_out'], intake_df)
+    if validator == 'intake':
+        mldo.load_table('v_drug_denorm', msdi.generate_drug_reference(intake_df, seed=seed))
+    del intake_df
+    gc.collect()
+    setup_peak_rss_mb = _peak_rss_mb()
+
+    result = {'campaign_id': campaign_id, 'validator': validator, 'rows': rows, 'error_rate': error_rate}
+    error = None
+    started = time.perf_counter()
+    try:
+        if validator == 'quality':
+            import m_validation_drug_quality as mvdq
+            mvdq.m_validation_drug_quality(context=DqiRunContext.from_shared_variables(shared_variables), **options)
+        else:
+            import m_validation_drug_intake as mvdi
+            # The synthetic v_drug_denorm is a table, so it versions its own snapshots
+            mvdi.m_validation_drug_intake(
+                shared_variables['tdname'], shared_variables['c_s_tdtempx'], shared_variables['c_s_schema'],
+                shared_variables['table_out'], campaign_id, work_dir, options.get('report_sidecars', ()),
+                drug_denorm_cache=drug_denorm_cache, drug_denorm_version_tables=['v_drug_denorm']
+            )
+    except ImportError as e:
+        error = f"skipped: {e}"
+    except Exception as e:
+        # Abends raise after recording; anything else is a benchmark failure
+        if not mldo.abend_calls:
+            error = str(e)
+    elapsed = time.perf_counter() - started
+
+    result.update({
+        'seconds': round(elapsed, 3),
+        'rows_per_second': round(rows / elapsed) if elapsed and not error else None,
+        'setup_peak_rss_mb': round(setup_peak_rss_mb, 1),
+        'peak_rss_mb': round(_peak_rss_mb(), 1),
+        'worker_peak_rss_mb': (round(_peak_rss_mb(resource.RUSAGE_CHILDREN), 1)
+                               if options.get('workers', 1) > 1 else None),
+        'abend_id': mldo.abend_calls[0][0] if mldo.abend_calls else None,
+        'error': error,
+    })
+    return result
+
+
+def run_benchmark(campaign_ids=None, rows=100000, error_rate=0.01, seed=0, validators=('quality',),
+                  work_dir=None, **options):
+    """
+    Benchmarks the validators per campaign, each campaign in its own process.
+
+    Parameters:
+        campaign_ids (iterable, optional): Campaigns to run; one per family by default.
+        rows (int): Synthetic intake rows per campaign.
+        error_rate (float): Share of rows with a seeded error.
+        seed (int): Random seed for the synthetic data.
+        validators (iterable): Any of 'quality' and 'intake'.
+        work_dir (str, optional): Directory for databases and reports; a temporary one by default.
+        **options: Keyword arguments for m_validation_drug_quality (pushdown, chunk_rows, workers,
+                   max_violations, ...); local_match=True matches the intake validator's drugs
+                   in process against a snapshot cache of the synthetic v_drug_denorm (the
+                   snapshot fetch is timed).
+
+    Returns:
+        pandas.DataFrame: One row per campaign and validator.
+    """
+    campaign_ids = list(campaign_ids or msdi.CAMPAIGN_FAMILIES.values())
+    work_dir = work_dir or tempfile.mkdtemp(prefix='drug_validation_benchmark_')
+    results = []
+    for validator in validators:
+        for campaign_id in campaign_ids:
+            campaign_dir = os.path.join(work_dir, f"{validator}_{campaign_id}")
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+                result = executor.submit(_run_campaign, campaign_id, validator, rows, error_rate, seed,
+                                         campaign_dir, options).result()
+            logging.info(f"Benchmark {validator} campaign {campaign_id}: {result}")
+            results.append(result)
+    return pd.DataFrame(results)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the drug validators on synthetic intake data.")
+    parser.add_argument('--campaigns', type=int, nargs='+', help="Campaign IDs (default: one per family).")
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--error-rate', type=float, default=0.01)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--validators', nargs='+', choices=VALIDATORS, default=['quality'])
+    parser.add_argument('--pushdown', action='store_true')
+    parser.add_argument('--chunk-rows', type=int)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--max-violations', type=int)
+    parser.add_argument('--local-match', action='store_true',
+                        help="Match intake drugs in process against a v_drug_denorm snapshot.")
+    parser.add_argument('--work-dir')
+    parser.add_argument('--output', help="Save results as .csv or .json.")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    results = run_benchmark(args.campaigns, args.rows, args.error_rate, args.seed, args.validators, args.work_dir,
+                            pushdown=args.pushdown, chunk_rows=args.chunk_rows, workers=args.workers,
+                            max_violations=args.max_violations, local_match=args.local_match)
+    print(results.to_string(index=False))
+    if args.output:
+        if args.output.endswith('.json'):
+            results.to_json(args.output, orient='records', indent=2)
+        else:
+            results.to_csv(args.output, index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+File: m_bigquery_projection.py
+Purpose: Builds projected SELECTs so intake and validity fetches only pull the
+         columns the active rules and queries need instead of SELECT *.
+Logic Overview:
+    1. fetch_table_columns() reads the column names of a table from INFORMATION_SCHEMA.
+    2. project_columns() checks the requested columns against them and fails with a clear
+       error naming any that are absent.
+    3. projected_select() renders the SELECT of those columns in table column order.
+Notes:
+    - Column names are matched case-insensitively, as BigQuery does; the table's own
+      spelling is used in the query so the DataFrame columns are unchanged.
+"""
+
+import logging
+
+import m_data_operations as mdo
+
+
+class MissingColumnsError(Exception):
+    """Raised when a projected fetch asks for columns the table does not have."""
+
+
+def fetch_table_columns(table_name):
+    """
+    Reads the column names of a BigQuery table.
+
+    Parameters:
+        table_name (str): Fully qualified table name (project.dataset.table).
+
+    Returns:
+        list: Column names in table order.
+    """
+    project, dataset, table = table_name.split('.')
+    columns_query = f"""
+    SELECT column_name
+    FROM `{project}.{dataset}.INFORMATION_SCHEMA.COLUMNS`
+    WHERE table_name = '{table}'
+    ORDER BY ordinal_position
+    """
+    return mdo.fetch_bigquery_dataframe(columns_query, f"{table}_columns")['column_name'].tolist()
+
+
+def project_columns(table_name, columns, available_columns):
+    """
+    Checks the requested columns against the table and returns them in table order.
+
+    Parameters:
+        table_name (str): Fully qualified table name, used in the error message.
+        columns (iterable): Columns to fetch.
+        available_columns (list): Columns of the table, e.g. from fetch_table_columns.
+
+    Returns:
+        list: The requested columns, spelled and ordered as in the table.
+
+    Raises:
+        MissingColumnsError: If any requested column is not in the table.
+    """
+    wanted = {col.lower() for col in columns}
+    missing = sorted(wanted - {col.lower() for col in available_columns})
+    if missing:
+        raise MissingColumnsError(f"Table {table_name} is missing required column(s): {', '.join(missing)}")
+
+    selected = [col for col in available_columns if col.lower() in wanted]
+    logging.info(f"Projecting {len(selected)} of {len(available_columns)} columns from {table_name}.")
+    return selected
+
+
+def projected_select(table_name, columns, available_columns, where=None, order_by=None):
+    """
+    Renders a SELECT of only the given columns.
+
+    Parameters:
+        table_name (str): Fully qualified table name (project.dataset.table).
+        columns (iterable): Columns to fetch.
+        available_columns (list): Columns of the table, e.g. from fetch_table_columns.
+        where (str, optional): Filter condition.
+        order_by (str, optional): ORDER BY expression.
+
+    Returns:
+        str: The query.
+
+    Raises:
+        MissingColumnsError: If any requested column is not in the table.
+    """
+    selected = project_columns(table_name, columns, available_columns)
+    query = f"SELECT {', '.join(f'`{col}`' for col in selected)} FROM `{table_name}`"
+    if where:
+        query += f" WHERE {where}"
+    if order_by:
+        query += f" ORDER BY {order_by}"
+    return query
@@ -0,0 +1,94 @@
+"""
+File: m_dqi_run_context.py
+Purpose: Immutable settings of one DQI run (campaign, parent macro, intake file type and run
+         types), resolved once and passed to the drug modules instead of each call finding its
+         caller with frame introspection and re-reading shared_variable.yaml.
+Logic Overview:
+    1. DqiRunContext.from_shared_variables() reads the campaign settings once, for the
+       parent macro the run belongs to.
+    2. The intake file type and the flags derived from the campaign and parent are computed
+       when the context is built.
+Notes:
+    - Contexts are frozen and picklable, so they can be shared with thread and process pools.
+    - m_function_drug_common_fields and m_validation_drug_quality require a context; callers
+      build it with their parent macro.
+"""
+
+from dataclasses import dataclass, field
+
+
+@dataclass(frozen=True)
+class DqiRunContext:
+    """
+    Settings of one DQI run. Derived attributes are computed on construction.
+
+    Attributes:
+        campaign_id (int): c_s_dqi_campaign_id.
+        parent (str): Upper-cased name of the parent macro.
+        clnt_spcfc_cmgpn (str): c_s_clnt_spcfc_cmgpn.
+        bob_run_type (str): c_s_bob_run_type.
+        frmly_run_type (str): c_s_frmly_run_type.
+        program_type (str): c_s_program_type.
+        run_type (str): c_s_run_type.
+        opioid_daily_dose_bypass (str): c_s_opioid_daily_dose_bypass.
+        intake_file (str): Intake file type ('2' or '8' for campaign 63, '' otherwise). Derived.
+        intake_form (bool): The parent is m_intake_form_drug. Derived.
+        balance_formulary_limits (bool): Quantity limits use the Balance Formulary logic. Derived.
+        skip_quantity_limits (bool): Quantity limits are not formatted (BOB Health Exchange
+                                     campaigns 20/558 not client specific, or Balance Formulary
+                                     client specific campaign 66). Derived.
+        rule_settings (tuple): Arguments for m_drug_quality_rules.resolve_drug_quality_rules. Derived.
+    """
+    campaign_id: int
+    parent: str = ''
+    clnt_spcfc_cmgpn: str = 'N'
+    bob_run_type: str = None
+    frmly_run_type: str = ''
+    program_type: str = ''
+    run_type: str = None
+    opioid_daily_dose_bypass: str = 'N'
+    intake_file: str = field(init=False)
+    intake_form: bool = field(init=False)
+    balance_formulary_limits: bool = field(init=False)
+    skip_quantity_limits: bool = field(init=False)
+    rule_settings: tuple = field(init=False)
+
+    def __post_init__(self):
+        # Frozen: derived attributes are set through object.__setattr__
+        set_attribute = object.__setattr__
+        set_attribute(self, 'campaign_id', int(self.campaign_id))
+        set_attribute(self, 'parent', (self.parent or '').upper())
+
+        intake_file = ''
+        if self.campaign_id == 63:
+            intake_file = '8' if self.parent == 'M_INTAKE_FORM_DRUG_FDRO_ANA' else '2'
+        set_attribute(self, 'intake_file', intake_file)
+        set_attribute(self, 'intake_form', self.parent == 'M_INTAKE_FORM_DRUG')
+        set_attribute(self, 'balance_formulary_limits', self.campaign_id in [67, 68, 554])
+        set_attribute(self, 'skip_quantity_limits',
+                      (self.campaign_id in [20, 558] and self.clnt_spcfc_cmgpn == 'N') or self.campaign_id == 66)
+        set_attribute(self, 'rule_settings', (self.campaign_id, self.parent, intake_file,
+                                              self.bob_run_type, self.opioid_daily_dose_bypass))
+
+    @classmethod
+    def from_shared_variables(cls, shared_variables, parent=''):
+        """
+        Builds the context of a run from its shared variables.
+
+        Parameters:
+            shared_variables (dict): Contents of shared_variable.yaml.
+            parent (str): Name of the parent macro.
+
+        Returns:
+            DqiRunContext: The run's context.
+        """
+        return cls(
+            campaign_id=shared_variables.get('c_s_dqi_campaign_id', 0),
+            parent=parent,
+            clnt_spcfc_cmgpn=shared_variables.get('c_s_clnt_spcfc_cmgpn', 'N'),
+            bob_run_type=shared_variables.get('c_s_bob_run_type'),
+            frmly_run_type=shared_variables.get('c_s_frmly_run_type', ''),
+            program_type=shared_variables.get('c_s_program_type', ''),
+            run_type=shared_variables.get('c_s_run_type'),
+            opioid_daily_dose_bypass=shared_variables.get('c_s_opioid_daily_dose_bypass', 'N')
+        )
@@ -23,6 +23,7 @@ import sys
 import pandas as pd
 import yaml
 import m_data_operations as mdo
+import m_query_cost_guard as mqcg
 from m_table_drop_passthrough import table_drop_passthrough
 from m_table_statistics import m_table_statistics
 
@@ -73,6 +74,7 @@ def m_dqi_vmacros():
         WHERE table_name = 'mbr_vmacros_{tdname}'
         """
         
+        mqcg.guard_query(check_table_query, "mbr_vmacros table check")
         table_exists_df = mdo.fetch_bigquery_dataframe(check_table_query, "table_exists")
         
         if not table_exists_df.empty:
@@ -83,6 +85,7 @@ def m_dqi_vmacros():
             
             # Fetch data from source table
             source_query = f"SELECT * FROM `{dqi_storage_project}.saslib.mbr_vmacros_{tdname}`"
+            mqcg.guard_query(source_query, "mbr_vmacros fetch")
             mbr_vmacros_df = mdo.fetch_bigquery_dataframe(source_query, "mbr_vmacros")
             
             # Write to temporary table
@@ -111,6 +114,7 @@ def m_dqi_vmacros():
             FROM `{dqi_storage_project}.{c_s_tdtempx}.mbr_vmacros_{tdname}`
             """
             
+            mqcg.guard_query(insert_query, f"{target_table} insert")
             mdo.execute_bigquery_query(insert_query)
             logging.info(f"Data inserted into {target_table} successfully.")
             
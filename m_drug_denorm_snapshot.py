@@ -0,0 +1,142 @@
+"""
+File: m_drug_denorm_snapshot.py
+Purpose: Versioned local snapshot cache of v_drug_denorm, so small intakes and offline runs
+         read the drug dimension from disk instead of scanning it in the warehouse per ticket.
+Logic Overview:
+    1. drug_denorm_snapshot() reads the last-modified time of the tables v_drug_denorm reads
+       from the dataset's __TABLES__ metadata (no table scan) and looks for a snapshot of
+       that version and column set in the cache directory.
+    2. A missing snapshot, or one older than the refresh age, is fetched in chunks and
+       written as an Arrow IPC file under a temporary name, then renamed into place.
+    3. DrugMatcher.from_snapshot() (m_drug_matcher) converts only the columns it needs.
+    4. evict_drug_denorm_snapshots() drops the oldest snapshots above the version and size
+       limits; the snapshot in use is always kept.
+Notes:
+    - v_drug_denorm is a view, whose last-modified time only changes with its definition, so
+      the snapshots are keyed by the version tables it reads. Unknown or missing version
+      tables raise instead of falling back to the view. The refresh age bounds staleness.
+    - Snapshots need pyarrow.
+"""
+
+import glob
+import hashlib
+import logging
+import os
+import time
+
+import m_data_operations as mdo
+from m_fetch_bigquery_chunks import fetch_bigquery_dataframe_chunks
+
+DEFAULT_MAX_AGE_HOURS = 24
+DEFAULT_MAX_VERSIONS = 3
+DEFAULT_MAX_BYTES = 10 * 1024 ** 3
+
+
+def _last_modified(drug_denorm_table, version_tables):
+    """Latest last-modified time (ms since epoch) of the version tables, all of which must exist."""
+    if not version_tables:
+        raise ValueError(f"No version tables given for the {drug_denorm_table} snapshot.")
+    dataset = drug_denorm_table.rsplit('.', 1)[0]
+    table_ids = ', '.join(f"'{table_id}'" for table_id in version_tables)
+    last_modified_df = mdo.fetch_bigquery_dataframe(
+        f"SELECT table_id, last_modified_time FROM `{dataset}.__TABLES__` WHERE table_id IN ({table_ids})",
+        "drug_denorm_version"
+    )
+    missing_tables = sorted(set(version_tables) - set(last_modified_df['table_id']))
+    if missing_tables or last_modified_df['last_modified_time'].isna().any():
+        raise ValueError(f"Version tables of the {drug_denorm_table} snapshot not found in {dataset}: "
+                         f"{', '.join(missing_tables) or 'no last-modified time'}")
+    return int(last_modified_df['last_modified_time'].max())
+
+
+def _write_snapshot(query, snapshot_path, chunk_rows):
+    """Streams a query result into an Arrow IPC file, replacing snapshot_path only when complete."""
+    import pyarrow as pa
+
+    temp_path = f"{snapshot_path}.{os.getpid()}.tmp"
+    writer, schema, rows = None, None, 0
+    try:
+        for chunk_df in fetch_bigquery_dataframe_chunks(query, chunk_rows):
+            table = pa.Table.from_pandas(chunk_df, preserve_index=False)
+            if writer is None:
+                # All-null columns of the first chunk are typed as strings so later chunks cast
+                schema = pa.schema([field.with_type(pa.string()) if pa.types.is_null(field.type) else field
+                                    for field in table.schema])
+                writer = pa.ipc.new_file(temp_path, schema)
+            writer.write_table(table.cast(schema))
+            rows += len(chunk_df)
+        if not rows:
+            raise ValueError(f"No rows returned for the drug denorm snapshot: {query}")
+        writer.close()
+        writer = None
+        os.replace(temp_path, snapshot_path)
+    finally:
+        if writer is not None:
+            writer.close()
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return rows
+
+
+def drug_denorm_snapshot(drug_denorm_table, cache_dir, columns, version_tables,
+                         max_age_hours=DEFAULT_MAX_AGE_HOURS, chunk_rows=200000):
+    """
+    Returns a current local snapshot of v_drug_denorm, fetching it when needed.
+
+    Parameters:
+        drug_denorm_table (str): project.dataset.v_drug_denorm.
+        cache_dir (str): Directory holding the snapshots.
+        columns (list): Columns to snapshot.
+        version_tables (list): Tables of the same dataset read by the drug denorm view; their
+                               latest last-modified time versions the snapshot.
+        max_age_hours (float): Snapshots fetched longer ago than this are refreshed.
+        chunk_rows (int): Rows per fetched chunk.
+
+    Returns:
+        str: Path of the Arrow IPC snapshot.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    table_name = drug_denorm_table.rsplit('.', 1)[-1]
+    last_modified = _last_modified(drug_denorm_table, version_tables)
+    columns_digest = hashlib.sha1(','.join(columns).encode()).hexdigest()[:12]
+    snapshot_path = os.path.join(cache_dir, f"{table_name}_{last_modified}_{columns_digest}.arrow")
+
+    if os.path.exists(snapshot_path) and time.time() - os.path.getmtime(snapshot_path) < max_age_hours * 3600:
+        logging.info(f"Using drug denorm snapshot {snapshot_path}.")
+    else:
+        started = time.perf_counter()
+        rows = _write_snapshot(f"SELECT {', '.join(columns)} FROM `{drug_denorm_table}`", snapshot_path, chunk_rows)
+        logging.info(f"Refreshed drug denorm snapshot {snapshot_path}: {rows} rows "
+                     f"in {time.perf_counter() - started:.1f}s.")
+    return snapshot_path
+
+
+def evict_drug_denorm_snapshots(cache_dir, keep=None, max_versions=DEFAULT_MAX_VERSIONS,
+                                max_bytes=DEFAULT_MAX_BYTES):
+    """
+    Evicts the oldest snapshots above the version and size limits.
+
+    Parameters:
+        cache_dir (str): Directory holding the snapshots.
+        keep (str, optional): Snapshot in use; never evicted.
+        max_versions (int): Maximum number of snapshots kept.
+        max_bytes (int): Maximum total size of the snapshots kept.
+    """
+    snapshots = sorted(glob.glob(os.path.join(cache_dir, '*.arrow')), key=os.path.getmtime, reverse=True)
+    if keep in snapshots:
+        snapshots.remove(keep)
+        snapshots.insert(0, keep)
+
+    # Newest first: once a limit is reached, every older snapshot goes
+    kept, kept_bytes, evicted = 0, 0, 0
+    for snapshot_path in snapshots:
+        size = os.path.getsize(snapshot_path)
+        if snapshot_path == keep or (not evicted and kept < max_versions and kept_bytes + size <= max_bytes):
+            kept += 1
+            kept_bytes += size
+        else:
+            os.remove(snapshot_path)
+            evicted += 1
+
+    if evicted:
+        logging.info(f"Evicted {evicted} drug denorm snapshot(s) from {cache_dir}.")
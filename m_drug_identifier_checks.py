@@ -0,0 +1,91 @@
+"""
+File: m_drug_identifier_checks.py
+Purpose: Column-wise format checks for the NDC9, NDC11 and GPI drug identifiers.
+         Used by the FORMAT rules of m_drug_quality_rules and reusable by intake
+         loaders that want the same checks before or after m_function_drug_common_fields.
+Logic Overview:
+    1. Each identifier column is converted to text once.
+    2. Every check (stray asterisk, dash, comma, exponent notation, length) runs as one
+       vectorized scan over that text.
+    3. identifier_failure_masks() returns one boolean DataFrame per identifier with a
+       column per check, aligned to the intake index.
+Notes:
+    - Characters are searched literally; on short identifier strings this measured
+      faster than the equivalent regular expressions.
+    - Exponent checks look for 'E' (or 'e') together with '.', i.e. numbers that were
+      turned into scientific notation (1.2345E+10) somewhere upstream.
+"""
+
+import pandas as pd
+
+# Exact lengths of the NDC identifiers and the maximum GPI length
+IDENTIFIER_LENGTHS = {'ndc9': 9, 'ndc11': 11}
+GPI_MAX_LENGTH = 14
+
+IDENTIFIER_CHECKS = {
+    'ndc9': ('asterisk', 'dash', 'comma', 'exponent_upper', 'exponent_lower', 'length'),
+    'ndc11': ('asterisk', 'dash', 'comma', 'exponent_upper', 'exponent_lower', 'length'),
+    'gpi': ('asterisk', 'leading_asterisk', 'comma', 'exponent_upper', 'exponent_lower', 'length'),
+}
+
+# Characters whose presence fails a check
+_CHECK_CHARS = {'asterisk': '*', 'dash': '-', 'comma': ','}
+# Exponent marker expected together with a decimal point
+_EXPONENT_CHARS = {'exponent_upper': 'E', 'exponent_lower': 'e'}
+
+
+def _has(text, char):
+    return text.str.contains(char, regex=False, na=False)
+
+
+def identifier_check_mask(values, text, identifier, check):
+    """
+    Runs one check over an identifier column.
+
+    Parameters:
+        values (pandas.Series): The identifier column as loaded.
+        text (pandas.Series): The same column converted with astype(str).
+        identifier (str): 'ndc9', 'ndc11' or 'gpi'.
+        check (str): One of IDENTIFIER_CHECKS[identifier].
+
+    Returns:
+        pandas.Series: True where the identifier fails the check.
+    """
+    if check in _CHECK_CHARS:
+        return _has(text, _CHECK_CHARS[check])
+    if check in _EXPONENT_CHARS:
+        mask = _has(text, _EXPONENT_CHARS[check])
+        return mask & _has(text, '.') if mask.any() else mask
+    if check == 'leading_asterisk':
+        return text.str.startswith('*')
+    if check == 'length':
+        if identifier == 'gpi':
+            return values.str.len() > GPI_MAX_LENGTH
+        # Only populated NDCs are checked
+        mask = values > ' '
+        return mask & (values.str.len() != IDENTIFIER_LENGTHS[identifier]) if mask.any() else mask
+    raise ValueError(f"Unknown {identifier} check: {check}")
+
+
+def identifier_failure_masks(df, identifiers=None):
+    """
+    Runs every check for each identifier column present in the frame.
+
+    Parameters:
+        df (pandas.DataFrame): Drug intake data.
+        identifiers (iterable, optional): Subset of 'ndc9', 'ndc11', 'gpi'; all by default.
+
+    Returns:
+        dict: identifier -> pandas.DataFrame of boolean failure masks, one column per check.
+    """
+    masks = {}
+    for identifier in identifiers or IDENTIFIER_CHECKS:
+        if identifier not in df.columns:
+            continue
+        values = df[identifier]
+        text = values.astype(str)
+        masks[identifier] = pd.DataFrame(
+            {check: identifier_check_mask(values, text, identifier, check) for check in IDENTIFIER_CHECKS[identifier]},
+            index=df.index
+        )
+    return masks
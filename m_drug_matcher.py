@@ -0,0 +1,162 @@
+"""
+File: m_drug_matcher.py
+Purpose: In-process matcher of intake drug codes against a v_drug_denorm snapshot, for offline
+         and small-intake runs where a warehouse join costs more latency than the work itself.
+Logic Overview:
+    1. DrugMatcher indexes the snapshot (drugs with a DRUG_PROD_GID) as three sorted arrays:
+       drug_id (NDC11), the first 9 characters of drug_id (NDC9) and the trimmed gpi_cd (GPI).
+    2. Intake codes resolve to a range of each sorted array with one searchsorted per bound:
+       NDC11 and NDC9 codes to the keys equal to the code, GPI codes to the keys they prefix.
+    3. NDC11 and GPI codes with LIKE wildcards ('_', '%' or a backslash escape) narrow to the
+       range of their literal prefix and filter it with the equivalent regular expression.
+    4. match() returns one row per intake row and matching drug, as the validity build's
+       matched_drug join in m_validation_drug_intake does.
+Notes:
+    - Matching follows the SQL rules of m_validation_drug_intake, BigQuery LIKE semantics
+      included: case-sensitive, with backslash escapes.
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+# Greater than any character, so key + _KEY_END bounds every key starting with key
+_KEY_END = '\U0010ffff'
+_like_token = re.compile(r"\\(.)|(%)|(_)|(.)", re.DOTALL)
+
+
+def _like_prefix_and_regex(pattern):
+    """Literal prefix of a LIKE pattern, and the pattern as a regex (None when it is a plain prefix match)."""
+    prefix, parts, literal = [], [], True
+    for escaped, percent, underscore, char in _like_token.findall(pattern):
+        if percent or underscore:
+            literal = False
+            parts.append('.*' if percent else '.')
+        else:
+            parts.append(re.escape(escaped or char))
+            if literal:
+                prefix.append(escaped or char)
+    # 'abc%' needs no regex: every key in the prefix range matches
+    plain_prefix = not literal and parts[len(prefix):] == ['.*']
+    return ''.join(prefix), literal, None if literal or plain_prefix else re.compile(''.join(parts), re.DOTALL)
+
+
+class _SortedKeys:
+    """Sorted keys of one match level, with the snapshot row of every key."""
+
+    def __init__(self, keys):
+        keys = keys.dropna()
+        order = np.argsort(keys.to_numpy(dtype=str), kind='stable')
+        self.keys = keys.to_numpy(dtype=str)[order]
+        self.rows = keys.index.to_numpy()[order]
+
+    def ranges(self, codes, prefix):
+        """Key range [lower, upper) equal to, or prefixed by when prefix is set, each code."""
+        codes = np.asarray(codes, dtype=str)
+        lower = np.searchsorted(self.keys, codes, side='left')
+        upper = (np.searchsorted(self.keys, np.char.add(codes, _KEY_END), side='left') if prefix
+                 else np.searchsorted(self.keys, codes, side='right'))
+        return lower, upper
+
+    def like(self, pattern):
+        """Snapshot rows whose key matches a LIKE pattern."""
+        prefix, literal, regex = _like_prefix_and_regex(pattern)
+        lower, upper = self.ranges([prefix], not literal)
+        candidates = slice(lower[0], upper[0])
+        if regex is None:
+            return self.rows[candidates]
+        return self.rows[candidates][[regex.fullmatch(key) is not None for key in self.keys[candidates]]]
+
+
+def _expand_ranges(lower, upper):
+    """Positions covered by each range, and the range each position came from."""
+    counts = upper - lower
+    range_ids = np.repeat(np.arange(len(counts)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return range_ids, np.repeat(lower, counts) + offsets
+
+
+class DrugMatcher:
+    """
+    Matches intake drug codes to the drugs of a v_drug_denorm snapshot.
+
+    Attributes:
+        drugs (pandas.DataFrame): Snapshot drugs with a DRUG_PROD_GID.
+    """
+
+    def __init__(self, drug_denorm_df):
+        """
+        Parameters:
+            drug_denorm_df (pandas.DataFrame): v_drug_denorm rows; drug_id, gpi_cd and DRUG_PROD_GID
+                                               plus the columns match() returns.
+        """
+        self.drugs = drug_denorm_df[drug_denorm_df['DRUG_PROD_GID'].notna()].reset_index(drop=True)
+        drug_id = self.drugs['drug_id'].where(self.drugs['drug_id'].notna(), None).astype(object)
+        gpi_cd = self.drugs['gpi_cd'].where(self.drugs['gpi_cd'].notna(), None).astype(object)
+        self._keys = {
+            'NDC11': _SortedKeys(drug_id),
+            'NDC9': _SortedKeys(drug_id.str[:9]),
+            'GPI': _SortedKeys(gpi_cd.str.strip()),
+        }
+
+    @classmethod
+    def from_snapshot(cls, snapshot_path, columns=None):
+        """
+        Builds a matcher from a snapshot of v_drug_denorm: an Arrow IPC file or Parquet.
+
+        Parameters:
+            snapshot_path (str): Path of the snapshot.
+            columns (list, optional): Snapshot columns to read (drug_id, gpi_cd, DRUG_PROD_GID and
+                                      the columns match() returns); all columns by default.
+        """
+        if snapshot_path.endswith('.parquet'):
+            return cls(pd.read_parquet(snapshot_path, columns=columns))
+        import pyarrow as pa
+        with pa.memory_map(snapshot_path) as source:
+            # Only the selected columns are copied into pandas
+            table = pa.ipc.open_file(source).read_all()
+            return cls((table.select(columns) if columns else table).to_pandas())
+
+    def match(self, intake_df, drug_columns):
+        """
+        Matches intake rows on druglvl and drug_code:
+            NDC11: drug_id LIKE drug_code
+            NDC9: SUBSTR(drug_id, 1, 9) = drug_code
+            GPI: TRIM(gpi_cd) LIKE CONCAT(TRIM(drug_code), '%')
+
+        Parameters:
+            intake_df (pandas.DataFrame): Intake rows with druglvl and drug_code.
+            drug_columns (list): Snapshot columns to return with each match.
+
+        Returns:
+            pandas.DataFrame: drug_columns followed by the intake columns, one row per intake row
+                              and matching drug, in intake order.
+        """
+        intake_df = intake_df.reset_index(drop=True)
+        codes = intake_df['drug_code'].where(intake_df['drug_code'].notna(), None).astype(object)
+        intake_rows, drug_rows = [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=np.int64)]
+        for druglvl, keys in self._keys.items():
+            level_codes = codes[(intake_df['druglvl'] == druglvl) & codes.notna()]
+            if druglvl == 'GPI':
+                level_codes = level_codes.str.strip()
+            # NDC9 is an equality match; NDC11 and GPI codes may carry LIKE wildcards
+            wildcard = (level_codes.str.contains(r'[%_\\]') if druglvl != 'NDC9'
+                        else pd.Series(False, index=level_codes.index))
+
+            plain = level_codes[~wildcard]
+            lower, upper = keys.ranges(plain.to_numpy(dtype=str), druglvl == 'GPI')
+            range_ids, positions = _expand_ranges(lower, upper)
+            intake_rows.append(plain.index.to_numpy()[range_ids])
+            drug_rows.append(keys.rows[positions])
+
+            for intake_row, code in level_codes[wildcard].items():
+                rows = keys.like(code + '%' if druglvl == 'GPI' else code)
+                intake_rows.append(np.full(len(rows), intake_row))
+                drug_rows.append(rows)
+
+        intake_rows, drug_rows = np.concatenate(intake_rows), np.concatenate(drug_rows)
+        order = np.lexsort((drug_rows, intake_rows))
+        drugs = self.drugs.iloc[drug_rows[order]][drug_columns].reset_index(drop=True)
+        intake = intake_df.iloc[intake_rows[order]].reset_index(drop=True)
+        return pd.concat([drugs, intake], axis=1)
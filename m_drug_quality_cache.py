@@ -0,0 +1,160 @@
+"""
+File: m_drug_quality_cache.py
+Purpose: Local cache of drug quality validation results keyed by row content.
+         Lets m_validation_drug_quality re-evaluate only the rows that are new or
+         changed since the intake was last validated.
+Logic Overview:
+    1. hash_drug_rows() hashes the columns the active rules read into a 128-bit digest
+       per row (two 64-bit hashes under different keys).
+    2. load_cached_messages() looks up only the digests of the rows passed in, through a
+       temporary table joined to the cache, returns the cached validation_msg for every
+       hit and marks the hits as used.
+    3. store_cached_messages() saves the messages of freshly evaluated rows.
+    4. evict_drug_quality_cache() drops entries older than the age limit and then
+       the least recently used entries above the size limit.
+Notes:
+    - The cache is a single SQLite file; entries of other rule-set versions are kept
+      until they age out, so switching campaigns back and forth stays cheap.
+    - validation_msg is stored for passing rows too (as ''), so they are skipped as well.
+    - Entries are keyed by the full 128-bit digest, so a hit is a real content match in
+      practice.
+"""
+
+import logging
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_MAX_ENTRIES = 2_000_000
+DEFAULT_MAX_AGE_DAYS = 30
+# Keys of the two row hashes making up a digest (hash_pandas_object takes 16 characters)
+_HASH_KEYS = ('drug_quality_k01', 'drug_quality_k02')
+
+
+def _connect(cache_path):
+    """Opens the cache database, creating the table on first use."""
+    conn = sqlite3.connect(cache_path)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS drug_quality_cache (
+        rules_version TEXT NOT NULL,
+        row_hash INTEGER NOT NULL,
+        row_hash_2 INTEGER NOT NULL,
+        validation_msg TEXT NOT NULL,
+        last_used REAL NOT NULL,
+        PRIMARY KEY (rules_version, row_hash, row_hash_2)
+    )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS drug_quality_cache_last_used ON drug_quality_cache (last_used)")
+    return conn
+
+
+def hash_drug_rows(df, columns):
+    """
+    Hashes the given columns of every row into a 128-bit digest.
+
+    Parameters:
+        df (pandas.DataFrame): The drug intake data.
+        columns (iterable): Columns the active rules read.
+
+    Returns:
+        numpy.ndarray: int64 array of shape (rows, 2), the two signed halves of each
+                       row's digest (SQLite INTEGER compatible).
+    """
+    columns = sorted(col for col in columns if col in df.columns)
+    # As objects, every column is hashed with the key (numeric dtypes would ignore it)
+    values = df[columns].astype(object)
+    hashes = [pd.util.hash_pandas_object(values, index=False, hash_key=key).to_numpy() for key in _HASH_KEYS]
+    return np.column_stack(hashes).view(np.int64)
+
+
+def load_cached_messages(cache_path, rules_version, row_hashes):
+    """
+    Looks up cached validation messages.
+
+    Parameters:
+        cache_path (str): Path of the SQLite cache file.
+        rules_version (str): Version of the active rule set.
+        row_hashes (numpy.ndarray): Row digests from hash_drug_rows.
+
+    Returns:
+        numpy.ndarray: Cached validation_msg per row, None where the row is not cached.
+    """
+    validation_msg = np.full(len(row_hashes), None, dtype=object)
+    conn = _connect(cache_path)
+    try:
+        # Only this frame's digests are looked up, whatever the size of the cache
+        conn.execute("CREATE TEMP TABLE lookup (position INTEGER PRIMARY KEY, row_hash INTEGER, row_hash_2 INTEGER)")
+        conn.executemany("INSERT INTO lookup VALUES (?, ?, ?)",
+                         ((position, int(h1), int(h2)) for position, (h1, h2) in enumerate(row_hashes)))
+        hits = conn.execute("""
+        SELECT lookup.position, lookup.row_hash, lookup.row_hash_2, cache.validation_msg
+        FROM lookup
+        JOIN drug_quality_cache cache
+          ON cache.rules_version = ? AND cache.row_hash = lookup.row_hash AND cache.row_hash_2 = lookup.row_hash_2
+        """, (rules_version,)).fetchall()
+        # Mark the hits as used, for the least recently used eviction
+        now = time.time()
+        conn.executemany(
+            "UPDATE drug_quality_cache SET last_used = ? WHERE rules_version = ? AND row_hash = ? AND row_hash_2 = ?",
+            ((now, rules_version, h1, h2) for position, h1, h2, msg in hits)
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+    for position, h1, h2, msg in hits:
+        validation_msg[position] = msg
+    logging.info(f"Drug quality cache hits: {len(hits)} of {len(row_hashes)} rows.")
+    return validation_msg
+
+
+def store_cached_messages(cache_path, rules_version, row_hashes, validation_msg):
+    """
+    Saves validation messages for freshly evaluated rows.
+
+    Parameters:
+        cache_path (str): Path of the SQLite cache file.
+        rules_version (str): Version of the active rule set.
+        row_hashes (numpy.ndarray): Row digests from hash_drug_rows.
+        validation_msg (iterable): validation_msg per row ('' for rows that passed).
+    """
+    now = time.time()
+    conn = _connect(cache_path)
+    try:
+        conn.executemany(
+            "INSERT OR REPLACE INTO drug_quality_cache VALUES (?, ?, ?, ?, ?)",
+            ((rules_version, int(h1), int(h2), msg, now) for (h1, h2), msg in zip(row_hashes, validation_msg))
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def evict_drug_quality_cache(cache_path, max_entries=DEFAULT_MAX_ENTRIES, max_age_days=DEFAULT_MAX_AGE_DAYS):
+    """
+    Evicts cache entries by age, then by size (least recently used first).
+
+    Parameters:
+        cache_path (str): Path of the SQLite cache file.
+        max_entries (int): Maximum number of entries kept.
+        max_age_days (float): Entries not used for this many days are dropped.
+    """
+    conn = _connect(cache_path)
+    try:
+        aged = conn.execute("DELETE FROM drug_quality_cache WHERE last_used < ?",
+                            (time.time() - max_age_days * 86400,)).rowcount
+        excess = conn.execute("SELECT COUNT(*) FROM drug_quality_cache").fetchone()[0] - max_entries
+        if excess > 0:
+            conn.execute("""
+            DELETE FROM drug_quality_cache WHERE rowid IN (
+                SELECT rowid FROM drug_quality_cache ORDER BY last_used LIMIT ?
+            )
+            """, (excess,))
+        conn.commit()
+    finally:
+        conn.close()
+
+    if aged or excess > 0:
+        logging.info(f"Drug quality cache evicted {aged} aged and {max(excess, 0)} least recently used entries.")
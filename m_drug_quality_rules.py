@@ -0,0 +1,1093 @@
+"""
+File: m_drug_quality_rules.py
+Purpose: Declarative rule registry for m_validation_drug_quality.
+         Every drug quality check is declared once, together with the campaigns,
+         parent macros and intake file types it applies to.
+Logic Overview:
+    1. Rules are declared per campaign family as (rule_id, message, predicate) entries.
+    2. resolve_drug_quality_rules() filters the registry for one run and compiles the
+       predicates into column-wise mask functions. The result is cached per run settings.
+    3. evaluate_drug_quality_rules() applies the compiled rules to an intake frame and can
+       record wall time, rows evaluated and rows failed per rule (summarize_rule_stats).
+    4. build_validation_msg() packs the rule results into one bit per rule
+       (encode_rule_bits) and decodes messages only for the failing rows (decode_rule_bits);
+       per-rule failure counts are read off the same bits (rule_failure_counts).
+    5. build_validation_msg_parallel() splits a large frame into shards and validates
+       them in a process pool, handing each shard over as an Arrow buffer in shared memory.
+    6. compile_drug_quality_sql() renders the same rules as one SELECT whose CASE WHEN terms
+       build validation_msg in the warehouse, returning only the failing rows.
+Notes:
+    - Predicates are plain tuples built with the helpers below, so the active rule set
+      can be inspected (describe_drug_quality_rules) before any data is pulled.
+    - Rule order matters: validation_msg lists messages in registry order.
+    - NDC/GPI format checks are delegated to m_drug_identifier_checks.
+"""
+
+import hashlib
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+import m_drug_identifier_checks as mdic
+
+
+# -----------------------------------------------------------------------------
+# Predicate helpers
+# -----------------------------------------------------------------------------
+def is_in(column, values, transform=None):
+    """Value (optionally upper-cased or stripped+upper-cased) is one of values."""
+    return ('in', column, tuple(values), transform)
+
+
+def not_in(column, values, transform=None):
+    """Value is not one of values; missing values fail."""
+    return ('not', is_in(column, values, transform))
+
+
+def equals(column, value, transform=None):
+    """Value equals a literal."""
+    return ('eq', column, value, transform)
+
+
+def blank(column):
+    """Value is a single blank, the SAS representation of an empty character field."""
+    return equals(column, ' ')
+
+
+def populated(column):
+    """Value sorts after a blank, i.e. SAS `column > ' '`."""
+    return ('gt', column, ' ')
+
+
+def not_populated(column):
+    """Value sorts at or before a blank, i.e. SAS `column <= ' '`."""
+    return ('le', column, ' ')
+
+
+def length_gt(column, length):
+    """Value is longer than length characters."""
+    return ('len_gt', column, length)
+
+
+def length_ne(column, length):
+    """Value is not exactly length characters long; missing values fail."""
+    return ('len_ne', column, length)
+
+
+def is_missing(column):
+    """Value is missing."""
+    return ('isna', column)
+
+
+def contains(column, text):
+    """`text in str(value)`."""
+    return ('contains', column, text)
+
+
+def char_at(column, position, char):
+    """Character at position equals char."""
+    return ('char_at', column, position, char)
+
+
+def truthy_count_gt(columns, count):
+    """More than count of the columns are populated: not missing (NULL) and truthy ('' is not)."""
+    return ('truthy_count_gt', tuple(columns), count)
+
+
+def le_length_without(column, other, char):
+    """Value is <= the length of other with every char removed."""
+    return ('le_len_without', column, other, char)
+
+
+def identifier_check(column, check):
+    """Identifier fails one of the m_drug_identifier_checks format checks."""
+    return ('identifier', column, check)
+
+
+def all_of(*predicates):
+    return ('and',) + predicates
+
+
+def any_of(*predicates):
+    return ('or',) + predicates
+
+
+def negate(predicate):
+    return ('not', predicate)
+
+
+def predicate_columns(predicate):
+    """Returns the set of intake columns a predicate reads."""
+    op = predicate[0]
+    if op in ('and', 'or'):
+        return set().union(*(predicate_columns(p) for p in predicate[1:]))
+    if op == 'not':
+        return predicate_columns(predicate[1])
+    if op == 'truthy_count_gt':
+        return set(predicate[1])
+    if op == 'le_len_without':
+        return {predicate[1], predicate[2]}
+    return {predicate[1]}
+
+
+# -----------------------------------------------------------------------------
+# Rule declarations
+# -----------------------------------------------------------------------------
+@dataclass(frozen=True)
+class RuleScope:
+    """
+    One set of run settings under which a rule is active. None means "any".
+
+    Attributes:
+        campaigns (tuple): Campaign IDs the scope applies to.
+        parents (tuple): Upper-cased parent macro names.
+        intake_file (str): Intake file type ('2' or '8', campaign 63 only).
+        bob_run_type (str): Required c_s_bob_run_type.
+        opioid_daily_dose_bypass (str): Required c_s_opioid_daily_dose_bypass.
+        exclude_campaigns (tuple): Campaign IDs the scope never applies to.
+    """
+    campaigns: tuple = None
+    parents: tuple = None
+    intake_file: str = None
+    bob_run_type: str = None
+    opioid_daily_dose_bypass: str = None
+    exclude_campaigns: tuple = ()
+
+    def matches(self, campaign_id, parent, intake_file, bob_run_type, opioid_daily_dose_bypass):
+        return ((self.campaigns is None or campaign_id in self.campaigns) and
+                campaign_id not in self.exclude_campaigns and
+                (self.parents is None or parent in self.parents) and
+                (self.intake_file is None or intake_file == self.intake_file) and
+                (self.bob_run_type is None or bob_run_type == self.bob_run_type) and
+                (self.opioid_daily_dose_bypass is None or
+                 opioid_daily_dose_bypass == self.opioid_daily_dose_bypass))
+
+
+@dataclass(frozen=True)
+class DrugQualityRule:
+    """
+    A single drug quality check.
+
+    Attributes:
+        rule_id (str): Unique, stable identifier.
+        family (str): Campaign family the rule belongs to.
+        message (str): Text added to validation_msg when the rule fails.
+        predicate (tuple): Failure condition built with the predicate helpers.
+        scopes (tuple): RuleScope entries; the rule is active if any of them matches.
+        optional (bool): Skip the rule when its column is absent from the intake.
+    """
+    rule_id: str
+    family: str
+    message: str
+    predicate: tuple
+    scopes: tuple = (RuleScope(),)
+    optional: bool = False
+
+    @property
+    def columns(self):
+        return predicate_columns(self.predicate)
+
+
+def _family(family, scopes, rules):
+    """Stamps a family name and its scopes onto (rule_id, message, predicate[, optional]) entries."""
+    return [DrugQualityRule(rule[0], family, rule[1], rule[2], tuple(scopes), *rule[3:]) for rule in rules]
+
+
+def _rxchange_rules(prefix):
+    return [(f'{prefix}_{col.lower()}', f'Invalid {col} Value', not_in(col, ['N', 'Y']))
+            for col in ['RXCHANGE_SPC', 'RXCHANGE_MAIL', 'RXCHANGE_RETAIL']]
+
+
+# Valid 1565 change types for Value Formulary
+_vf_change_types = ['FE', 'FE-TS', 'LC-CO', 'LC-ED', 'LC-FERT', 'LC-HSDD',
+                    'LC-OB', 'PA', 'QL', 'SP', 'ST', 'DNT']
+
+_rec_type_i = equals('rec_type', 'I')
+_gpi_populated = populated('gpi')
+_wildcard = equals('sql_join', 'WILDCARD')
+_hyper = any_of(populated('PTHYPERSTELLENT'), populated('MDHYPERSTELLENT'))
+_change_type_ql = any_of(equals('CHANGE_TYPE_PBM', 'QL'), equals('CHANGE_TYPE_MDDB', 'QL'))
+_not_excluded = negate(equals('alternative_text', 'EXCLUDE', 'strip_upper'))
+
+DRUG_QUALITY_RULES = tuple(
+    # Common validations for all campaigns
+    _family('COMMON', [RuleScope()], [
+        ('rec_type', 'Invalid rec type', not_in('rec_type', ['I', 'E'])),
+        ('b_g', 'Invalid B_G indicator', all_of(_rec_type_i, not_in('b_g', ['B', 'G', 'A', ''], 'upper'))),
+    ]) +
+
+    # FDRO validations
+    _family('FDRO', [
+        RuleScope(campaigns=(30, 35, 556, 45)),
+        RuleScope(campaigns=(63,), intake_file='8'),
+        RuleScope(campaigns=(79,), parents=('M_INTAKE_FORM_DRUG_FDRO_ANA',)),
+    ], [
+        ('fdro_grdfthr', 'Invalid GRDFTHR', not_in('GRDFTHR', [' ', 'N', 'Y', 'M'], 'upper')),
+        ('fdro_class', 'Invalid Class Value', not_in('class', ['OTHER', 'MSB', 'SPECIALTY', 'STRIPS/KITS'], 'upper')),
+        ('fdro_lbl_name', 'Label Name cannot be blank', blank('Lbl_Name')),
+        ('fdro_xdrug_text', 'XDrug Text cannot be blank', blank('XDRUG_TEXT')),
+        ('fdro_drugmsg', 'Drug Message cannot be blank', blank('DRUGMSG')),
+        ('fdro_gstp_alternative_text', 'GSTP Alternative Text cannot be blank', blank('GSTP_ALTERNATIVE_TEXT')),
+        ('fdro_mdxstellent', 'MDXSTELLENT cannot be blank', blank('MDXSTELLENT')),
+        ('fdro_mdpastellent', 'MDPASTELLENT cannot be blank', blank('MDPASTELLENT')),
+        ('fdro_ptxstellent', 'PTXSTELLENT cannot be blank', blank('PTXSTELLENT')),
+        ('fdro_ptpastellent', 'PTPASTELLENT cannot be blank', blank('PTPASTELLENT')),
+        ('fdro_hyper_alternative_text', 'HYPER ALTERNATIVE TEXT cannot be blank',
+         all_of(_hyper, blank('HYPER_ALTERNATIVE_TEXT'))),
+        ('fdro_hyper_gstp_alternative_text', 'HYPER GSTP ALTERNATIVE TEXT cannot be blank',
+         all_of(_hyper, blank('HYPER_GSTP_ALTERNATIVE_TEXT'))),
+        ('fdro_insulin_call', 'Invalid Insulin calls Value', not_in('INSULIN_CALL', ['N', 'Y'])),
+        ('fdro_alternative_text', 'Alternative Messaging cannot be blank', all_of(_rec_type_i, blank('alternative_text'))),
+        ('fdro_ptxaddbkstellent', 'PTXAddbkStellent cannot be blank',
+         all_of(populated('add_back_messaging'), blank('PTXAddbkStellent'))),
+        ('fdro_ptpaaddbkstellent', 'PTPAAddbkStellent cannot be blank',
+         all_of(populated('add_back_messaging'), blank('PTPAAddbkStellent'))),
+        ('fdro_pthyperaddbk', 'PTHyperAddbk cannot be blank',
+         all_of(populated('add_back_messaging_hyper'), blank('PTHyperAddbk'))),
+        ('fdro_add_back_merge_drug_hyper_ind', 'Invalid Add Back Merge Drug Hyper indicator Value',
+         not_in('add_back_merge_drug_hyper_ind', [' ', 'Y', 'N'])),
+    ] + _rxchange_rules('fdro')) +
+
+    # ACF/ACSF validations
+    _family('ACF', [
+        RuleScope(campaigns=(26, 54, 551)),
+        RuleScope(campaigns=(63,), intake_file='2'),
+        RuleScope(campaigns=(81, 96), parents=('M_INTAKE_FORM_DRUG_ACFBF_EX_BOB',)),
+        RuleScope(campaigns=(79,), parents=('M_INTAKE_FORM_DRUG_ACF',)),
+    ], [
+        ('acf_gf', 'Invalid GrandFather Flag', not_in('GF', ['Y', 'N', ' ', 'M'])),
+        ('acf_insulin_calls_length', 'Invalid Length of Insulin calls', length_gt('insulin calls', 12)),
+        ('acf_drug_name_length', 'Invalid Length of Drung Name', length_gt('DRUG NAME', 100)),
+        ('acf_pt_ltr_length', 'Invalid Length of PT_LTR', length_gt('PT_LTR', 30)),
+        ('acf_add_back_pt_ltr_length', 'Invalid Length of Add_back_PT_LTR', length_gt('Add-back PT_LTR', 30)),
+        ('acf_insert_length', 'Invalid Length of pt_Insert', length_gt('Insert', 30)),
+        ('acf_pt_ltr_retail_length', 'Invalid Length of PT_LTR_RETAIL', length_gt('PT_LTR_RETAIL', 30)),
+        ('acf_add_back_retail_length', 'Invalid Length of Add_back_Retail', length_gt('Add-back_Retail', 30)),
+        ('acf_md_ltr_length', 'Invalid Length of MD_LTR', length_gt('MD_LTR', 30)),
+        ('acf_vf_acsf_pt_ltr_length', 'Invalid Length of VF_ACSF_PT_LTR', length_gt('VF_ACSF_PT_LTR', 30)),
+        ('acf_vf_acsf_md_ltr_length', 'Invalid Length of VF_ACSF_MD_LTR', length_gt('VF-ACSF_MD_LTR', 30)),
+        ('acf_add_back_merge_field_length', 'Invalid Length of Add_Back_Merge_Field',
+         length_gt('Add-Back Merge Field', 300)),
+        ('acf_include_or_exclude_length', 'Invalid Length of Include_or_Exclude', length_gt('include or exclude', 1)),
+        ('acf_alternative_text', 'Alternative Messaging cannot be blank', all_of(_rec_type_i, blank('alternative_text'))),
+    ] + _rxchange_rules('acf')) +
+
+    # BC validations
+    _family('BC', [
+        RuleScope(campaigns=(566,)),
+        RuleScope(campaigns=(79, 81), parents=('M_INTAKE_FORM_DRUG_BC_EX_BOB',)),
+    ], [
+        ('bc_pue_flag', 'Invalid PUE Flag', not_in('PUE FLAG', ['Y', 'N', 'M'])),
+        ('bc_spclty_managed', 'Invalid Speciality Managed', not_in('SPCLTY MANAGED', ['Y', 'N'])),
+        ('bc_call_type', 'Invalid Call Type', not_in('CALL TYPE', ['E', 'S', 'N', ' '])),
+        ('bc_effective_date', 'Invalid Effective Date', is_missing('EFFECTIVE DATE')),
+        ('bc_ndc_length', 'Invalid NDC 11', length_ne('NDC', 11)),
+        ('bc_drug_label_name', 'Invalid Drug Label Name', blank('DRUG LABEL NAME')),
+        ('bc_drug_label_name_length', 'Invalid Length Drug Label Name', length_gt('DRUG LABEL NAME', 100)),
+        ('bc_drug_brand_name', 'Invalid Drug Brand Name', blank('DRUG BRAND NAME')),
+        ('bc_drug_brand_name_length', 'Invalid Length Of Drug Brand Name', length_gt('DRUG BRAND NAME', 100)),
+        ('bc_drug_abbr_name', 'Invalid Drug Abbrevation Name', blank('DRUG ABBR NAME')),
+        ('bc_drug_abbr_name_length', 'Invalid Length of Drug Abbrevation Name', length_gt('DRUG ABBR NAME', 100)),
+        ('bc_alternatives', 'Invalid Alternative Text', blank('ALTERNATIVES')),
+        ('bc_alternatives_length', 'Invalid Length of Alternative Text', length_gt('ALTERNATIVES', 300)),
+        ('bc_add_back', 'Invalid Add Back', not_in('ADD BACK', ['Y', 'N'])),
+        ('bc_add_back_language_length', 'Invalid Length of Add Back Language', length_gt('ADD BACK LANGUAGE', 300)),
+        ('bc_product_code', 'Invalid Product Code', not_in('PRODUCT CODE', ['SP-PDPD', 'FE-MNPA', 'FE-TS'])),
+        ('bc_member_letter_template_id', 'Invalid Member Letter Template Id', blank('MEMBER LETTER TEMPLATE ID')),
+        ('bc_member_letter_template_id_length', 'Invalid Length of Member Letter Template Id',
+         length_gt('MEMBER LETTER TEMPLATE ID', 30)),
+        ('bc_member_letter_insert_template_id_length', 'Invalid Length of Member Letter Insert Template Id',
+         length_gt('MEMBER LETTER INSERT TEMPLATE ID', 30)),
+        ('bc_add_back_member_letter_template_length', 'Invalid Length of Add Back Member Letter Template',
+         length_gt('ADD BACK MEMBER LETTER TEMPLATE', 30)),
+        ('bc_add_back_member_letter_insert_template_length', 'Invalid Length of Add Back Member Letter Insert Template',
+         length_gt('ADD BACK MEMBER LETTER INSERT TE', 30)),
+        ('bc_member_call_template_id_length', 'Invalid Length of Member Call Template Id',
+         length_gt('MEMBER CALL TEMPLATE ID', 30)),
+        ('bc_prescriber_letter_template_id', 'Invalid Prescriber Letter Template Id',
+         blank('PRESCRIBER LETTER TEMPLATE ID')),
+        ('bc_prescriber_letter_template_id_length', 'Invalid Length of Prescriber Letter Template Id',
+         length_gt('PRESCRIBER LETTER TEMPLATE ID', 30)),
+        ('bc_gstp_alternatives', 'GSTP ALTERNATIVE TEXT Cannot be blank', blank('GSTP ALTERNATIVES')),
+        ('bc_add_back_yes', 'Invalid Add Back Yes Message',
+         all_of(equals('ADD BACK', 'Y'),
+                any_of(blank('ADD BACK LANGUAGE'), blank('ADD BACK MEMBER LETTER TEMPLATE')))),
+        ('bc_add_back_no', 'Invalid Add Back No Message',
+         all_of(equals('ADD BACK', 'N'),
+                any_of(populated('ADD BACK LANGUAGE'), populated('ADD BACK MEMBER LETTER TEMPLATE')))),
+    ] + _rxchange_rules('bc')) +
+
+    # Tier changes validations
+    _family('TIER', [RuleScope(campaigns=(60, 553, 61, 562))], [
+        ('tier_ms_ss', 'Invalid MS_SS indicator', all_of(_rec_type_i, not_in('ms_ss', ['M', 'S', 'A', ''], 'upper'))),
+    ]) +
+    _family('MS_SS', [RuleScope(exclude_campaigns=(60, 553, 61, 562))], [
+        ('ms_ss', 'Invalid MS_SS indicator', all_of(_rec_type_i, not_in('ms_ss', ['MS', 'SS', 'A', ''], 'upper'))),
+    ]) +
+
+    # Health Exchange validations
+    _family('HE', [RuleScope(campaigns=(20, 558))], _rxchange_rules('he')) +
+
+    # GSTP validations
+    _family('GSTP', [RuleScope(campaigns=(28, 34, 557, 20, 558))], [
+        ('gstp_alternative_text', 'Alternative Messaging cannot be blank', all_of(_rec_type_i, blank('alternative_text'))),
+    ]) +
+    _family('GSTP_CHANGE_TYPE', [RuleScope(campaigns=(67, 554))], [
+        ('gstp_change_type_alternative_text', 'Alternative Messaging cannot be blank',
+         all_of(_rec_type_i, is_in('change_type', ['EX', 'ST']), blank('alternative_text'))),
+    ]) +
+
+    # Common validations for all campaigns
+    _family('COMMON', [RuleScope()], [
+        ('gpi_ndc_blank', 'GPI and NDC are blank', all_of(equals('gpi', ''), equals('ndc11', ''), equals('ndc9', ''))),
+    ]) +
+
+    # Validate only one drug identifier is populated
+    _family('INTAKE_FORM', [RuleScope(parents=('M_INTAKE_FORM_DRUG',))], [
+        ('intake_form_one_identifier', 'Only 1 of NDC11, NDC9 or GPI can be populated',
+         truthy_count_gt(['ndc11', 'ndc9', 'gpi'], 1)),
+    ]) +
+
+    # GF validations
+    _family('GF', [RuleScope(campaigns=(67, 554, 66))], [
+        ('gf_gf', 'Invalid GF', all_of(populated('gf'), not_in('gf', ['N', 'Y', 'M'], 'upper'))),
+    ] + _rxchange_rules('gf')) +
+
+    # DrugMsg_IB validations (BOB IB runs and client specific BF)
+    _family('DRUGMSG_IB', [
+        RuleScope(campaigns=(54, 81, 96, 554), bob_run_type='IB'),
+        RuleScope(campaigns=(66,)),
+    ], [
+        (f'drugmsg_ib{i}_length', f'Invalid Length of DrugMsg_IB{i}', length_gt(f'DrugMsg_IB{i}', 300), True)
+        for i in range(1, 13)
+    ]) +
+
+    # NDC and GPI format validations
+    _family('FORMAT', [RuleScope()], [
+        ('ndc9_asterisk', 'Invalid NDC9', identifier_check('ndc9', 'asterisk')),
+        ('ndc11_asterisk', 'Invalid NDC11', all_of(identifier_check('ndc11', 'asterisk'), negate(_wildcard))),
+        ('ndc9_dash', 'Invalid NDC9', identifier_check('ndc9', 'dash')),
+        ('ndc11_dash', 'Invalid NDC11', identifier_check('ndc11', 'dash')),
+        ('multiple_values', 'Multiple values separated by comma in one cell',
+         any_of(*[contains(col, ',') for col in ['ndc9', 'ndc11', 'rec_type', 'gpi', 'b_g', 'ms_ss',
+                                                 'age_min', 'age_max']])),
+        ('ndc9_length', 'Invalid NDC9 length', identifier_check('ndc9', 'length')),
+        ('ndc11_length', 'Invalid NDC11 length', all_of(identifier_check('ndc11', 'length'), negate(_wildcard))),
+        ('gpi_len', 'Invalid GPI length', all_of(_gpi_populated, not_in('gpi_len', [2, 4, 6, 8, 10, 12, 14]))),
+        ('gpi_length', 'Invalid GPI length', all_of(_gpi_populated, identifier_check('gpi', 'length'))),
+        # 'ast' is only read for GPIs that still carry an asterisk
+        ('gpi_asterisk_position', 'Invalid GPI',
+         all_of(_gpi_populated, contains('gpi', '*'), le_length_without('ast', 'gpi', '*'))),
+        ('gpi_leading_asterisk', 'Invalid GPI', all_of(_gpi_populated, identifier_check('gpi', 'leading_asterisk'))),
+        ('gpi_b_g', 'B_G must be specified with GPI', all_of(_gpi_populated, not_in('b_g', ['B', 'G', 'A']))),
+        ('gpi_ms_ss', 'MS_SS must be specified with GPI', all_of(_gpi_populated, not_in('ms_ss', ['SS', 'MS', 'A']))),
+    ] + [
+        (f'{col}_exponent_{case}', message, identifier_check(col, f'exponent_{case}'))
+        for case in ['upper', 'lower']
+        for col, message in [('ndc9', 'Invalid NDC9'), ('ndc11', 'Invalid NDC11'), ('gpi', 'Invalid GPI')]
+    ]) +
+
+    # Quantity limit validations
+    _family('INTAKE_FORM', [RuleScope(parents=('M_INTAKE_FORM_DRUG',))], [
+        (f'{field}_exceeds', f"{field.replace('_', ' ')} exceeds 200 char",
+         all_of(negate(equals('_exceedlmt', '000000')), char_at('_exceedlmt', i, '1')))
+        for i, field in enumerate(['retail_qty_limit', 'retail_qty_unit', 'retail_qty_time',
+                                   'mail_qty_limit', 'mail_qty_unit', 'mail_qty_time'])
+    ] + [
+        ('exceed_rlimit', 'Combined retail quantity limit fields exceeds 200 char', equals('_exceed_rlimit', 1)),
+        ('exceed_mlimit', 'Combined mail quantity limit fields exceeds 200 char', equals('_exceed_mlimit', 1)),
+    ]) +
+
+    # Value Formulary validations
+    _family('VF', [
+        RuleScope(campaigns=(23, 89, 567)),
+        RuleScope(campaigns=(96,), parents=('M_INTAKE_FORM_DRUG_VF_EX_BOB',)),
+    ], [
+        ('vf_pue_flag', 'Invalid PUE FLAG', not_in('PUE_FLAG', ['Y', 'M', 'N'])),
+        ('vf_specialty_managed_product', 'Invalid SPECIALTY MANAGED PRODUCT',
+         not_in('SPECIALTY_MANAGED_PRODUCT', ['Y', 'N'])),
+        ('vf_call_type', 'Invalid Call Type', not_in('CALL_TYPE', ['I', 'N', 'S', ' '])),
+        ('vf_eff_date', 'Invalid EFF DATE', is_missing('EFF_DATE')),
+        ('vf_drug_label_name_length', 'DRUG LABLE NAME exceeds 100 chars', length_gt('DRUG LABEL NAME', 100)),
+        ('vf_drug_label_name', 'DRUG LABEL NAME cannot be blank', blank('DRUG LABEL NAME')),
+        ('vf_drug_brand_name_length', 'DRUG BRAND NAME exceeds 50 chars', length_gt('DRUG BRAND NAME', 50)),
+        ('vf_drug_brand_name', 'DRUG BRAND NAME cannot be blank', blank('DRUG BRAND NAME')),
+        ('vf_drug_abbr_name_length', 'DRUG ABBR NAME exceeds 50 chars', length_gt('DRUG ABBR NAME', 50)),
+        ('vf_drug_abbr_name', 'DRUG ABBR NAME cannot be blank', blank('DRUG ABBR NAME')),
+        ('vf_pbm_alternative', 'PBM ALTERNATIVE cannot be blank',
+         all_of(not_in('CHANGE_TYPE_PBM', ['PA', 'QL', 'DNT']), blank('PBM_ALTERNATIVE'))),
+        ('vf_mddb_alternative', 'MDB ALTERNATIVE cannot be blank',
+         all_of(not_in('CHANGE_TYPE_MDDB', ['PA', 'QL', 'DNT']), blank('MDDB_ALTERNATIVE'))),
+        ('vf_pbm_add_back_template', 'PBM ADD BACK TEMPLATE must be populated for add back',
+         all_of(populated('PBM_ADD_BACK_PRODUCT'), blank('PBM_ADD_BACK_TEMPLATE'))),
+        ('vf_pbm_add_back_product', 'PBM ADD BACK PRODUCT must be populated for add back',
+         all_of(blank('PBM_ADD_BACK_PRODUCT'), populated('PBM_ADD_BACK_TEMPLATE'))),
+        ('vf_mddb_add_back_template', 'MDB ADD BACK TEMPLATE must be populated for add back',
+         all_of(populated('MDDB_ADD_BACK_PRODUCT'), blank('MDDB_ADD_BACK_TEMPLATE'))),
+        ('vf_mddb_add_back_product', 'MDB ADD BACK PRODUCT must be populated for add back',
+         all_of(blank('MDDB_ADD_BACK_PRODUCT'), populated('MDDB_ADD_BACK_TEMPLATE'))),
+        ('vf_pbm_mony_code', 'Invalid PBM MONY CODE', not_in('PBM_MONY_CODE', ['M', 'O', 'N', 'Y'])),
+        ('vf_mddb_mony_code', 'Invalid MDDB MONY CODE', not_in('MDDB_MONY_CODE', ['M', 'O', 'N', 'Y'])),
+        ('vf_formulary_description_pbm', '1565 FORMULARY DESCRIPTION - PBM cannot be blank',
+         blank('FORMULARY_DESCRIPTION_PBM')),
+        ('vf_change_type_pbm', 'Invalid 1565 CHANGE TYPE - PBM', not_in('CHANGE_TYPE_PBM', _vf_change_types)),
+        ('vf_formulary_group_pbm', 'Invalid FORMULARY GROUP - PBM', not_in('FORMULARY_GROUP_PBM', ['F', 'NF'])),
+        ('vf_formulary_description_mddb', '1565 FORMULARY DESCRIPTION - MDDB cannot be blank',
+         blank('FORMULARY_DESCRIPTION_MDDB')),
+        ('vf_change_type_mddb', 'Invalid 1565 CHANGE TYPE - MDDB', not_in('CHANGE_TYPE_MDDB', _vf_change_types)),
+        ('vf_formulary_group_mddb', 'Invalid FORMULARY GROUP - MDDB', not_in('FORMULARY_GROUP_MDDB', ['F', 'NF'])),
+        ('vf_ql_retail_qty_limit', 'RETAIL QUANTITY LIMIT - QTY must be populated for QL',
+         all_of(_change_type_ql, is_missing('retail_qty_Limit'))),
+        ('vf_ql_retail_qty_time', 'RETAIL QUANTITY LIMIT - DAYS must be populated for QL',
+         all_of(_change_type_ql, is_missing('retail_qty_time'))),
+        ('vf_ql_retail_qty_unit', 'RETAIL QUANTITY LIMIT - UNITS must be populated for QL',
+         all_of(_change_type_ql, blank('retail_qty_unit'))),
+        ('vf_ql_mail_qty_limit', 'MAIL QUANTITY LIMIT - QTY must be populated for QL',
+         all_of(_change_type_ql, is_missing('mail_qty_limit'))),
+        ('vf_ql_mail_qty_time', 'MAIL QUANTITY LIMIT - DAYS must be populated for QL',
+         all_of(_change_type_ql, is_missing('mail_qty_time'))),
+        ('vf_ql_mail_qty_unit', 'MAIL QUANTITY LIMIT - UNITS must be populated for QL',
+         all_of(_change_type_ql, blank('mail_qty_unit'))),
+        ('vf_call_template_missing', 'CALL TEMPLATE must be populated for Call Types',
+         all_of(is_in('CALL_TYPE', ['I', 'S']), is_in('CALL_TEMPLATE', ['NA', ' ']))),
+        ('vf_call_template_unexpected', 'Call type invalid for populated CALL TEMPLATE',
+         all_of(is_in('CALL_TYPE', ['N', ' ']), not_in('CALL_TEMPLATE', ['NA', ' ']))),
+        ('vf_mbr_letter_pbm', 'MBR LETTER - PBM cannot be blank', blank('MBR_LETTER_PBM')),
+        ('vf_mbr_letter_insert_pbm', 'MBR LETTER INSERT - PBM cannot be blank', blank('MBR_LETTER_INSERT_PBM')),
+        ('vf_mbr_letter_pa_pbm', 'MBR LETTER PA - PBM cannot be blank', blank('MBR_LETTER_PA_PBM')),
+        ('vf_mbr_letter_be_pbm', 'MBR LETTER BE - PBM cannot be blank', blank('MBR_LETTER_BE_PBM')),
+        ('vf_prescriber_letter_pbm', 'PRESCRIBER LETTER - PBM cannot be blank', blank('PRESCRIBER_LETTER_PBM')),
+        ('vf_mbr_letter_mddb', 'MBR LETTER - PBM cannot be blank', blank('MBR_LETTER_MDDB')),
+        ('vf_mbr_letter_insert_mddb', 'MBR LETTER INSERT - MDDB cannot be blank', blank('MBR_LETTER_INSERT_MDDB')),
+        ('vf_mbr_letter_pa_mddb', 'MBR LETTER PA - MDDB cannot be blank', blank('MBR_LETTER_PA_MDDB')),
+        ('vf_mbr_letter_be_mddb', 'MBR LETTER BE - MDDB cannot be blank', blank('MBR_LETTER_BE_MDDB')),
+        ('vf_prescriber_letter_mddb', 'PRESCRIBER LETTER - MDDB cannot be blank', blank('PRESCRIBER_LETTER_MDDB')),
+        ('vf_mbr_letters_na', 'All Member letter templates cannot be NA',
+         all_of(*[equals(col, 'NA') for col in ['MBR_LETTER_PBM', 'MBR_LETTER_PA_PBM', 'MBR_LETTER_BE_PBM',
+                                                'MBR_LETTER_MDDB', 'MBR_LETTER_PA_MDDB', 'MBR_LETTER_BE_MDDB']])),
+        ('vf_prescriber_letters_na', 'All Prescriber letter templates cannot be NA',
+         all_of(equals('PRESCRIBER_LETTER_PBM', 'NA'), equals('PRESCRIBER_LETTER_MDDB', 'NA'))),
+    ] + _rxchange_rules('vf')) +
+
+    # Opioids validations
+    _family('OPIOIDS', [RuleScope(campaigns=(52, 53, 563), opioid_daily_dose_bypass='N')], [
+        ('opioid_daily_dose_limit', 'Invalid Daily Dose Limit',
+         all_of(_not_excluded, is_missing('opioid_daily_dose_limit'))),
+        ('opioid_daily_dose_text', 'Missing Daily Dose Text',
+         all_of(_not_excluded, not_populated('opioid_daily_dose_text'))),
+    ])
+)
+
+
+# -----------------------------------------------------------------------------
+# Compilation and evaluation
+# -----------------------------------------------------------------------------
+# Part of every rules version; bump it when the evaluation of a predicate changes
+_EVALUATION_REVISION = 2
+
+
+def _present_and_truthy(series):
+    """Truth value of each cell, with missing values (None, NaN, NA) as False, as SQL treats NULL."""
+    present = series.notna()
+    return present & series.astype(object).where(present, False).astype(bool)
+
+
+def _transformed(series, transform):
+    if transform == 'upper':
+        return series.str.upper()
+    if transform == 'strip_upper':
+        return series.str.strip().str.upper()
+    return series
+
+
+class _RuleFrame:
+    """Intake frame as seen by compiled predicates; the text form of a column is built once."""
+
+    def __init__(self, df):
+        self.df = df
+        self._text = {}
+
+    def __getitem__(self, key):
+        return self.df[key]
+
+    def text(self, column):
+        if column not in self._text:
+            self._text[column] = self.df[column].astype(str)
+        return self._text[column]
+
+
+def _compile_predicate(predicate):
+    """Turns a predicate tuple into a function returning a boolean mask for a frame."""
+    op = predicate[0]
+    if op == 'and':
+        parts = [_compile_predicate(p) for p in predicate[1:]]
+
+        def evaluate(df):
+            mask = parts[0](df)
+            for part in parts[1:]:
+                # Later terms are skipped once nothing can fail, like Python's `and`
+                if not mask.any():
+                    break
+                mask = mask & part(df)
+            return mask
+        return evaluate
+    if op == 'or':
+        parts = [_compile_predicate(p) for p in predicate[1:]]
+
+        def evaluate(df):
+            mask = parts[0](df)
+            for part in parts[1:]:
+                mask = mask | part(df)
+            return mask
+        return evaluate
+    if op == 'not':
+        part = _compile_predicate(predicate[1])
+        return lambda df: ~part(df)
+    if op == 'in':
+        _, column, values, transform = predicate
+        return lambda df: _transformed(df[column], transform).isin(values)
+    if op == 'eq':
+        _, column, value, transform = predicate
+        return lambda df: _transformed(df[column], transform) == value
+    if op == 'gt':
+        _, column, value = predicate
+        return lambda df: df[column] > value
+    if op == 'le':
+        _, column, value = predicate
+        return lambda df: df[column] <= value
+    if op == 'len_gt':
+        _, column, length = predicate
+        return lambda df: df[column].str.len() > length
+    if op == 'len_ne':
+        _, column, length = predicate
+        return lambda df: df[column].str.len() != length
+    if op == 'isna':
+        column = predicate[1]
+        return lambda df: df[column].isna()
+    if op == 'contains':
+        _, column, text = predicate
+        return lambda df: df.text(column).str.contains(text, regex=False, na=False)
+    if op == 'char_at':
+        _, column, position, char = predicate
+        return lambda df: df[column].str[position] == char
+    if op == 'truthy_count_gt':
+        _, columns, count = predicate
+        return lambda df: sum(_present_and_truthy(df[column]).astype(int) for column in columns) > count
+    if op == 'le_len_without':
+        _, column, other, char = predicate
+        return lambda df: df[column] <= df[other].str.replace(char, '', regex=False).str.len()
+    if op == 'identifier':
+        _, column, check = predicate
+        return lambda df: mdic.identifier_check_mask(df[column], df.text(column), column, check)
+    raise ValueError(f"Unknown drug quality predicate: {op}")
+
+
+@dataclass(frozen=True)
+class CompiledRule:
+    """A resolved rule together with its compiled mask function."""
+    rule: DrugQualityRule
+    evaluate: object
+
+
+@lru_cache(maxsize=None)
+def resolve_drug_quality_rules(campaign_id, parent, intake_file='', bob_run_type=None,
+                               opioid_daily_dose_bypass='N'):
+    """
+    Resolves the registry into the flat, compiled rule list for one run.
+
+    Parameters:
+        campaign_id (int): c_s_dqi_campaign_id.
+        parent (str): Name of the calling macro.
+        intake_file (str): Intake file type ('2', '8' or '').
+        bob_run_type (str): c_s_bob_run_type.
+        opioid_daily_dose_bypass (str): c_s_opioid_daily_dose_bypass.
+
+    Returns:
+        tuple: CompiledRule entries in reporting order.
+    """
+    parent = parent.upper()
+    rules = tuple(
+        CompiledRule(rule, _compile_predicate(rule.predicate))
+        for rule in DRUG_QUALITY_RULES
+        if any(scope.matches(campaign_id, parent, intake_file, bob_run_type, opioid_daily_dose_bypass)
+               for scope in rule.scopes)
+    )
+    logging.info(f"Resolved {len(rules)} drug quality rules for campaign {campaign_id}, parent '{parent}'.")
+    return rules
+
+
+def describe_drug_quality_rules(rules):
+    """
+    Lists the active rule set, e.g. for logging before the intake is fetched.
+
+    Parameters:
+        rules (tuple): CompiledRule entries from resolve_drug_quality_rules.
+
+    Returns:
+        pandas.DataFrame: One row per rule with rule_id, family, message and columns.
+    """
+    return pd.DataFrame([
+        {
+            'rule_id': compiled.rule.rule_id,
+            'family': compiled.rule.family,
+            'message': compiled.rule.message,
+            'columns': ', '.join(sorted(compiled.rule.columns)),
+        }
+        for compiled in rules
+    ], columns=['rule_id', 'family', 'message', 'columns'])
+
+
+def applicable_rules(rules, columns):
+    """Drops optional rules whose columns are not among the available intake columns."""
+    columns = set(columns)
+    return tuple(compiled for compiled in rules
+                 if not compiled.rule.optional or compiled.rule.columns.issubset(columns))
+
+
+def drug_quality_rule_columns(rules):
+    """Sorted intake columns read by the given rules, e.g. to project the intake fetch."""
+    return sorted(set().union(*(compiled.rule.columns for compiled in rules)))
+
+
+def drug_quality_rules_version(rules):
+    """
+    Fingerprints a resolved rule set so cached validation results can be tied to it.
+
+    Any change to a rule's id, message or predicate, to which rules are active, or to
+    _EVALUATION_REVISION yields a different version.
+    """
+    digest = hashlib.sha1(f"revision {_EVALUATION_REVISION}".encode('utf-8'))
+    for compiled in rules:
+        rule = compiled.rule
+        digest.update(repr((rule.rule_id, rule.message, rule.predicate)).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def evaluate_drug_quality_rules(df, rules, rule_stats=None, max_violations=None):
+    """
+    Evaluates the compiled rules column-wise over an intake frame.
+
+    Parameters:
+        df (pandas.DataFrame): The drug intake data.
+        rules (tuple): CompiledRule entries from resolve_drug_quality_rules.
+        rule_stats (dict, optional): When given, per-rule wall time, rows evaluated and
+                                     rows failed are accumulated into it.
+        max_violations (int, optional): Stop evaluating further rules once this many rows
+                                        have failed; the remaining rules are not reported.
+
+    Returns:
+        list: (DrugQualityRule, boolean mask) pairs in reporting order.
+    """
+    rule_masks = []
+    failed_rows = np.zeros(len(df), dtype=bool) if max_violations else None
+    rule_frame = _RuleFrame(df)
+    for compiled in applicable_rules(rules, df.columns):
+        if rule_stats is None:
+            mask = compiled.evaluate(rule_frame)
+        else:
+            started = time.perf_counter()
+            mask = compiled.evaluate(rule_frame)
+            _record_rule_stats(rule_stats, compiled.rule, time.perf_counter() - started, len(df), int(mask.sum()))
+        rule_masks.append((compiled.rule, mask))
+
+        if failed_rows is not None:
+            failed_rows |= mask.to_numpy(dtype=bool, na_value=False)
+            if failed_rows.sum() >= max_violations:
+                logging.warning(f"Violation budget of {max_violations} rows reached at rule "
+                                f"{compiled.rule.rule_id}; remaining rules were not evaluated.")
+                break
+    return rule_masks
+
+
+def _record_rule_stats(rule_stats, rule, wall_time, rows_evaluated, rows_failed):
+    entry = rule_stats.setdefault(rule.rule_id, {
+        'family': rule.family,
+        'wall_time': 0.0,
+        'rows_evaluated': 0,
+        'rows_failed': 0,
+    })
+    entry['wall_time'] += wall_time
+    entry['rows_evaluated'] += rows_evaluated
+    entry['rows_failed'] += rows_failed
+
+
+def merge_rule_stats(rule_stats, other):
+    """Adds the counters of other (e.g. from a worker or a chunk) into rule_stats."""
+    for rule_id, entry in other.items():
+        target = rule_stats.setdefault(rule_id, {
+            'family': entry['family'],
+            'wall_time': 0.0,
+            'rows_evaluated': 0,
+            'rows_failed': 0,
+        })
+        target['wall_time'] += entry['wall_time']
+        target['rows_evaluated'] += entry['rows_evaluated']
+        target['rows_failed'] += entry['rows_failed']
+    return rule_stats
+
+
+def summarize_rule_stats(rule_stats):
+    """
+    Builds the JSON-serialisable instrumentation summary for a run.
+
+    Parameters:
+        rule_stats (dict): Counters collected by evaluate_drug_quality_rules.
+
+    Returns:
+        dict: 'rules' (slowest first) and 'families' totals, each with wall_time (seconds),
+              rows_evaluated and rows_failed.
+    """
+    families = {}
+    for entry in rule_stats.values():
+        family = families.setdefault(entry['family'], {'wall_time': 0.0, 'rows_evaluated': 0, 'rows_failed': 0})
+        family['wall_time'] += entry['wall_time']
+        family['rows_evaluated'] += entry['rows_evaluated']
+        family['rows_failed'] += entry['rows_failed']
+    rules = [dict(rule_id=rule_id, **entry) for rule_id, entry in rule_stats.items()]
+    rules.sort(key=lambda entry: entry['wall_time'], reverse=True)
+    return {
+        'total_wall_time': sum(entry['wall_time'] for entry in rule_stats.values()),
+        'rules': rules,
+        'families': families,
+    }
+
+
+def encode_rule_bits(n_rows, rule_masks):
+    """
+    Packs rule results into one bit per rule: bit i of a row is set when the row failed
+    the i-th rule, stored as bit i % 64 of word i // 64.
+
+    Parameters:
+        n_rows (int): Number of rows in the validated frame.
+        rule_masks (list): (DrugQualityRule, boolean mask) pairs.
+
+    Returns:
+        numpy.ndarray: uint64 array of shape (n_rows, words).
+    """
+    bits = np.zeros((n_rows, max(1, -(-len(rule_masks) // 64))), dtype=np.uint64)
+    for position, (rule, mask) in enumerate(rule_masks):
+        failed = mask.to_numpy(dtype=bool, na_value=False)
+        bits[:, position // 64] |= failed.astype(np.uint64) << np.uint64(position % 64)
+    return bits
+
+
+def _rule_bit(bits, position):
+    """Boolean column for the rule at the given bit position."""
+    return ((bits[:, position // 64] >> np.uint64(position % 64)) & np.uint64(1)).astype(bool)
+
+
+def decode_rule_bits(bits, rules):
+    """
+    Decodes packed rule results into validation messages.
+
+    Messages are built once per distinct combination of failed rules, so callers should
+    pass only the failing rows.
+
+    Parameters:
+        bits (numpy.ndarray): Packed results from encode_rule_bits.
+        rules (list): DrugQualityRule entries in bit order.
+
+    Returns:
+        numpy.ndarray: validation_msg per row ('' where no bit is set).
+    """
+    if not len(bits):
+        return np.empty(0, dtype=object)
+    patterns, inverse = np.unique(bits, axis=0, return_inverse=True)
+    messages = np.full(len(patterns), '', dtype=object)
+    for position, rule in enumerate(rules):
+        failed = _rule_bit(patterns, position)
+        if failed.any():
+            messages[failed] = messages[failed] + f'; {rule.message}'
+    messages = np.array([message[2:] for message in messages], dtype=object)
+    return messages[inverse.reshape(-1)]
+
+
+def rule_failure_counts(bits, rules):
+    """
+    Counts the failing rows per rule from packed results.
+
+    Parameters:
+        bits (numpy.ndarray): Packed results from encode_rule_bits.
+        rules (list): DrugQualityRule entries in bit order.
+
+    Returns:
+        dict: rule_id -> number of rows that failed it.
+    """
+    return {rule.rule_id: int(_rule_bit(bits, position).sum()) for position, rule in enumerate(rules)}
+
+
+def _add_failure_counts(failure_counts, bits, rules):
+    """Adds the per-rule failure counts of packed results to a running total."""
+    for rule_id, count in rule_failure_counts(bits, rules).items():
+        if count:
+            failure_counts[rule_id] = failure_counts.get(rule_id, 0) + count
+
+
+def build_validation_msg(index, rule_masks, failure_counts=None):
+    """
+    Joins the messages of every failed rule per row with '; ', in rule order.
+
+    Parameters:
+        index (pandas.Index): Index of the validated frame.
+        rule_masks (list): (DrugQualityRule, boolean mask) pairs.
+        failure_counts (dict, optional): rule_id -> failing rows, accumulated across calls.
+
+    Returns:
+        pandas.Series: validation_msg per row ('' for rows that passed).
+    """
+    bits = encode_rule_bits(len(index), rule_masks)
+    if failure_counts is not None:
+        _add_failure_counts(failure_counts, bits, [rule for rule, mask in rule_masks])
+    failed = bits.any(axis=1)
+    validation_msg = np.full(len(index), '', dtype=object)
+    validation_msg[failed] = decode_rule_bits(bits[failed], [rule for rule, mask in rule_masks])
+    return pd.Series(validation_msg, index=index, dtype=object)
+
+
+def _validate_arrow_shard(buf, size, rule_settings, collect_stats, max_violations):
+    """Validates an Arrow IPC stream; every view into buf is released on return."""
+    import pyarrow as pa
+
+    shard_df = pa.ipc.open_stream(pa.py_buffer(buf[:size])).read_pandas()
+    rules = resolve_drug_quality_rules(*rule_settings)
+    rule_stats = {} if collect_stats else None
+    rule_masks = evaluate_drug_quality_rules(shard_df, rules, rule_stats, max_violations)
+    bits = encode_rule_bits(len(shard_df), rule_masks)
+    failed = np.flatnonzero(bits.any(axis=1))
+    return failed, bits[failed], rule_stats
+
+
+def _validate_shard(shm_name, size, rule_settings, collect_stats=False, max_violations=None):
+    """
+    Process pool worker: validates one Arrow-encoded shard held in shared memory.
+
+    Returns:
+        tuple: (positions of failing rows within the shard, their packed rule bits,
+                rule stats or None).
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        return _validate_arrow_shard(shm.buf, size, rule_settings, collect_stats, max_violations)
+    finally:
+        shm.close()
+
+
+def build_validation_msg_parallel(df, rule_settings, workers, rule_stats=None, max_violations=None,
+                                  failure_counts=None):
+    """
+    Builds validation_msg for a frame by validating shards in a process pool.
+
+    Shards are written as Arrow IPC streams into shared memory rather than pickled, and
+    workers return only the packed rule bits of their failing rows. Results are merged in
+    original row order and decoded once.
+
+    Parameters:
+        df (pandas.DataFrame): The drug intake data.
+        rule_settings (tuple): Arguments for resolve_drug_quality_rules; each worker resolves
+                               and compiles the rules itself.
+        workers (int): Number of worker processes.
+        rule_stats (dict, optional): Per-rule counters to accumulate the workers' stats into.
+        max_violations (int, optional): Violation budget, split evenly across the shards.
+        failure_counts (dict, optional): rule_id -> failing rows, accumulated across calls.
+
+    Returns:
+        pandas.Series: validation_msg per row ('' for rows that passed).
+    """
+    workers = min(workers, len(df))
+    try:
+        import pyarrow as pa
+    except ImportError:
+        pa = None
+    if workers <= 1 or pa is None:
+        if pa is None:
+            logging.warning("pyarrow is not installed; validating drug quality in a single process.")
+        rules = resolve_drug_quality_rules(*rule_settings)
+        return build_validation_msg(df.index, evaluate_drug_quality_rules(df, rules, rule_stats, max_violations),
+                                    failure_counts)
+
+    rules = [compiled.rule for compiled in applicable_rules(resolve_drug_quality_rules(*rule_settings), df.columns)]
+    bits = np.zeros((len(df), max(1, -(-len(rules) // 64))), dtype=np.uint64)
+    bounds = np.linspace(0, len(df), workers + 1).astype(int)
+    shard_budget = -(-max_violations // workers) if max_violations else None
+    segments = []
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = []
+            for start, stop in zip(bounds[:-1], bounds[1:]):
+                table = pa.Table.from_pandas(df.iloc[start:stop], preserve_index=False)
+                sink = pa.BufferOutputStream()
+                with pa.ipc.new_stream(sink, table.schema) as writer:
+                    writer.write_table(table)
+                buffer = sink.getvalue()
+                shm = shared_memory.SharedMemory(create=True, size=max(buffer.size, 1))
+                segments.append(shm)
+                shm.buf[:buffer.size] = memoryview(buffer).cast('B')
+                futures.append((start, pool.submit(_validate_shard, shm.name, buffer.size, rule_settings,
+                                                   rule_stats is not None, shard_budget)))
+
+            for start, future in futures:
+                failed, shard_bits, shard_stats = future.result()
+                # A shard stopped by the violation budget may carry fewer words
+                bits[start + failed, :shard_bits.shape[1]] = shard_bits
+                if rule_stats is not None:
+                    merge_rule_stats(rule_stats, shard_stats)
+    finally:
+        for shm in segments:
+            shm.close()
+            shm.unlink()
+
+    logging.info(f"Validated {len(df)} rows in {workers} worker processes.")
+    if failure_counts is not None:
+        _add_failure_counts(failure_counts, bits, rules)
+    failed = bits.any(axis=1)
+    validation_msg = np.full(len(df), '', dtype=object)
+    validation_msg[failed] = decode_rule_bits(bits[failed], rules)
+    return pd.Series(validation_msg, index=df.index, dtype=object)
+
+# -----------------------------------------------------------------------------
+# SQL pushdown
+# -----------------------------------------------------------------------------
+# Identifier quoting and string type per SQL dialect. bigquery is the production
+# target; duckdb and sqlite let the generated SQL run against a local stand-in.
+_sql_dialects = {
+    'bigquery': {'quote': '`', 'string_type': 'STRING'},
+    'duckdb': {'quote': '"', 'string_type': 'VARCHAR'},
+    'sqlite': {'quote': '"', 'string_type': 'TEXT'},
+}
+
+
+def _sql_literal(value, dialect):
+    if isinstance(value, str):
+        if dialect == 'bigquery':
+            return "'" + value.replace('\\', '\\\\').replace("'", "\\'") + "'"
+        return "'" + value.replace("'", "''") + "'"
+    return str(value)
+
+
+def _identifier_sql_equivalent(column, check):
+    """Spells an identifier check with the basic predicates for SQL rendering."""
+    if check in ('asterisk', 'dash', 'comma'):
+        return contains(column, {'asterisk': '*', 'dash': '-', 'comma': ','}[check])
+    if check in ('exponent_upper', 'exponent_lower'):
+        return all_of(contains(column, 'E' if check == 'exponent_upper' else 'e'), contains(column, '.'))
+    if check == 'leading_asterisk':
+        return char_at(column, 0, '*')
+    if check == 'length':
+        if column == 'gpi':
+            return length_gt(column, mdic.GPI_MAX_LENGTH)
+        return all_of(populated(column), length_ne(column, mdic.IDENTIFIER_LENGTHS[column]))
+    raise ValueError(f"Unknown {column} check: {check}")
+
+
+def _sql_predicate(predicate, dialect):
+    """
+    Renders a predicate tuple as a SQL boolean expression that is never NULL.
+
+    NULL handling follows the pandas evaluation: comparisons against a missing value
+    do not fail the rule, except for not_in and length_ne where a missing value fails.
+    """
+    settings = _sql_dialects[dialect]
+    op = predicate[0]
+
+    def col(name):
+        return f"{settings['quote']}{name}{settings['quote']}"
+
+    def transformed(name, transform):
+        if transform == 'upper':
+            return f"UPPER({col(name)})"
+        if transform == 'strip_upper':
+            return f"UPPER(TRIM({col(name)}))"
+        return col(name)
+
+    if op in ('and', 'or'):
+        joiner = f" {op.upper()} "
+        return '(' + joiner.join(_sql_predicate(p, dialect) for p in predicate[1:]) + ')'
+    if op == 'not':
+        return f"NOT {_sql_predicate(predicate[1], dialect)}"
+    if op == 'in':
+        _, name, values, transform = predicate
+        values_sql = ', '.join(_sql_literal(v, dialect) for v in values)
+        return f"COALESCE({transformed(name, transform)} IN ({values_sql}), FALSE)"
+    if op == 'eq':
+        _, name, value, transform = predicate
+        return f"COALESCE({transformed(name, transform)} = {_sql_literal(value, dialect)}, FALSE)"
+    if op == 'gt':
+        _, name, value = predicate
+        return f"COALESCE({col(name)} > {_sql_literal(value, dialect)}, FALSE)"
+    if op == 'le':
+        _, name, value = predicate
+        return f"COALESCE({col(name)} <= {_sql_literal(value, dialect)}, FALSE)"
+    if op == 'len_gt':
+        _, name, length = predicate
+        return f"COALESCE(LENGTH({col(name)}) > {length}, FALSE)"
+    if op == 'len_ne':
+        _, name, length = predicate
+        return f"COALESCE(LENGTH({col(name)}) <> {length}, TRUE)"
+    if op == 'isna':
+        return f"({col(predicate[1])} IS NULL)"
+    if op == 'contains':
+        _, name, text = predicate
+        return (f"COALESCE(INSTR(CAST({col(name)} AS {settings['string_type']}), "
+                f"{_sql_literal(text, dialect)}) > 0, FALSE)")
+    if op == 'char_at':
+        _, name, position, char = predicate
+        return f"COALESCE(SUBSTR({col(name)}, {position + 1}, 1) = {_sql_literal(char, dialect)}, FALSE)"
+    if op == 'truthy_count_gt':
+        _, names, count = predicate
+        terms = ' + '.join(f"(CASE WHEN COALESCE({col(name)}, '') <> '' THEN 1 ELSE 0 END)" for name in names)
+        return f"({terms} > {count})"
+    if op == 'le_len_without':
+        _, name, other, char = predicate
+        return (f"COALESCE({col(name)} <= LENGTH(REPLACE({col(other)}, {_sql_literal(char, dialect)}, '')), "
+                f"FALSE)")
+    if op == 'identifier':
+        return _sql_predicate(_identifier_sql_equivalent(predicate[1], predicate[2]), dialect)
+    raise ValueError(f"Unknown drug quality predicate: {op}")
+
+
+def compile_drug_quality_sql(rules, table_name, available_columns, dialect='bigquery', limit=None,
+                             output_columns=None):
+    """
+    Compiles the active rules into one query returning only the failing intake rows.
+
+    Parameters:
+        rules (tuple): CompiledRule entries from resolve_drug_quality_rules.
+        table_name (str): Fully qualified intake table.
+        available_columns (iterable): Columns of the intake table, used to drop optional rules.
+        dialect (str): 'bigquery' (default), 'duckdb' or 'sqlite'.
+        limit (int, optional): Return at most this many failing rows.
+        output_columns (iterable, optional): Intake columns to return; all of them by default.
+
+    Returns:
+        str: SELECT of the intake columns plus validation_msg, filtered to failing rows.
+    """
+    if dialect not in _sql_dialects:
+        raise ValueError(f"Unsupported SQL dialect: {dialect}")
+    quote = _sql_dialects[dialect]['quote']
+    terms = [
+        f"CASE WHEN {_sql_predicate(compiled.rule.predicate, dialect)} "
+        f"THEN {_sql_literal('; ' + compiled.rule.message, dialect)} ELSE '' END"
+        for compiled in applicable_rules(rules, available_columns)
+    ]
+    validation_msg = "SUBSTR(" + ("\n            || ".join(terms) if terms else "''") + ", 3)"
+    if output_columns is None:
+        select_list = "drug_in.*"
+    else:
+        select_list = ", ".join(f"drug_in.{quote}{col}{quote}" for col in output_columns)
+    return f"""
+    SELECT *
+    FROM (
+        SELECT
+            {select_list},
+            {validation_msg} AS validation_msg
+        FROM {quote}{table_name}{quote} drug_in
+    ) drug_validation
+    WHERE validation_msg <> ''
+    {f"LIMIT {int(limit)}" if limit else ""}
+    """
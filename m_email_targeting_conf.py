@@ -23,6 +23,7 @@ import pandas as pd
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import m_data_operations as mdo
+import m_query_cost_guard as mqcg
 import datetime
 
 # Load shared_variable.yaml
@@ -97,6 +98,7 @@ def m_email_targeting_conf():
                 FROM `{dqi_storage_project}.{c_s_aprimo_schema}.v_prjct_dtl`
                 WHERE prjct_id = '{c_s_ticket}'
                 """
+                mqcg.guard_query(title_query, "Aprimo project title")
                 title_df = mdo.fetch_bigquery_dataframe(title_query, "title_df")
                 if not title_df.empty:
                     title_nm = title_df['title_nm'].iloc[0]
@@ -110,6 +112,7 @@ def m_email_targeting_conf():
                 FROM `{dqi_storage_project}.{c_s_aprimo_schema}.v_prjct_dtl`
                 WHERE prjct_id = '{c_s_ticket}'
                 """
+                mqcg.guard_query(prod_id_query, "Aprimo product ID")
                 prod_id_df = mdo.fetch_bigquery_dataframe(prod_id_query, "aprimoprodid")
                 if not prod_id_df.empty:
                     aprimoprodid = prod_id_df['prod_id'].iloc[0].strip()
@@ -122,6 +125,7 @@ def m_email_targeting_conf():
                 FROM `{dqi_storage_project}.{c_s_aprimo_schema}.v_prjct_dtl`
                 WHERE prjct_id = '{c_s_ticket}'
                 """
+                mqcg.guard_query(subprod_id_query, "Aprimo subproduct ID")
                 subprod_id_df = mdo.fetch_bigquery_dataframe(subprod_id_query, "aprimosubprodid")
                 if not subprod_id_df.empty:
                     aprimosubprodid = subprod_id_df['prod_subcat_id'].iloc[0].strip()
@@ -149,6 +153,7 @@ def m_email_targeting_conf():
         FROM `{dqi_storage_project}.{c_s_tdtempx}.dqi_campaigns`
         WHERE dqi_campaign_id = {c_s_dqi_campaign_id}
         """
+        mqcg.guard_query(campaign_query, "Campaign info")
         campaign_df = mdo.fetch_bigquery_dataframe(campaign_query, "campaign_info")
         
         if not campaign_df.empty:
@@ -216,6 +221,7 @@ def m_email_targeting_conf():
                 """
             
             if drug_count_query:
+                mqcg.guard_query(drug_count_query, "Drug count")
                 drug_count_df = mdo.fetch_bigquery_dataframe(drug_count_query, "drug_count")
                 if not drug_count_df.empty:
                     drug_count = drug_count_df['drug_count'].iloc[0]
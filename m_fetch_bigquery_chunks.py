@@ -0,0 +1,100 @@
+"""
+File: m_fetch_bigquery_chunks.py
+Purpose: Streams BigQuery query results as a sequence of pandas DataFrames.
+         Used where a full result set does not need to be held in memory at once.
+Logic Overview:
+    1. Submit the query with the BigQuery client.
+    2. Page through the result with a fixed page size.
+    3. Yield each page as a DataFrame.
+Notes:
+    - This code uses global variables loaded from a YAML file.
+    - Each yielded DataFrame has its own 0-based index.
+    - dry_run_bigquery_query() returns a statement's estimated bytes processed without running it.
+"""
+
+import yaml
+import logging
+import os
+from google.cloud import bigquery
+
+# Load shared variables from YAML file
+with open('shared_variable.yaml', 'r') as f:
+    shared_variables = yaml.safe_load(f)
+
+# Configure logging
+macro_test_flag = shared_variables.get('macro_test_flag', 'no')
+script_name = os.path.splitext(os.path.basename(__file__))[0]
+developer = "Makkena"
+
+if macro_test_flag.lower() == "yes":
+    log_filename = f"{script_name}_{developer}.logs"
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.StreamHandler(),  # Log to console
+            logging.FileHandler(log_filename)  # Log to file
+        ]
+    )
+else:
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.StreamHandler()  # Log to console only
+        ]
+    )
+
+
+def fetch_bigquery_dataframe_chunks(query, chunk_rows=50000, project_id=None):
+    """
+    Executes a BigQuery query and yields the results in pages of DataFrames.
+
+    Parameters:
+        query (str): The SQL query to execute.
+        chunk_rows (int): Maximum number of rows per yielded DataFrame.
+        project_id (str, optional): Google Cloud project ID.
+
+    Yields:
+        pandas.DataFrame: One page of the query results.
+    """
+    try:
+        # Use project_id from shared variables if not provided
+        if not project_id:
+            project_id = shared_variables.get('project_id')
+
+        client = bigquery.Client(project=project_id)
+
+        logging.info(f"Executing BigQuery query in chunks of {chunk_rows} rows: {query[:100]}...")
+        results = client.query(query).result(page_size=chunk_rows)
+
+        total_rows = 0
+        for chunk_df in results.to_dataframe_iterable():
+            total_rows += len(chunk_df)
+            logging.info(f"Fetched chunk of {len(chunk_df)} rows ({total_rows} so far).")
+            yield chunk_df
+
+        logging.info(f"Chunked query completed. Returned {total_rows} rows.")
+
+    except Exception as e:
+        logging.error(f"Error executing chunked BigQuery query: {e}")
+        raise
+
+
+def dry_run_bigquery_query(query, project_id=None):
+    """
+    Dry-runs a BigQuery statement; nothing is read or billed.
+
+    Parameters:
+        query (str): The SQL statement.
+        project_id (str, optional): Google Cloud project ID.
+
+    Returns:
+        int: Estimated bytes processed.
+    """
+    if not project_id:
+        project_id = shared_variables.get('project_id')
+
+    client = bigquery.Client(project=project_id)
+    job_config = bigquery.QueryJobConfig(dry_run=True, use_query_cache=False)
+    return client.query(query, job_config=job_config).total_bytes_processed
@@ -12,13 +12,17 @@ Logic Overview:
 Notes:
     - This code uses global variables loaded from a YAML file.
     - The function is designed to be called from other modules that process drug data.
+    - Callers pass the run's DqiRunContext (m_dqi_run_context), built with their parent macro;
+      the functions raise ValueError without one.
 """
 
 import yaml
 import logging
 import os
-import inspect
+import numpy as np
+import pandas as pd
 import m_data_operations as mdo
+from m_dqi_run_context import DqiRunContext
 from google.cloud import bigquery
 
 # Load shared variables from YAML file
@@ -92,22 +96,24 @@ def fetch_bigquery_dataframe(query, table_name=None, project_id=None):
 # Add the function to the mdo module
 mdo.fetch_bigquery_dataframe = fetch_bigquery_dataframe
 
-def m_function_drug_common_fields(row):
+def _require_context(context, function_name):
+    """Raises when a caller did not pass its DqiRunContext; the parent macro selects the logic."""
+    if context is None:
+        raise ValueError(f"{function_name} needs the run's DqiRunContext, built with the caller's parent macro: "
+                         "DqiRunContext.from_shared_variables(shared_variables, parent).")
+
+def m_function_drug_common_fields(row, context=None):
     """
     Processes drug-related fields with common logic.
     
     Parameters:
         row (dict or pandas.Series): A row of drug data with fields to process.
+        context (DqiRunContext): Settings of the run, with the caller's parent macro.
         
     Returns:
         dict or pandas.Series: The processed row with updated fields.
     """
-    # Get the caller's name (parent function)
-    parent = inspect.currentframe().f_back.f_code.co_name.upper()
-    
-    # Get campaign ID from shared variables
-    c_s_dqi_campaign_id = int(shared_variables.get('c_s_dqi_campaign_id', 0))
-    c_s_clnt_spcfc_cmgpn = shared_variables.get('c_s_clnt_spcfc_cmgpn', 'N')
+    _require_context(context, 'm_function_drug_common_fields')
     
     # Process age range defaults
     if not row.get('age_min') or pd.isna(row['age_min']):
@@ -127,7 +133,7 @@ def m_function_drug_common_fields(row):
             drug_sub = row['gpi'].strip()
         
         # Set b_g and ms_ss if not in m_intake_form_drug
-        if parent != "M_INTAKE_FORM_DRUG":
+        if not context.intake_form:
             if not row.get('b_g') or not row['b_g'].strip():
                 row['b_g'] = 'A'
             if not row.get('ms_ss') or not row['ms_ss'].strip():
@@ -173,7 +179,7 @@ def m_function_drug_common_fields(row):
     row['drugcat'] = row.get('drug_category', '').strip()
     
     # Process retail and mail quantity limits based on campaign ID
-    if c_s_dqi_campaign_id in [67, 68, 554]:
+    if context.balance_formulary_limits:
         # Balance Formulary has its own limit logic
         if row.get('retail_qty_limit') or row.get('retail_qty_unit') or row.get('retail_qty_time'):
             row['rlimit'] = str(row.get('retail_qty_limit', '')).strip()
@@ -185,7 +191,7 @@ def m_function_drug_common_fields(row):
         else:
             row['mlimit'] = ' '
     
-    elif parent == "M_INTAKE_FORM_DRUG":
+    elif context.intake_form:
         # Intake form processing
         if row.get('retail_qty_limit') or row.get('retail_qty_unit') or row.get('retail_qty_time'):
             _rlimit = f"{str(row.get('retail_qty_limit', '')).strip()} {str(row.get('retail_qty_unit', '')).strip()}/{str(row.get('retail_qty_time', '')).strip()} days"
@@ -213,7 +219,7 @@ def m_function_drug_common_fields(row):
             row['mlimit'] = ' '
     
     # BOB Health Exchange doesn't need this logic or BF client specific
-    elif not ((c_s_dqi_campaign_id in [20, 558] and c_s_clnt_spcfc_cmgpn == 'N') or c_s_dqi_campaign_id == 66):
+    elif not context.skip_quantity_limits:
         if row.get('retail_qty_limit') or row.get('retail_qty_unit') or row.get('retail_qty_time'):
             row['rlimit'] = f"{str(row.get('retail_qty_limit', '')).strip()} {str(row.get('retail_qty_unit', '')).strip()}/{str(row.get('retail_qty_time', '')).strip()} days"
         else:
@@ -233,19 +239,136 @@ def m_function_drug_common_fields(row):
     return row
 
 # Example usage in a DataFrame context
-import pandas as pd
+def _truthy(df, column):
+    """Truth value of each cell, as the scalar function's `if row.get(column)` tests (absent: False)."""
+    if column not in df.columns:
+        return pd.Series(False, index=df.index)
+    return df[column].astype(object).astype(bool)
+
 
-def apply_drug_common_fields(df):
+def _text(df, column):
+    """Column as strings; '' where the value is missing (None or NaN) or the column is absent."""
+    if column not in df.columns:
+        return pd.Series('', index=df.index, dtype=object)
+    return df[column].where(df[column].notna(), '').astype(str)
+
+
+def _quantity_limit(df, prefix):
     """
-    Apply the drug common fields function to each row in a DataFrame.
-    
+    Quantity limit fields of the retail or mail benefit.
+
+    Returns:
+        tuple: (rows with any limit field set, stripped limit, '<limit> <unit>/<time> days')
+    """
+    fields = [f"{prefix}_qty_limit", f"{prefix}_qty_unit", f"{prefix}_qty_time"]
+    any_set = _truthy(df, fields[0]) | _truthy(df, fields[1]) | _truthy(df, fields[2])
+    # str() of each value, as the scalar function formats them ('nan' for NaN, 'None' for None)
+    limit, unit, time = (df[field].astype(object).map(str).str.strip() if field in df.columns
+                         else pd.Series('', index=df.index, dtype=object) for field in fields)
+    return any_set, limit, limit + ' ' + unit + '/' + time + ' days'
+
+
+def _clean_limit(limit):
+    """Blanks limits that start with './' (limit and unit both empty)."""
+    stripped = limit.str.strip()
+    return limit.mask((stripped != '') & stripped.str.startswith('./'), ' ')
+
+
+def _set_where(df, column, mask, values):
+    """Sets column to values where mask holds; an absent column is only added when a row is set."""
+    if column in df.columns:
+        df[column] = df[column].mask(mask, values)
+    elif mask.any():
+        df[column] = pd.Series(values, index=df.index).where(mask)
+
+
+def apply_drug_common_fields(df, context=None):
+    """
+    Apply the drug common fields logic to every row of a DataFrame, column by column.
+
+    Row-for-row compatible with df.apply(m_function_drug_common_fields, axis=1); missing
+    values (None or NaN) in the identifier and category columns are treated as blank.
+
     Parameters:
         df (pandas.DataFrame): DataFrame containing drug data.
-        
+        context (DqiRunContext): Settings of the run, with the caller's parent macro; an intake
+                                 form context selects the intake form logic.
+
     Returns:
         pandas.DataFrame: Processed DataFrame with updated fields.
     """
-    return df.apply(m_function_drug_common_fields, axis=1)
+    _require_context(context, 'apply_drug_common_fields')
+    df = df.copy()
+    intake_form = context.intake_form
+
+    # Process age range defaults
+    for column, default in (('age_min', 0), ('age_max', 999)):
+        if column in df.columns:
+            df[column] = df[column].where(_truthy(df, column) & df[column].notna(), default)
+        else:
+            df[column] = default
+
+    # Process GPI fields; the '*' position is taken before stripping, as in the scalar function
+    gpi = _text(df, 'gpi')
+    gpi_stripped = gpi.str.strip()
+    has_gpi = gpi_stripped != ''
+    ast = gpi.str.find('*')
+    cut = has_gpi & (ast > 0)
+    df['gpi_len'] = np.where(cut, ast - 1, np.where(has_gpi, gpi_stripped.str.len(), 0))
+    drug_sub = pd.Series([code[:position - 1] if position > 0 else code
+                          for code, position in zip(gpi_stripped, ast)], index=df.index, dtype=object)
+    drug_sub = drug_sub.where(has_gpi, '')
+
+    # Set b_g and ms_ss, except for GPI rows of m_intake_form_drug
+    defaults = ~has_gpi if intake_form else pd.Series(True, index=df.index)
+    for column in ('b_g', 'ms_ss'):
+        _set_where(df, column, defaults & (_text(df, column).str.strip() == ''), 'A')
+
+    df['drug_sub'] = drug_sub
+
+    # Convert wildcards to BigQuery syntax
+    for column in ('ndc11', 'gpi'):
+        if column in df.columns:
+            present = _truthy(df, column) & df[column].notna()
+            df.loc[present, column] = (df.loc[present, column].astype(str)
+                                       .str.replace('?', '_', regex=False).str.replace('*', '%', regex=False))
+
+    # Determine drug level and code
+    ndc11, ndc9, gpi = _text(df, 'ndc11'), _text(df, 'ndc9'), _text(df, 'gpi')
+    is_ndc11 = ndc11.str.strip() != ''
+    is_ndc9 = ~is_ndc11 & (ndc9.str.strip() != '')
+    is_gpi = ~is_ndc11 & ~is_ndc9 & has_gpi
+    _set_where(df, 'druglvl', is_ndc11 | is_ndc9 | is_gpi,
+               np.select([is_ndc11, is_ndc9], ['NDC11', 'NDC9'], 'GPI'))
+    _set_where(df, 'drug_code', is_ndc11 | is_ndc9 | is_gpi, ndc11.where(is_ndc11, ndc9.where(is_ndc9, drug_sub)))
+
+    # Set SQL join type for wildcard conditions
+    druglvl = df['druglvl'] if 'druglvl' in df.columns else pd.Series(None, index=df.index, dtype=object)
+    wildcard = ((ndc11.str.contains('[_%]') & (druglvl == 'NDC11'))
+                | (gpi.str.contains('[_%]') & (druglvl == 'GPI')))
+    df['sql_join'] = np.where(wildcard, 'WILDCARD', '')
+
+    # Initialize limit flags
+    df['_exceed_rlimit'] = 0
+    df['_exceed_mlimit'] = 0
+    df['drugcat'] = _text(df, 'drug_category').str.strip()
+
+    # Process retail and mail quantity limits based on campaign ID
+    for prefix, column, exceed_column in (('retail', 'rlimit', '_exceed_rlimit'), ('mail', 'mlimit', '_exceed_mlimit')):
+        any_set, limit, formatted = _quantity_limit(df, prefix)
+        if context.balance_formulary_limits:
+            # Balance Formulary has its own limit logic
+            df[column] = limit.where(any_set, ' ')
+        elif intake_form:
+            # Intake form limits are cut at 200 characters and flagged
+            formatted = formatted.where(any_set, ' ')
+            df[exceed_column] = (formatted.str.len() > 200).astype(int)
+            df[column] = _clean_limit(formatted.str[:200])
+        # BOB Health Exchange doesn't need this logic or BF client specific
+        elif not context.skip_quantity_limits:
+            df[column] = _clean_limit(formatted.where(any_set, ' '))
+
+    return df
 
 if __name__ == "__main__":
     # Example usage
@@ -272,7 +395,7 @@ if __name__ == "__main__":
         drug_series = pd.Series(sample_drug)
         
         # Process the drug record
-        processed_drug = m_function_drug_common_fields(drug_series)
+        processed_drug = m_function_drug_common_fields(drug_series, DqiRunContext.from_shared_variables(shared_variables))
         
         # Print the processed record
         for key, value in processed_drug.items():
@@ -0,0 +1,202 @@
+"""
+File: m_local_data_operations.py
+Purpose: Local SQLite stand-in for m_data_operations, m_fetch_bigquery_chunks and
+         m_abend_handler, so the drug validators can run offline (benchmarks, dry runs).
+Logic Overview:
+    1. configure() points the stand-in at a SQLite database file; load_table() seeds it.
+    2. BigQuery SQL issued by the validators is translated to SQLite: `project.dataset.table`
+       names keep only the table, INFORMATION_SCHEMA column lookups read PRAGMA table_info,
+       and CONCAT, STRING casts, UNION DISTINCT, UNNEST of literal arrays, CTEs (materialized)
+       and backslash escapes in string literals are mapped.
+    3. load_table() records each table's last-modified time in a __TABLES__ table, as
+       BigQuery's dataset metadata does.
+    4. dry_run_bigquery_query() reports synthetic byte counts: DRY_RUN_BYTES_PER_CELL for
+       every cell of every table a statement names.
+    5. install() registers this module under the production module names so validator
+       imports pick it up; abends are recorded in abend_calls instead of emailing, and GCS
+       uploads in gcs_uploads instead of being sent.
+Notes:
+    - Only the SQL the drug validators generate is covered, not BigQuery SQL in general.
+    - install() must run before the validator modules are imported.
+"""
+
+import logging
+import re
+import sqlite3
+import sys
+import time
+
+import pandas as pd
+
+_db_path = None
+# Synthetic bytes per cell reported by dry runs
+DRY_RUN_BYTES_PER_CELL = 8
+# (abend_message_id, abend_report) for every abend raised while installed
+abend_calls = []
+# (gcs_dir, file_name, file_type, rows) for every DataFrame uploaded to GCS while installed,
+# (gcs_dir, file_name, 'file', local path) for every file
+gcs_uploads = []
+
+_information_schema = re.compile(
+    r"FROM\s+`[^`]+\.INFORMATION_SCHEMA\.COLUMNS`\s+WHERE\s+table_name\s*=\s*'(\w+)'", re.IGNORECASE
+)
+_quoted_name = re.compile(r"`([^`]*)`")
+_string_literal = re.compile(r"'((?:[^'\\]|\\.)*)'")
+_unnest_array = re.compile(r"UNNEST\(\[([\d,\s]+)\]\)\s+AS\s+(\w+)", re.IGNORECASE)
+
+
+def configure(db_path):
+    """
+    Sets the SQLite database the stand-in reads and writes.
+
+    Parameters:
+        db_path (str): Path of the SQLite database file.
+    """
+    global _db_path
+    _db_path = db_path
+    abend_calls.clear()
+    gcs_uploads.clear()
+
+
+def install(db_path):
+    """
+    Configures the stand-in and registers it as m_data_operations, m_fetch_bigquery_chunks
+    and m_abend_handler.
+
+    Parameters:
+        db_path (str): Path of the SQLite database file.
+    """
+    configure(db_path)
+    module = sys.modules[__name__]
+    for name in ('m_data_operations', 'm_fetch_bigquery_chunks', 'm_abend_handler'):
+        sys.modules[name] = module
+    logging.info(f"Local data operations installed on {db_path}.")
+
+
+def _connect():
+    if _db_path is None:
+        raise RuntimeError("m_local_data_operations is not configured; call configure() first.")
+    conn = sqlite3.connect(_db_path)
+    conn.create_function('CONCAT', -1, lambda *parts: None if None in parts else ''.join(map(str, parts)))
+    return conn
+
+
+def translate_query(query):
+    """
+    Translates a validator's BigQuery SQL to SQLite.
+
+    Parameters:
+        query (str): BigQuery SQL.
+
+    Returns:
+        str: The SQLite equivalent.
+    """
+    query = _information_schema.sub(r"FROM pragma_table_info('\1') WHERE 1 = 1", query)
+    query = re.sub(r"\bORDER BY ordinal_position\b", "ORDER BY cid", query)
+    query = query.replace("column_name", "name AS column_name") if "pragma_table_info" in query else query
+    query = _quoted_name.sub(lambda match: f'"{match.group(1).split(".")[-1]}"', query)
+    query = re.sub(r"\bAS STRING\)", "AS TEXT)", query)
+    query = re.sub(r"\bUNION DISTINCT\b", "UNION", query)
+    # BigQuery evaluates a CTE once; SQLite may otherwise re-run it per joined row
+    query = re.sub(r"\bWITH\s+(\w+)\s+AS\s*\(", r"WITH \1 AS MATERIALIZED (", query, flags=re.IGNORECASE)
+    query = _unnest_array.sub(
+        lambda match: "(" + " UNION ALL ".join(f"SELECT {value.strip()} AS {match.group(2)}"
+                                               for value in match.group(1).split(",")) + ")",
+        query
+    )
+    # Backslash escapes in string literals become SQLite quoting
+    return _string_literal.sub(
+        lambda match: "'" + re.sub(r"\\(.)", r"\1", match.group(1)).replace("'", "''") + "'", query
+    )
+
+
+def load_table(table_name, df):
+    """
+    Creates (or replaces) a table from a DataFrame.
+
+    Parameters:
+        table_name (str): Table name; a project.dataset prefix is ignored.
+        df (pandas.DataFrame): Table contents.
+    """
+    conn = _connect()
+    try:
+        df.to_sql(table_name.split('.')[-1], conn, if_exists='replace', index=False)
+        conn.execute('CREATE TABLE IF NOT EXISTS "__TABLES__" (table_id TEXT PRIMARY KEY, last_modified_time INTEGER)')
+        conn.execute('INSERT OR REPLACE INTO "__TABLES__" VALUES (?, ?)',
+                     (table_name.split('.')[-1], int(time.time() * 1000)))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def fetch_bigquery_dataframe(query, df_name=None):
+    """Runs a query and returns the result as a DataFrame."""
+    conn = _connect()
+    try:
+        df = pd.read_sql_query(translate_query(query), conn)
+    finally:
+        conn.close()
+    logging.info(f"Fetched {len(df)} rows{f' into {df_name}' if df_name else ''}.")
+    return df
+
+
+def fetch_bigquery_dataframe_chunks(query, chunk_rows=50000, project_id=None):
+    """Runs a query and yields the result in DataFrames of at most chunk_rows rows."""
+    conn = _connect()
+    try:
+        yield from pd.read_sql_query(translate_query(query), conn, chunksize=chunk_rows)
+    finally:
+        conn.close()
+
+
+def dry_run_bigquery_query(query, project_id=None):
+    """Estimates bytes processed as the cells of every existing table the statement names."""
+    conn = _connect()
+    try:
+        estimated = 0
+        for table_name in {name.split('.')[-1] for name in _quoted_name.findall(query)}:
+            columns = conn.execute("SELECT COUNT(*) FROM pragma_table_info(?)", (table_name,)).fetchone()[0]
+            if columns:
+                rows = conn.execute(f'SELECT COUNT(*) FROM "{table_name}"').fetchone()[0]
+                estimated += rows * columns * DRY_RUN_BYTES_PER_CELL
+    finally:
+        conn.close()
+    return estimated
+
+
+def execute_bigquery_query(query):
+    """Runs a statement that returns no rows."""
+    conn = _connect()
+    try:
+        conn.execute(translate_query(query))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def write_df_to_bigquery(df, table_name):
+    """Writes a DataFrame to a table, replacing it; a dataset prefix is ignored."""
+    load_table(table_name, df)
+
+
+def write_df_to_gcs(df, file_type, gcs_dir, file_name):
+    """Records a GCS upload instead of sending it."""
+    gcs_uploads.append((gcs_dir, file_name, file_type, len(df)))
+    logging.info(f"GCS upload of {len(df)} rows recorded for {gcs_dir}/{file_name}.")
+
+
+def upload_file_to_gcs(file_path, gcs_dir, file_name):
+    """Records a GCS file upload instead of sending it."""
+    gcs_uploads.append((gcs_dir, file_name, 'file', file_path))
+    logging.info(f"GCS upload of {file_path} recorded for {gcs_dir}/{file_name}.")
+
+
+def table_drop_passthrough(table_name):
+    """Drops a table if it exists; a dataset prefix is ignored."""
+    execute_bigquery_query(f'DROP TABLE IF EXISTS "{table_name.split(".")[-1]}"')
+
+
+def m_abend_handler(abend_report, abend_message="N", abend_message_id=0):
+    """Records an abend instead of sending the failure email."""
+    abend_calls.append((abend_message_id, abend_report))
+    logging.info(f"Abend {abend_message_id} recorded for {abend_report}.")
@@ -0,0 +1,111 @@
+"""
+File: m_query_cost_guard.py
+Purpose: Dry-runs generated SQL before it is submitted, so a statement that would scan far
+         more than expected is flagged (or rejected) instead of being paid for blind.
+Logic Overview:
+    1. guard_query() dry-runs a statement (dry_run_bigquery_query in m_fetch_bigquery_chunks)
+       to get its estimated bytes processed; no data is read and nothing is billed.
+    2. The estimate is logged next to the step it belongs to and added to the run's total.
+    3. A statement above the per-query limit, or one that takes the run total past its
+       budget, is logged as a warning ('flag') or raises QueryCostExceeded ('reject').
+Notes:
+    - Limits come from shared_variable.yaml: c_s_query_max_bytes and c_s_query_budget_bytes
+      (0 or missing: no limit) and c_s_query_cost_action ('flag' by default, or 'reject').
+    - One guard, and so one running total, per process (per job).
+    - The local stand-in (m_local_data_operations) reports synthetic byte counts.
+"""
+
+import logging
+
+import yaml
+
+from m_fetch_bigquery_chunks import dry_run_bigquery_query
+
+# Load shared variables from YAML file
+with open('shared_variable.yaml', 'r') as f:
+    shared_variables = yaml.safe_load(f)
+
+QUERY_COST_ACTIONS = ('flag', 'reject')
+
+
+class QueryCostExceeded(Exception):
+    """Raised for a statement whose estimate is over the per-query limit or the run budget."""
+
+
+def _format_bytes(n_bytes):
+    for unit in ('B', 'KiB', 'MiB', 'GiB', 'TiB'):
+        if n_bytes < 1024 or unit == 'TiB':
+            return f"{n_bytes:.0f} {unit}" if unit == 'B' else f"{n_bytes:.1f} {unit}"
+        n_bytes /= 1024
+
+
+class QueryCostGuard:
+    """
+    Tracks the estimated bytes processed by a run's statements against its limits.
+
+    Attributes:
+        total_bytes (int): Estimated bytes of the statements let through so far.
+        estimates (list): (step, estimated bytes) of every statement checked.
+    """
+
+    def __init__(self, max_query_bytes=0, budget_bytes=0, action='flag'):
+        """
+        Parameters:
+            max_query_bytes (int): Per-statement limit; 0 for none.
+            budget_bytes (int): Limit on the run's total; 0 for none.
+            action (str): 'flag' to log statements over a limit, 'reject' to raise QueryCostExceeded.
+        """
+        if action not in QUERY_COST_ACTIONS:
+            raise ValueError(f"Unknown query cost action {action!r}; expected one of {QUERY_COST_ACTIONS}.")
+        self.max_query_bytes = int(max_query_bytes or 0)
+        self.budget_bytes = int(budget_bytes or 0)
+        self.action = action
+        self.total_bytes = 0
+        self.estimates = []
+
+    def check(self, query, step):
+        """
+        Dry-runs a statement and checks its estimate against the limits.
+
+        Parameters:
+            query (str): The statement about to be submitted.
+            step (str): Name of the step, for the log.
+
+        Returns:
+            int: Estimated bytes processed.
+
+        Raises:
+            QueryCostExceeded: When the action is 'reject' and a limit would be exceeded.
+        """
+        estimated = int(dry_run_bigquery_query(query) or 0)
+        self.estimates.append((step, estimated))
+
+        problems = []
+        if self.max_query_bytes and estimated > self.max_query_bytes:
+            problems.append(f"over the per-query limit of {_format_bytes(self.max_query_bytes)}")
+        if self.budget_bytes and self.total_bytes + estimated > self.budget_bytes:
+            problems.append(f"past the run budget of {_format_bytes(self.budget_bytes)} "
+                            f"({_format_bytes(self.total_bytes)} used)")
+        if problems and self.action == 'reject':
+            error_message = f"{step}: rejected, estimated {_format_bytes(estimated)} is {' and '.join(problems)}."
+            logging.error(error_message)
+            raise QueryCostExceeded(error_message)
+
+        self.total_bytes += estimated
+        logging.info(f"{step}: estimated {_format_bytes(estimated)} processed "
+                     f"({_format_bytes(self.total_bytes)} this run).")
+        if problems:
+            logging.warning(f"{step}: estimated {_format_bytes(estimated)} is {' and '.join(problems)}.")
+        return estimated
+
+
+query_cost_guard = QueryCostGuard(
+    shared_variables.get('c_s_query_max_bytes', 0),
+    shared_variables.get('c_s_query_budget_bytes', 0),
+    shared_variables.get('c_s_query_cost_action', 'flag')
+)
+
+
+def guard_query(query, step):
+    """Checks a statement with the run's guard; see QueryCostGuard.check."""
+    return query_cost_guard.check(query, step)
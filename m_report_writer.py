@@ -0,0 +1,144 @@
+"""
+File: m_report_writer.py
+Purpose: Writes validation reports to .xlsx in constant memory.
+         Replaces pd.ExcelWriter(engine='openpyxl'), which builds the whole workbook
+         in memory before saving.
+Logic Overview:
+    1. Open a write-only openpyxl workbook; rows are streamed to disk as they are appended.
+    2. Append the header, then every row of each DataFrame (a report can be passed as
+       one frame or as an iterable of chunks).
+    3. Optionally write CSV and/or Parquet sidecars next to the workbook, chunk by chunk.
+    4. write_report_to_gcs() then uploads the streamed workbook file to GCS as it is.
+Notes:
+    - Rows beyond the Excel sheet limit are left out of the workbook with a warning;
+      sidecars always receive every row.
+    - Parquet sidecars need pyarrow; without it the sidecar is skipped with a warning.
+    - Uploads go through mdo.upload_file_to_gcs; upload_file_to_gcs() here (google-cloud-storage)
+      is added to mdo when it has none.
+"""
+
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+
+import m_data_operations as mdo
+
+# Excel sheet limit including the header row
+EXCEL_MAX_ROWS = 1048576
+
+
+def _excel_value(value):
+    """Converts a DataFrame cell to a value openpyxl can store (missing values become empty cells)."""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if value is None or value is pd.NaT or (isinstance(value, float) and np.isnan(value)):
+        return None
+    return value
+
+
+def write_report(frames, file_path, sheet_name, sidecars=()):
+    """
+    Streams a report to an .xlsx workbook with a single sheet.
+
+    Parameters:
+        frames (pandas.DataFrame or iterable): The report, or chunks of it with the same columns.
+        file_path (str): Path of the .xlsx file.
+        sheet_name (str): Name of the worksheet.
+        sidecars (iterable): Any of 'csv' and 'parquet'; written with the same base name.
+
+    Returns:
+        int: Number of report rows (excluding the header).
+    """
+    if isinstance(frames, pd.DataFrame):
+        frames = [frames]
+    base_path = os.path.splitext(file_path)[0]
+    sidecars = set(sidecars)
+
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet(sheet_name)
+    parquet_writer = None
+    rows = 0
+    first_chunk = True
+    try:
+        for frame in frames:
+            if first_chunk:
+                worksheet.append([str(col) for col in frame.columns])
+
+            # Only as many rows as still fit on the sheet
+            for row in frame.iloc[:max(EXCEL_MAX_ROWS - 1 - rows, 0)].itertuples(index=False, name=None):
+                worksheet.append([_excel_value(value) for value in row])
+
+            if 'csv' in sidecars:
+                frame.to_csv(f"{base_path}.csv", mode='w' if first_chunk else 'a', header=first_chunk, index=False)
+            if 'parquet' in sidecars:
+                try:
+                    import pyarrow as pa
+                    import pyarrow.parquet as pq
+                except ImportError:
+                    logging.warning("pyarrow is not installed; skipping the Parquet report sidecar.")
+                    sidecars.discard('parquet')
+                else:
+                    table = pa.Table.from_pandas(frame, preserve_index=False)
+                    if parquet_writer is None:
+                        parquet_writer = pq.ParquetWriter(f"{base_path}.parquet", table.schema)
+                    parquet_writer.write_table(table.cast(parquet_writer.schema))
+            rows += len(frame)
+            first_chunk = False
+
+        workbook.save(file_path)
+    finally:
+        if parquet_writer is not None:
+            parquet_writer.close()
+
+    if rows > EXCEL_MAX_ROWS - 1:
+        logging.warning(f"{file_path} holds the first {EXCEL_MAX_ROWS - 1} of {rows} report rows; "
+                        f"see the sidecar files for the rest.")
+    logging.info(f"Wrote {rows} report rows to {file_path}"
+                 + (f" with {', '.join(sorted(sidecars))} sidecar(s)." if sidecars else "."))
+    return rows
+
+
+def upload_file_to_gcs(file_path, gcs_dir, file_name):
+    """
+    Uploads a local file to GCS unchanged.
+
+    Parameters:
+        file_path (str): Path of the local file.
+        gcs_dir (str): GCS directory: [gs://]bucket[/prefix], '\\' or '/' separated.
+        file_name (str): Name of the object under gcs_dir.
+    """
+    from google.cloud import storage
+
+    bucket_name, _, prefix = gcs_dir.replace('\\', '/').removeprefix('gs://').strip('/').partition('/')
+    blob_name = f"{prefix}/{file_name}" if prefix else file_name
+    storage.Client().bucket(bucket_name).blob(blob_name).upload_from_filename(file_path)
+
+
+# Add the upload to the mdo module when it has none
+if not hasattr(mdo, 'upload_file_to_gcs'):
+    mdo.upload_file_to_gcs = upload_file_to_gcs
+
+
+def write_report_to_gcs(frames, file_path, sheet_name, gcs_dir, gcs_file_name, sidecars=()):
+    """
+    Streams a report to an .xlsx workbook on local disk, then uploads that file to GCS.
+
+    Parameters:
+        frames (pandas.DataFrame or iterable): The report, or chunks of it with the same columns.
+        file_path (str): Path of the local .xlsx file.
+        sheet_name (str): Name of the worksheet.
+        gcs_dir (str): GCS directory.
+        gcs_file_name (str): Base name of the file in GCS; the local file's extension is added.
+        sidecars (iterable): Any of 'csv' and 'parquet'; written next to the local workbook.
+
+    Returns:
+        int: Number of report rows (excluding the header).
+    """
+    rows = write_report(frames, file_path, sheet_name, sidecars)
+    file_name = f"{gcs_file_name}{os.path.splitext(file_path)[1]}"
+    mdo.upload_file_to_gcs(file_path, gcs_dir, file_name)
+    logging.info(f"Uploaded {file_path} to GCS as {gcs_dir}/{file_name}.")
+    return rows
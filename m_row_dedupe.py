@@ -0,0 +1,130 @@
+"""
+File: m_row_dedupe.py
+Purpose: Removes duplicate report rows using 64-bit row hashes instead of
+         DataFrame.drop_duplicates(), which compares every column of wide object frames.
+Logic Overview:
+    1. Each frame passed to RowHashDeduplicator.unique_rows() is hashed row by row.
+    2. Rows whose hash is new, and first of its hash within the frame, are kept without
+       comparing any values.
+    3. Rows with a repeated hash are compared, in one vectorized pass, with the earlier row
+       of that hash; only real hash collisions fall back to a row-by-row comparison, so a
+       collision never drops a distinct row.
+    4. The deduplicator keeps the hashes and values of the kept rows, so streamed chunks are
+       deduplicated against each other and the cost follows the number of report rows.
+Notes:
+    - Results match drop_duplicates(keep='first') over the concatenated frames; missing
+      values compare equal to each other, as in drop_duplicates.
+"""
+
+import logging
+
+import numpy as np
+import pandas as pd
+
+
+def _same_values(left, right):
+    """Row-wise equality of two object arrays of equal shape, missing values matching each other."""
+    left_missing, right_missing = pd.isna(left), pd.isna(right)
+    equal = np.where(left_missing | right_missing, left_missing & right_missing,
+                     np.where(left_missing, 0, left) == np.where(right_missing, 0, right))
+    return equal.all(axis=1)
+
+
+class RowHashDeduplicator:
+    """
+    Keeps the first occurrence of every distinct row across a sequence of frames.
+
+    Attributes:
+        rows_seen (int): Rows passed in so far.
+        rows_kept (int): Distinct rows returned so far.
+        collisions (int): Distinct rows that shared a hash with an earlier kept row.
+    """
+
+    def __init__(self):
+        # Kept rows, one frame per call (the frames that were returned)
+        self._frames = []
+        # One entry per distinct kept hash: hash, frame and row within the frame's kept values
+        self._hashes = np.empty(0, dtype=np.uint64)
+        self._frame_ids = np.empty(0, dtype=np.int64)
+        self._positions = np.empty(0, dtype=np.int64)
+        # hash -> further kept rows whose hash collided with an indexed row
+        self._collided = {}
+        self.rows_seen = 0
+        self.rows_kept = 0
+        self.collisions = 0
+
+    def _kept_rows(self, indexes):
+        """Values of indexed kept rows as an object array."""
+        frame_ids, positions = self._frame_ids[indexes], self._positions[indexes]
+        rows = np.empty((len(indexes), len(self._frames[0].columns)), dtype=object)
+        for frame_id in np.unique(frame_ids):
+            selected = frame_ids == frame_id
+            rows[selected] = self._frames[frame_id].iloc[positions[selected]].to_numpy(dtype=object)
+        return rows
+
+    def unique_rows(self, df):
+        """
+        Drops rows that duplicate a row kept from this or an earlier frame.
+
+        Parameters:
+            df (pandas.DataFrame): Report rows; every frame must have the same columns.
+
+        Returns:
+            pandas.DataFrame: The rows not seen before, in their original order.
+        """
+        self.rows_seen += len(df)
+        if df.empty:
+            return df
+
+        hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+        prior = (pd.Index(self._hashes).get_indexer(hashes) if len(self._hashes)
+                 else np.full(len(df), -1, dtype=np.int64))
+        _, first_index, inverse = np.unique(hashes, return_index=True, return_inverse=True)
+        first_in_frame = first_index[inverse.ravel()]
+        keep = (prior < 0) & (first_in_frame == np.arange(len(df)))
+
+        # Repeated hashes: compare with the earlier kept row, or the first row of the frame
+        repeated = np.flatnonzero(~keep)
+        unresolved = []
+        if len(repeated):
+            # Values are only materialized for these rows
+            repeated_values = df.iloc[repeated].to_numpy(dtype=object)
+            earlier = df.iloc[first_in_frame[repeated]].to_numpy(dtype=object)
+            from_prior = prior[repeated] >= 0
+            if from_prior.any():
+                earlier[from_prior] = self._kept_rows(prior[repeated][from_prior])
+            unresolved_mask = ~_same_values(repeated_values, earlier)
+            unresolved = repeated[unresolved_mask]
+            unresolved_values = dict(zip(unresolved, repeated_values[unresolved_mask]))
+
+        # Hash collisions: compare with every kept row of that hash
+        collided_in_frame = {}
+        for position in unresolved:
+            key = hashes[position]
+            candidates = list(self._collided.get(key, [])) + collided_in_frame.get(key, [])
+            if prior[position] >= 0:
+                candidates.append(self._kept_rows(prior[[position]])[0])
+            elif keep[first_in_frame[position]]:
+                candidates.append(df.iloc[first_in_frame[position]].to_numpy(dtype=object))
+            row = unresolved_values[position]
+            if any(_same_values(np.array([row]), np.array([candidate]))[0] for candidate in candidates):
+                continue
+            self.collisions += 1
+            logging.debug(f"Row hash collision on {key}; both rows are kept.")
+            keep[position] = True
+            collided_in_frame.setdefault(key, []).append(row)
+
+        # Remember the kept rows for later frames
+        unique_df = df[keep]
+        frame_id = len(self._frames)
+        self._frames.append(unique_df)
+        kept_positions = np.flatnonzero(keep)
+        indexed = (prior[kept_positions] < 0) & (first_in_frame[kept_positions] == kept_positions)
+        self._hashes = np.concatenate([self._hashes, hashes[kept_positions[indexed]]])
+        self._frame_ids = np.concatenate([self._frame_ids, np.full(int(indexed.sum()), frame_id)])
+        self._positions = np.concatenate([self._positions, np.flatnonzero(indexed)])
+        for key, rows in collided_in_frame.items():
+            self._collided.setdefault(key, []).extend(rows)
+
+        self.rows_kept += len(kept_positions)
+        return unique_df
@@ -0,0 +1,265 @@
+"""
+File: m_synthetic_drug_intake.py
+Purpose: Generates synthetic drug intake data for benchmarking the drug validators
+         without production data.
+Logic Overview:
+    1. Resolve the campaign's drug quality rules and read, per intake column, what the
+       rules accept (allowed values, maximum or exact lengths, required, not blank,
+       single value).
+    2. Generate rows with realistic NDC11/NDC9/GPI identifiers and valid values for
+       every column the rules read.
+    3. Corrupt one column in a configurable share of the rows so they fail validation.
+    4. generate_drug_reference() builds a matching v_drug_denorm extract so intake
+       validity joins find the generated identifiers.
+Notes:
+    - All columns are strings (or None), as they arrive from the intake tables.
+    - The same seed always yields the same frame.
+"""
+
+import numpy as np
+import pandas as pd
+
+import m_drug_quality_rules as mdqr
+
+# Campaign used to represent each campaign family in benchmarks
+CAMPAIGN_FAMILIES = {
+    'FDRO': 30,
+    'ACF': 26,
+    'BC': 566,
+    'VF': 23,
+    'OPIOIDS': 52,
+    'TIER': 60,
+}
+
+_IDENTIFIER_COLUMNS = ['rec_type', 'druglvl', 'drug_code', 'ndc9', 'ndc11', 'gpi', 'gpi_len', 'ast',
+                       'drug_desc', 'b_g', 'ms_ss', 'sql_join']
+# Valid values that keep the dependent columns (templates, add back text) consistent
+_PREFERRED_VALUES = {
+    'ADD BACK': ['Y'],
+    'CALL_TYPE': ['I', 'S'],
+}
+_WORDS = np.array(['tablet', 'capsule', 'oral', 'solution', 'extended', 'release', 'injection',
+                   'pen', 'brand', 'generic', 'kit', 'strips', 'cream', 'mg', 'ml'])
+
+
+def _column_constraints(rules):
+    """Collects, per column, what the rules accept."""
+    constraints = {}
+
+    def walk(predicate, negated=False):
+        op = predicate[0]
+        if op in ('and', 'or'):
+            for part in predicate[1:]:
+                walk(part, negated)
+            return
+        if op == 'not':
+            walk(predicate[1], not negated)
+            return
+        if op in ('truthy_count_gt', 'le_len_without', 'identifier'):
+            return
+        entry = constraints.setdefault(predicate[1], {})
+        # not_in over placeholders only ('NA', ' ') is a condition on another column
+        if op == 'in' and negated and {str(value).strip() for value in predicate[2]} - {'', 'NA'}:
+            allowed = {str(value).upper() if predicate[3] else value for value in predicate[2]}
+            entry['allowed'] = entry['allowed'] & allowed if 'allowed' in entry else allowed
+        elif op == 'eq' and predicate[2] == ' ' and not negated:
+            entry['not_blank'] = True
+        elif op == 'len_gt':
+            entry['max_length'] = min(entry.get('max_length', predicate[2]), predicate[2])
+        elif op == 'len_ne':
+            entry['length'] = predicate[2]
+        elif op == 'isna':
+            entry['required'] = True
+        elif op == 'contains' and predicate[2] == ',':
+            entry['single_value'] = True
+
+    for compiled in rules:
+        walk(compiled.rule.predicate)
+    return constraints
+
+
+def _digits(rng, rows, length):
+    digits = rng.integers(0, 10, size=(rows, length)).astype(str)
+    return pd.Series([''.join(row) for row in digits], dtype=object)
+
+
+def _reference_only_ids(rng, rows):
+    # Intake NDCs never start with 9, so these drugs cannot match an intake NDC9 by accident
+    return '9' + _digits(rng, rows, 10)
+
+
+def _text(rng, rows, max_length=60):
+    words = rng.choice(_WORDS, size=(rows, 3))
+    text = pd.Series([' '.join(row).upper() for row in words], dtype=object)
+    return text.str[:max_length]
+
+
+def _valid_column(rng, rows, column, constraint):
+    if column in _PREFERRED_VALUES:
+        return pd.Series(rng.choice(_PREFERRED_VALUES[column], size=rows), dtype=object)
+    if 'allowed' in constraint:
+        allowed = sorted(constraint['allowed'])
+        populated = [value for value in allowed if str(value).strip()]
+        return pd.Series(rng.choice(populated or allowed, size=rows), dtype=object)
+    if 'length' in constraint:
+        return _digits(rng, rows, constraint['length'])
+    if column.lower().endswith(('date', '_dt')):
+        return pd.Series(['2025-01-01'] * rows, dtype=object)
+    if any(part in column.lower() for part in ('qty_limit', 'qty_time', 'daily_dose_limit')):
+        return pd.Series(rng.choice(['30', '60', '90'], size=rows), dtype=object)
+    if column.lower() in ('age_min', 'age_max'):
+        return pd.Series(rng.choice(['0', '18', '65'], size=rows), dtype=object)
+    return _text(rng, rows, constraint.get('max_length', 60))
+
+
+def _invalid_value(rng, column, constraint):
+    if column == 'ndc11':
+        return '1234-567-89'
+    if 'allowed' in constraint:
+        return 'ZZ'
+    if 'length' in constraint:
+        return '1' * (constraint['length'] - 1)
+    if constraint.get('required'):
+        return None
+    if 'max_length' in constraint:
+        return 'X' * (constraint['max_length'] + 1)
+    if constraint.get('single_value'):
+        return '18,65'
+    return ' '
+
+
+def _identifiers(rng, rows, ms_ss_values):
+    rec_type = rng.choice(['I', 'E'], size=rows, p=[0.9, 0.1])
+    # Exclusions are listed at NDC11 level
+    druglvl = np.where(rec_type == 'E', 'NDC11', rng.choice(['NDC11', 'NDC9', 'GPI'], size=rows, p=[0.4, 0.2, 0.4]))
+    ndc11 = _digits(rng, rows, 11).str.replace('^9', '8', regex=True)
+    # Intake GPIs are mostly product level; short class prefixes would match most of the catalog
+    gpi_len = rng.choice([10, 12, 14], size=rows, p=[0.2, 0.3, 0.5])
+    gpi = _digits(rng, rows, 14).str[:14]
+    gpi = pd.Series([code[:length] for code, length in zip(gpi, gpi_len)], dtype=object)
+
+    df = pd.DataFrame({
+        'rec_type': rec_type,
+        'druglvl': druglvl,
+        'ndc11': np.where(druglvl == 'NDC11', ndc11, ''),
+        'ndc9': np.where(druglvl == 'NDC9', ndc11.str[:9], ''),
+        'gpi': np.where(druglvl == 'GPI', gpi, ''),
+        'ast': '0',
+        'b_g': rng.choice(['B', 'G', 'A'], size=rows),
+        'ms_ss': rng.choice(ms_ss_values, size=rows),
+        'sql_join': '',
+        'drug_desc': _text(rng, rows, 40),
+    }, dtype=object)
+    # Numeric, as derived by m_function_drug_common_fields
+    df['gpi_len'] = np.where(druglvl == 'GPI', gpi_len, 0)
+    df['drug_code'] = np.where(druglvl == 'NDC11', df['ndc11'], np.where(druglvl == 'NDC9', df['ndc9'], df['gpi']))
+    return df
+
+
+def generate_drug_intake(campaign_id, rows, error_rate=0.01, seed=0, parent='', intake_file='',
+                         bob_run_type=None, opioid_daily_dose_bypass='N'):
+    """
+    Generates a drug intake frame for one campaign.
+
+    Parameters:
+        campaign_id (int): DQI campaign ID; decides which rules, and so which columns, apply.
+        rows (int): Number of rows.
+        error_rate (float): Share of rows with one corrupted column.
+        seed (int): Random seed.
+        parent, intake_file, bob_run_type, opioid_daily_dose_bypass: Further rule settings,
+            as for m_drug_quality_rules.resolve_drug_quality_rules.
+
+    Returns:
+        pandas.DataFrame: The intake rows, all columns as strings or None.
+    """
+    rng = np.random.default_rng(seed)
+    rules = mdqr.resolve_drug_quality_rules(campaign_id, parent, intake_file, bob_run_type, opioid_daily_dose_bypass)
+    constraints = _column_constraints(rules)
+
+    ms_ss_allowed = constraints.get('ms_ss', {}).get('allowed', {'MS', 'SS', 'A'})
+    ms_ss_values = sorted(value for value in ms_ss_allowed & {'MS', 'SS', 'M', 'S', 'A'}) or ['A']
+    df = _identifiers(rng, rows, ms_ss_values)
+    if '_exceedlmt' in constraints:
+        df['_exceedlmt'] = '000000'
+    if campaign_id in (66, 67, 554):
+        # GF intakes carry per multi-source code include/exclude flags; include everything
+        for column in ('mony_m', 'mony_o', 'mony_n', 'mony_y', 'rx', 'otc'):
+            df[column] = 'I'
+
+    # Every other column the rules read; intake tables do not repeat a name in another case
+    seen = {col.lower() for col in df.columns}
+    for column in mdqr.drug_quality_rule_columns(rules):
+        if column.lower() in seen:
+            continue
+        seen.add(column.lower())
+        df[column] = _valid_column(rng, rows, column, constraints.get(column, {}))
+    for column in ('_exceed_rlimit', '_exceed_mlimit'):
+        if column in df.columns:
+            df[column] = '0'
+
+    # Corrupt one rule-checked column in error_rate of the rows
+    corrupt_rows = np.flatnonzero(rng.random(rows) < error_rate)
+    candidates = [col for col in df.columns if col in constraints and col not in _IDENTIFIER_COLUMNS] + ['ndc11']
+    for row, column in zip(corrupt_rows, rng.choice(candidates, size=len(corrupt_rows))):
+        df.at[row, column] = _invalid_value(rng, column, constraints.get(column, {}))
+    return df
+
+
+def _reference_attributes(rng, b_g, ms_ss):
+    """PBM brand/generic and multi-source codes consistent with the intake b_g / ms_ss."""
+    brand = b_g.map({'B': 'BRND', 'G': 'GNRC'})
+    brand = brand.where(brand.notna(), pd.Series(rng.choice(['BRND', 'GNRC'], size=len(b_g)), index=b_g.index))
+    multi = ms_ss.map({'M': 'MULTI', 'MS': 'MULTI', 'S': 'SINGLE', 'SS': 'SINGLE'})
+    multi = multi.where(multi.notna(), pd.Series(rng.choice(['MULTI', 'SINGLE'], size=len(ms_ss)), index=ms_ss.index))
+    return brand, multi
+
+
+def generate_drug_reference(intake_df, extra_drugs=1000, seed=0):
+    """
+    Builds a v_drug_denorm extract covering the identifiers of an intake frame.
+
+    Every intake row matches its own drugs, so the intake has no duplicate drugs, and
+    exclusion NDCs are placed under an included GPI, as exclusions are in practice.
+
+    Parameters:
+        intake_df (pandas.DataFrame): Frame from generate_drug_intake.
+        extra_drugs (int): Additional drugs no intake row refers to.
+        seed (int): Random seed.
+
+    Returns:
+        pandas.DataFrame: drug_id (NDC11), gpi_cd and the PBM/MDDB product attributes.
+    """
+    # Separate stream from generate_drug_intake with the same seed, or the random codes would repeat
+    rng = np.random.default_rng([seed, 1])
+    druglvl = intake_df['druglvl']
+    gpi_rows = intake_df[druglvl == 'GPI']
+    drug_ids = np.where(druglvl == 'NDC11', intake_df['ndc11'],
+                        np.where(druglvl == 'NDC9', intake_df['ndc9'] + '01', _reference_only_ids(rng, len(intake_df))))
+    gpi_cd = np.where(druglvl == 'GPI', intake_df['gpi'].str.ljust(14, '0'), _digits(rng, len(intake_df), 14))
+    b_g, ms_ss = intake_df['b_g'].copy(), intake_df['ms_ss'].copy()
+
+    # Exclusions sit under an included GPI and share its attributes
+    included_gpis = gpi_rows[gpi_rows['rec_type'] == 'I']
+    exclusions = np.flatnonzero((intake_df['rec_type'] == 'E').to_numpy())
+    if len(included_gpis) and len(exclusions):
+        parents = included_gpis.iloc[rng.integers(0, len(included_gpis), size=len(exclusions))]
+        suffixes = _digits(rng, len(exclusions), 14)
+        gpi_cd[exclusions] = [(gpi + suffix)[:14] for gpi, suffix in zip(parents['gpi'], suffixes)]
+        b_g.iloc[exclusions] = parents['b_g'].to_numpy()
+        ms_ss.iloc[exclusions] = parents['ms_ss'].to_numpy()
+    brand, multi = _reference_attributes(rng, b_g, ms_ss)
+
+    reference = pd.DataFrame({
+        'drug_id': np.concatenate([drug_ids, _reference_only_ids(rng, extra_drugs)]),
+        'gpi_cd': np.concatenate([gpi_cd, _digits(rng, extra_drugs, 14)]),
+        'BRND_GNRC_CD': np.concatenate([brand, rng.choice(['BRND', 'GNRC'], size=extra_drugs)]),
+        'DRUG_MULTI_SRC_CD': np.concatenate([multi, rng.choice(['MULTI', 'SINGLE'], size=extra_drugs)]),
+    }, dtype=object).drop_duplicates('drug_id').reset_index(drop=True)
+    rows = len(reference)
+    reference.insert(0, 'DRUG_PROD_GID', np.arange(1, rows + 1).astype(str))
+    reference['PBM_DRUG_MULTI_SRC_CD'] = np.where(reference['DRUG_MULTI_SRC_CD'] == 'MULTI', 'M', 'N')
+    reference['MDDB_BRND_GNRC_CD'] = reference['BRND_GNRC_CD']
+    reference['MDDB_DRUG_MULTI_SRC_CD'] = reference['DRUG_MULTI_SRC_CD']
+    reference['MDDB_MULTSRC_CD'] = reference['PBM_DRUG_MULTI_SRC_CD']
+    reference['OTC_DRUG_IND'] = rng.choice(['Y', 'N'], size=rows, p=[0.1, 0.9])
+    return reference
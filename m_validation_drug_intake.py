@@ -3,7 +3,11 @@ import logging
 import os
 import m_data_operations as mdo
 import m_abend_handler
-import pandasql as psql
+import m_drug_denorm_snapshot as mdds
+import m_drug_matcher as mdm
+import m_query_cost_guard as mqcg
+import m_report_writer as mrw
+from m_fetch_bigquery_chunks import fetch_bigquery_dataframe_chunks
 
 # Load from shared_variable.yaml
 with open('shared_variable.yaml', 'r') as f:
@@ -39,7 +43,190 @@ table_out = shared_variables['table_out']
 c_s_dqi_campaign_id = shared_variables['c_s_dqi_campaign_id']
 c_s_filedir = shared_variables['c_s_filedir']
 dqi_storage_project = shared_variables['dqi_storage_project']
-def m_validation_drug_intake(tdname, c_s_tdtempx, c_s_schema, table_out, c_s_dqi_campaign_id, c_s_filedir):
+# Snapshot of v_drug_denorm, or a snapshot cache directory; small intakes are matched against it in process
+c_s_drug_denorm_snapshot = shared_variables.get('c_s_drug_denorm_snapshot', '')
+c_s_drug_denorm_cache = shared_variables.get('c_s_drug_denorm_cache', '')
+# Tables read by v_drug_denorm; their last-modified time versions the snapshot cache
+c_s_drug_denorm_version_tables = shared_variables.get('c_s_drug_denorm_version_tables', [])
+
+# GPI prefix lengths expanded into the drug match key table
+GPI_PREFIX_LENGTHS = range(2, 15)
+# v_drug_denorm columns carried into the drug match key table
+drug_match_key_columns = ['DRUG_PROD_GID', 'drug_id', 'BRND_GNRC_CD', 'DRUG_MULTI_SRC_CD', 'PBM_DRUG_MULTI_SRC_CD',
+                          'OTC_DRUG_IND', 'MDDB_BRND_GNRC_CD', 'MDDB_DRUG_MULTI_SRC_CD', 'MDDB_MULTSRC_CD']
+# Drug definitions in the drug validity table, and their (PBM column, MDDB column) pairs
+pbm_defn, mddb_defn = 'PBM ', 'MDDB'
+drug_definition_columns = [('BRND_GNRC_CD', 'MDDB_BRND_GNRC_CD'), ('DRUG_MULTI_SRC_CD', 'MDDB_DRUG_MULTI_SRC_CD'),
+                           ('PBM_DRUG_MULTI_SRC_CD', 'MDDB_MULTSRC_CD')]
+# Intake columns carried into the drug validity table
+drug_intake_columns = ['rec_type', 'drug_code', 'druglvl', 'ndc9', 'ndc11', 'gpi', 'drug_desc', 'b_g', 'ms_ss']
+# Largest intake matched in process when a v_drug_denorm snapshot is configured
+LOCAL_MATCH_MAX_ROWS = 50000
+
+
+def _drug_match_keys_query(match_keys_table, intake_table, drug_denorm_table):
+    """
+    Builds the drug match key table: one row per drug and NDC11, NDC9 or GPI prefix key,
+    so intake drug codes can be matched with an equi-join instead of LIKE.
+
+    Only the keys of the intake's distinct non-wildcard drug codes are kept.
+    """
+    columns = ', '.join(drug_match_key_columns)
+    prefix_lengths = ', '.join(str(length) for length in GPI_PREFIX_LENGTHS)
+    return f"""
+    CREATE TABLE `{match_keys_table}` AS
+    WITH intake_key AS (
+        SELECT DISTINCT druglvl AS match_lvl,
+               CASE WHEN druglvl = 'GPI' THEN TRIM(drug_code) ELSE drug_code END AS match_key
+        FROM `{intake_table}`
+        WHERE druglvl IN ('NDC11', 'NDC9', 'GPI') AND drug_code IS NOT NULL AND NOT {_wildcard_condition('')}
+    )
+    SELECT 'NDC11' AS match_lvl, drug_id AS match_key, {columns}
+    FROM `{drug_denorm_table}`
+    WHERE DRUG_PROD_GID IS NOT NULL
+    AND drug_id IN (SELECT match_key FROM intake_key WHERE match_lvl = 'NDC11')
+    UNION ALL
+    SELECT 'NDC9' AS match_lvl, SUBSTR(drug_id, 1, 9) AS match_key, {columns}
+    FROM `{drug_denorm_table}`
+    WHERE DRUG_PROD_GID IS NOT NULL
+    AND SUBSTR(drug_id, 1, 9) IN (SELECT match_key FROM intake_key WHERE match_lvl = 'NDC9')
+    UNION ALL
+    SELECT 'GPI' AS match_lvl, SUBSTR(TRIM(gpi_cd), 1, prefix_len) AS match_key, {columns}
+    FROM `{drug_denorm_table}`
+    CROSS JOIN UNNEST([{prefix_lengths}]) AS prefix_len
+    WHERE DRUG_PROD_GID IS NOT NULL AND LENGTH(TRIM(gpi_cd)) >= prefix_len
+    AND SUBSTR(TRIM(gpi_cd), 1, prefix_len) IN (SELECT match_key FROM intake_key WHERE match_lvl = 'GPI');
+    """
+
+
+def _wildcard_condition(alias):
+    """True for intake rows whose LIKE match cannot be expressed as a match key lookup."""
+    def has_wildcard(expr):
+        return f"(INSTR({expr}, '%') > 0 OR INSTR({expr}, '_') > 0 OR INSTR({expr}, '\\\\') > 0)"
+    gpi_code = f"TRIM({alias}drug_code)"
+    return f"""COALESCE(
+        ({alias}druglvl = 'NDC11' AND {has_wildcard(f'{alias}drug_code')})
+        OR ({alias}druglvl = 'GPI' AND ({has_wildcard(gpi_code)} OR LENGTH({gpi_code}) NOT BETWEEN
+                                        {min(GPI_PREFIX_LENGTHS)} AND {max(GPI_PREFIX_LENGTHS)})),
+        FALSE)"""
+
+
+def _drug_exclusion_condition(campaign_id):
+    """True for drug validity rows whose drug attributes contradict the intake row's exclusions."""
+    if campaign_id in [66, 67, 554]:
+        return """druglvl = 'GPI'
+            AND ((COALESCE(mony_m, ' ') = 'E' AND PBM_DRUG_MULTI_SRC_CD = 'M')
+            OR (COALESCE(mony_o, ' ') = 'E' AND PBM_DRUG_MULTI_SRC_CD = 'O')
+            OR (COALESCE(mony_n, ' ') = 'E' AND PBM_DRUG_MULTI_SRC_CD = 'N')
+            OR (COALESCE(mony_y, ' ') = 'E' AND PBM_DRUG_MULTI_SRC_CD = 'Y')
+            OR (COALESCE(rx, ' ') = 'E' AND COALESCE(OTC_DRUG_IND, ' ') <> 'Y')
+            OR (COALESCE(otc, ' ') = 'E' AND OTC_DRUG_IND = 'Y'))"""
+    return """(b_g = 'B' AND BRND_GNRC_CD = 'GNRC')
+            OR (b_g = 'G' AND BRND_GNRC_CD = 'BRND')
+            OR (ms_ss IN ('M', 'MS') AND DRUG_MULTI_SRC_CD = 'SINGLE')
+            OR (ms_ss IN ('S', 'SS') AND DRUG_MULTI_SRC_CD = 'MULTI')"""
+
+
+def _matched_drug_select(intake_table, match_keys_table, drug_denorm_table, extra_columns):
+    """
+    Selects one row per intake row and matching drug.
+
+    Intake rows are matched to drugs with a hash equi-join on the match key table;
+    wildcard drug codes fall back to the LIKE join against v_drug_denorm.
+    """
+    matched_columns = ',\n            '.join(
+        [f"drug.{column}" for column in drug_match_key_columns]
+        + [f"mydrug.{column}" for column in drug_intake_columns + extra_columns]
+    )
+    return f"""
+        SELECT {matched_columns}
+        FROM `{intake_table}` mydrug
+        INNER JOIN `{match_keys_table}` drug
+        ON drug.match_lvl = mydrug.druglvl
+        AND drug.match_key = CASE WHEN mydrug.druglvl = 'GPI' THEN TRIM(mydrug.drug_code) ELSE mydrug.drug_code END
+        WHERE NOT {_wildcard_condition('mydrug.')}
+        UNION ALL
+        SELECT {matched_columns}
+        FROM (SELECT * FROM `{intake_table}` WHERE {_wildcard_condition('')}) mydrug
+        INNER JOIN `{drug_denorm_table}` drug
+        ON ((mydrug.druglvl = 'NDC11' AND drug.drug_id LIKE mydrug.drug_code)
+        OR (mydrug.druglvl = 'NDC9' AND mydrug.drug_code = SUBSTR(drug.drug_id, 1, 9))
+        OR (mydrug.druglvl = 'GPI' AND TRIM(drug.gpi_cd) LIKE CONCAT(TRIM(mydrug.drug_code), '%')))
+        WHERE drug.DRUG_PROD_GID IS NOT NULL"""
+
+
+def _drug_validity_query(drug_validity_table, matched_drug_select, extra_columns, exclusion_condition):
+    """
+    Builds the drug validity table, PBM and MDDB definitions, in one statement.
+
+    Each matched intake row and drug is unpivoted into one row per drug definition and
+    rows meeting the exclusion condition are left out.
+    """
+    definition_columns = ',\n            '.join(
+        f"CASE defn.DRUG_DEFN WHEN '{pbm_defn}' THEN {pbm_column} ELSE {mddb_column} END AS {pbm_column}"
+        for pbm_column, mddb_column in drug_definition_columns
+    )
+    return f"""
+    CREATE TABLE `{drug_validity_table}` AS
+    WITH matched_drug AS ({matched_drug_select}
+    )
+    SELECT * FROM (
+        SELECT DISTINCT
+            COALESCE(DRUG_PROD_GID, 0) AS DRUG_PROD_GID,
+            drug_id,
+            {definition_columns},
+            OTC_DRUG_IND,
+            {', '.join(drug_intake_columns)},
+            defn.DRUG_DEFN
+            {''.join(f', {column}' for column in extra_columns)}
+        FROM matched_drug
+        CROSS JOIN (SELECT '{pbm_defn}' AS DRUG_DEFN UNION ALL SELECT '{mddb_defn}' AS DRUG_DEFN) defn
+    )
+    WHERE NOT COALESCE({exclusion_condition}, FALSE);
+    """
+
+
+def _local_matched_drugs(intake_table, drug_denorm_table, drug_denorm_snapshot, drug_denorm_cache,
+                         drug_denorm_version_tables, extra_columns):
+    """
+    Matches a small intake against a v_drug_denorm snapshot in process.
+
+    The snapshot is drug_denorm_snapshot when given, else the current snapshot of the
+    drug_denorm_cache directory (fetched only when one of drug_denorm_version_tables has changed).
+
+    Returns:
+        pandas.DataFrame or None: The matched rows, or None when the intake has more than
+                                  LOCAL_MATCH_MAX_ROWS rows, or the cache has no version tables,
+                                  and is matched in the warehouse.
+    """
+    if not drug_denorm_snapshot and not drug_denorm_version_tables:
+        logging.warning("No v_drug_denorm version tables configured; matching drugs in the warehouse.")
+        return None
+    # Count first; the intake rows are only fetched when it is small enough
+    cnt_intake_query = f"SELECT COUNT(*) AS cnt FROM `{intake_table}`"
+    mqcg.guard_query(cnt_intake_query, "Drug intake count for local matching")
+    cnt_intake = int(mdo.fetch_bigquery_dataframe(cnt_intake_query, "drug_intake_count")['cnt'].iloc[0])
+    if cnt_intake > LOCAL_MATCH_MAX_ROWS:
+        logging.info(f"Intake has {cnt_intake} rows, more than {LOCAL_MATCH_MAX_ROWS}; "
+                     "matching drugs in the warehouse.")
+        return None
+    intake_query = f"SELECT {', '.join(drug_intake_columns + extra_columns)} FROM `{intake_table}`"
+    mqcg.guard_query(intake_query, "Drug intake fetch for local matching")
+    intake_df = mdo.fetch_bigquery_dataframe(intake_query, "drug_intake")
+    if not drug_denorm_snapshot:
+        drug_denorm_snapshot = mdds.drug_denorm_snapshot(drug_denorm_table, drug_denorm_cache,
+                                                         drug_match_key_columns + ['gpi_cd'],
+                                                         drug_denorm_version_tables)
+        mdds.evict_drug_denorm_snapshots(drug_denorm_cache, keep=drug_denorm_snapshot)
+    drug_matcher = mdm.DrugMatcher.from_snapshot(drug_denorm_snapshot, drug_match_key_columns + ['gpi_cd'])
+    matched_drug_df = drug_matcher.match(intake_df, drug_match_key_columns)
+    logging.info(f"Matched {len(matched_drug_df)} intake drugs against {drug_denorm_snapshot}.")
+    return matched_drug_df
+
+
+def m_validation_drug_intake(tdname, c_s_tdtempx, c_s_schema, table_out, c_s_dqi_campaign_id, c_s_filedir,
+                             report_sidecars=(), drug_denorm_snapshot='', drug_denorm_cache='',
+                             drug_denorm_version_tables=()):
     logging.info("=========================================================")
     logging.info("Start :: m_validation_drug_intake...")
     logging.info("=========================================================")
@@ -53,115 +240,87 @@ def m_validation_drug_intake(tdname, c_s_tdtempx, c_s_schema, table_out, c_s_dqi
         table_out (str): Output table name.
         c_s_dqi_campaign_id (int): Campaign ID.
         c_s_filedir (str): Directory for output files.
+        report_sidecars (iterable): 'csv' and/or 'parquet' copies written next to the Excel reports.
+        drug_denorm_snapshot (str): Snapshot of v_drug_denorm (Arrow IPC or Parquet); intakes of up to
+                                    LOCAL_MATCH_MAX_ROWS rows are matched against it in process.
+        drug_denorm_cache (str): Snapshot cache directory (m_drug_denorm_snapshot), used the same
+                                 way when no drug_denorm_snapshot is given.
+        drug_denorm_version_tables (list): Tables of c_s_schema read by v_drug_denorm, which version
+                                           the cached snapshots; without them the cache is not used.
     """
     try:
-        # Step 1: Drop previous table
+        # Step 1: Drop previous tables
         #logging.info(f"Dropping previous table: {c_s_tdtempx}.drug_validity_{tdname}")
         mdo.table_drop_passthrough(f"{c_s_tdtempx}.drug_validity_{tdname}")
+        mdo.table_drop_passthrough(f"{c_s_tdtempx}.drug_match_keys_{tdname}")
+        mdo.table_drop_passthrough(f"{c_s_tdtempx}.drug_matched_{tdname}")
         logging.info("Previous table dropped successfully.")
 
-        # Step 2: Create drug validity table
-        logging.info(f"Creating drug validity table: drug_validity_{tdname}")
-        create_table_query = f"""
-        CREATE TABLE `{dqi_storage_project}.{c_s_tdtempx}.drug_validity_{tdname}` AS
-        SELECT DISTINCT
-            COALESCE(DRUG.DRUG_PROD_GID, 0) AS DRUG_PROD_GID,
-            drug.drug_id,
-            drug.BRND_GNRC_CD,
-            drug.DRUG_MULTI_SRC_CD,
-            drug.PBM_DRUG_MULTI_SRC_CD,
-            drug.OTC_DRUG_IND,
-            mydrug.rec_type,
-            mydrug.drug_code,
-            mydrug.druglvl,
-            mydrug.ndc9,
-            mydrug.ndc11,
-            mydrug.gpi,
-            mydrug.drug_desc,
-            mydrug.b_g,
-            mydrug.ms_ss,
-            'PBM ' AS DRUG_DEFN
-            {', '.join(['mydrug.mony_m', 'mydrug.mony_o', 'mydrug.mony_n', 'mydrug.mony_y', 'mydrug.rx', 'mydrug.otc']) if c_s_dqi_campaign_id in [66, 67, 554] else ''}
-        FROM `{dqi_storage_project}.{table_out}` mydrug
-        LEFT JOIN `{dqi_storage_project}.{c_s_schema}.v_drug_denorm` drug
-        ON ((mydrug.druglvl = 'NDC11' AND drug.drug_id LIKE mydrug.drug_code)
-        OR (mydrug.druglvl = 'NDC9' AND mydrug.drug_code = SUBSTR(drug.drug_id, 1, 9))
-        OR (mydrug.druglvl = 'GPI' AND TRIM(drug.gpi_cd) LIKE (TRIM(mydrug.drug_code) || '%')))
-        WHERE drug.DRUG_PROD_GID IS NOT NULL;
-        """
-        mdo.execute_bigquery_query(create_table_query)
-        logging.info("Drug validity table created successfully.")
+        drug_validity = f"{dqi_storage_project}.{c_s_tdtempx}.drug_validity_{tdname}"
+        drug_match_keys = f"{dqi_storage_project}.{c_s_tdtempx}.drug_match_keys_{tdname}"
+        drug_matched = f"{dqi_storage_project}.{c_s_tdtempx}.drug_matched_{tdname}"
+        drug_denorm = f"{dqi_storage_project}.{c_s_schema}.v_drug_denorm"
+        intake_table = f"{dqi_storage_project}.{table_out}"
+        mony_columns = (['mony_m', 'mony_o', 'mony_n', 'mony_y', 'rx', 'otc']
+                        if c_s_dqi_campaign_id in [66, 67, 554] else [])
 
-        # Step 3: Insert into drug validity table
-        logging.info(f"Inserting data into drug validity table: drug_validity_{tdname}")
-        insert_query = f"""
-        INSERT INTO `{dqi_storage_project}.{c_s_tdtempx}.drug_validity_{tdname}`
-        SELECT DISTINCT
-            COALESCE(DRUG.DRUG_PROD_GID, 0) AS DRUG_PROD_GID,
-            drug.drug_id,
-            drug.MDDB_BRND_GNRC_CD AS BRND_GNRC_CD,
-            drug.MDDB_DRUG_MULTI_SRC_CD AS DRUG_MULTI_SRC_CD,
-            drug.MDDB_MULTSRC_CD AS PBM_DRUG_MULTI_SRC_CD,
-            drug.OTC_DRUG_IND,
-            mydrug.rec_type,
-            mydrug.drug_code,
-            mydrug.druglvl,
-            mydrug.ndc9,
-            mydrug.ndc11,
-            mydrug.gpi,
-            mydrug.drug_desc,
-            mydrug.b_g,
-            mydrug.ms_ss,
-            'MDDB' AS DRUG_DEFN
-            {', '.join(['mydrug.mony_m', 'mydrug.mony_o', 'mydrug.mony_n', 'mydrug.mony_y', 'mydrug.rx', 'mydrug.otc']) if c_s_dqi_campaign_id in [66, 67, 554] else ''}
-        FROM `{dqi_storage_project}.{table_out}` mydrug
-        LEFT JOIN `{dqi_storage_project}.{c_s_schema}.v_drug_denorm` drug
-        ON ((mydrug.druglvl = 'NDC11' AND drug.drug_id LIKE mydrug.drug_code)
-        OR (mydrug.druglvl = 'NDC9' AND mydrug.drug_code = SUBSTR(drug.drug_id, 1, 9))
-        OR (mydrug.druglvl = 'GPI' AND TRIM(drug.gpi_cd) LIKE CONCAT(TRIM(mydrug.drug_code), '%')))
-        WHERE drug.DRUG_PROD_GID IS NOT NULL;
-        """
-        mdo.execute_bigquery_query(insert_query)
-        logging.info("Data inserted into drug validity table successfully.")
-
-        # Step 4: Delete invalid rows based on conditions
-        logging.info("Deleting invalid rows based on conditions...")
-        if c_s_dqi_campaign_id in [66, 67, 554]:
-            delete_query = f"""
-            DELETE FROM `{dqi_storage_project}.{c_s_tdtempx}.drug_validity_{tdname}`
-            WHERE druglvl = 'GPI'
-            AND ((COALESCE(mony_m, ' ') = 'E' AND PBM_DRUG_MULTI_SRC_CD = 'M')
-            OR (COALESCE(mony_o, ' ') = 'E' AND PBM_DRUG_MULTI_SRC_CD = 'O')
-            OR (COALESCE(mony_n, ' ') = 'E' AND PBM_DRUG_MULTI_SRC_CD = 'N')
-            OR (COALESCE(mony_y, ' ') = 'E' AND PBM_DRUG_MULTI_SRC_CD = 'Y')
-            OR (COALESCE(rx, ' ') = 'E' AND COALESCE(OTC_DRUG_IND, ' ') <> 'Y')
-            OR (COALESCE(otc, ' ') = 'E' AND OTC_DRUG_IND = 'Y'));
-            """
+        matched_drug_df = (_local_matched_drugs(intake_table, drug_denorm, drug_denorm_snapshot, drug_denorm_cache,
+                                                drug_denorm_version_tables, mony_columns)
+                           if drug_denorm_snapshot or drug_denorm_cache else None)
+        if matched_drug_df is not None:
+            # Small intake: matched in process, only the matches are sent to the warehouse
+            mdo.write_df_to_bigquery(matched_drug_df, drug_matched)
+            matched_drug_select = f"SELECT * FROM `{drug_matched}`"
         else:
-            delete_query = f"""
-            DELETE FROM `{dqi_storage_project}.{c_s_tdtempx}.drug_validity_{tdname}`
-            WHERE (b_g = 'B' AND BRND_GNRC_CD = 'GNRC')
-            OR (b_g = 'G' AND BRND_GNRC_CD = 'BRND')
-            OR (ms_ss IN ('M', 'MS') AND DRUG_MULTI_SRC_CD = 'SINGLE')
-            OR (ms_ss IN ('S', 'SS') AND DRUG_MULTI_SRC_CD = 'MULTI');
-            """
-        mdo.execute_bigquery_query(delete_query)
-        logging.info("Invalid rows deleted successfully.")
+            # Build the NDC11 / NDC9 / GPI prefix match keys of v_drug_denorm for the intake's drug codes
+            logging.info(f"Creating drug match key table: drug_match_keys_{tdname}")
+            match_keys_query = _drug_match_keys_query(drug_match_keys, intake_table, drug_denorm)
+            mqcg.guard_query(match_keys_query, "Drug match key table")
+            mdo.execute_bigquery_query(match_keys_query)
+            matched_drug_select = _matched_drug_select(intake_table, drug_match_keys, drug_denorm, mony_columns)
+
+        # Steps 2-4: Create drug validity table, PBM and MDDB definitions without the excluded rows
+        logging.info(f"Creating drug validity table: drug_validity_{tdname}")
+        drug_validity_query = _drug_validity_query(
+            drug_validity, matched_drug_select, mony_columns, _drug_exclusion_condition(c_s_dqi_campaign_id)
+        )
+        mqcg.guard_query(drug_validity_query, "Drug validity table")
+        mdo.execute_bigquery_query(drug_validity_query)
+        logging.info("Drug validity table created successfully.")
 
         # Step 5: Drop duplicates
         #logging.info("Dropping duplicate rows...")
         #subprocess.call(["python", "m_table_drop.py", "validate_drug_duplicates2"])
 
-        # Step 6: Create validate_drug_duplicates2 table
-        logging.info("Creating validate_drug_duplicates2 dataset...")
-        validate_duplicates_query_str = f"""
+        # Step 6: Count duplicate drug validity rows; the rows are only fetched when there are duplicates
+        logging.info("Counting duplicate drug validity rows...")
+        cnt_duplicates_query = f"""
+            SELECT COUNT(*) AS cnt
+            FROM (
+                SELECT COUNT(*) OVER (PARTITION BY rec_type, drug_defn, drug_id) AS defn_cnt
+                FROM `{drug_validity}`
+                WHERE rec_type IS NOT NULL AND drug_id IS NOT NULL
+            )
+            WHERE defn_cnt > 1
+            """
+        mqcg.guard_query(cnt_duplicates_query, "Drug validity duplicate count")
+        cnt_validation_duplicates = int(
+            mdo.fetch_bigquery_dataframe(cnt_duplicates_query, "validate_drug_duplicates_count")['cnt'].iloc[0]
+        )
+
+        # Step 7: Check for duplicates
+        logging.info(f"Number of duplicate rows found: {cnt_validation_duplicates}")
+
+        if cnt_validation_duplicates > 0:
+            logging.error("Duplicate rows found. Exporting to Excel and GCS and raising an exception.")
+            validate_duplicates_query_str = f"""
             WITH temp_tbl AS (
                 SELECT 
                 rec_type, 
                 drug_defn, 
                 drug_id,
                 COUNT(*) AS cnt
-                FROM `{dqi_storage_project}.{c_s_tdtempx}.drug_validity_{tdname}`
+                FROM `{drug_validity}`
                 GROUP BY rec_type, drug_defn, drug_id
                 HAVING cnt > 1
             )
@@ -177,84 +336,67 @@ def m_validation_drug_intake(tdname, c_s_tdtempx, c_s_schema, table_out, c_s_dqi
                 a.druglvl,
                 a.BRND_GNRC_CD,
                 a.DRUG_MULTI_SRC_CD
-            FROM `{dqi_storage_project}.{c_s_tdtempx}.drug_validity_{tdname}` a
+            FROM `{drug_validity}` a
             INNER JOIN temp_tbl b
                 ON a.rec_type = b.rec_type
                 AND a.drug_id = b.drug_id
             ORDER BY a.rec_type, a.drug_id
             """
-        validate_drug_duplicates2_df = mdo.fetch_bigquery_dataframe(validate_duplicates_query_str,"validate_drug_duplicates2")
-        logging.info("validate_drug_duplicates2 table created successfully.")
 
-        # Step 7: Check for duplicates
-        cnt_validation_duplicates = len(validate_drug_duplicates2_df)
-        logging.info(f"Number of duplicate rows found: {cnt_validation_duplicates}")
-
-        if cnt_validation_duplicates > 0:
-            logging.error("Duplicate rows found. Exporting to GCS and raising an exception.")
+            # Stream the duplicates to Excel, then upload the report to GCS
             c_s_rootdir = shared_variables['c_s_rootdir']
             c_s_program = shared_variables['c_s_program']
             c_s_proj = shared_variables['c_s_proj']
             c_s_ticket = shared_variables['c_s_ticket']
             dtf_out = f"{c_s_rootdir}\\{c_s_program}\\{c_s_proj}"
-            file_base_name = f"validate_drug_t{c_s_ticket}"
-            file_type = 'excel'
-
-            # Export duplicates to Excel
-            mdo.write_df_to_gcs(
-                df=validate_drug_duplicates2_df,
-                file_type=file_type,
-                gcs_dir=dtf_out,
-                file_name=file_base_name
+            mqcg.guard_query(validate_duplicates_query_str, "Drug validity duplicate rows")
+            mrw.write_report_to_gcs(
+                fetch_bigquery_dataframe_chunks(validate_duplicates_query_str),
+                f"{c_s_filedir}/validate_drug_{tdname}.xlsx", "validate_drug_duplicates",
+                dtf_out, f"validate_drug_t{c_s_ticket}", report_sidecars
             )
 
             # Log error and handle abend
             error_message = f"ERROR: abend message 5 - validate_drug_{tdname}.xlsx"
             logging.error(error_message)
-            m_abend_handler(
+            m_abend_handler.m_abend_handler(
                 abend_message_id=5,
                 abend_report=f"validate_drug_{tdname}.xlsx"
             )
             raise Exception(error_message)
 
-        # Step 8: Fetch and sort exclusion and inclusion rows
-        logging.info("Fetching and sorting exclusion and inclusion rows...")
-        for rec_type, var_name in [('I', 'drug_intake_i'), ('E', 'drug_intake_e')]:
-            query_str = f"SELECT * FROM `{dqi_storage_project}.{c_s_tdtempx}.drug_validity_{tdname}` WHERE rec_type='{rec_type}'"
-            df = mdo.fetch_bigquery_dataframe(query_str,var_name)
-            logging.info(f"Columns in the fetched DataFrame for rec_type '{rec_type}': {df.columns}")
-            if 'drug_id' in df.columns:
-                df = df.sort_values(by='drug_id')
-                globals()[f"{var_name}_df"] = df
-                logging.info(f"Fetched and sorted rows for rec_type: {rec_type}")
-            else:
-                logging.error(f"The 'drug_id' column is missing in the fetched DataFrame for rec_type: {rec_type}")
-
-        # Step 9: Identify invalid exclusions
+        # Steps 8-9: Identify invalid exclusions (exclusions with no matching inclusion)
+        # The anti-join runs in the warehouse; only the invalid exclusions are fetched
         logging.info("Identifying invalid exclusions...")
-        invalid_exclusions_query = """select drug_id, rec_type from drug_intake_e_df where drug_id not in (select drug_id from drug_intake_i_df)"""
-        invalid_exclusions_df = psql.sqldf(invalid_exclusions_query)
+        invalid_exclusions_query = f"""
+            SELECT drug_id, rec_type
+            FROM `{drug_validity}`
+            WHERE rec_type = 'E'
+            AND drug_id NOT IN (SELECT drug_id FROM `{drug_validity}` WHERE rec_type = 'I')
+            ORDER BY drug_id
+            """
+        mqcg.guard_query(invalid_exclusions_query, "Invalid exclusions")
+        invalid_exclusions_df = mdo.fetch_bigquery_dataframe(invalid_exclusions_query, "invalid_exclusions")
         cnt_validation_inclusions = len(invalid_exclusions_df)
         logging.info(f"Number of invalid exclusions found: {cnt_validation_inclusions}")
 
         if cnt_validation_inclusions > 0:
-            logging.error("Invalid exclusions found. Exporting to GCS and raising an exception.")
+            logging.error("Invalid exclusions found. Exporting to Excel and GCS and raising an exception.")
+            c_s_rootdir = shared_variables['c_s_rootdir']
+            c_s_program = shared_variables['c_s_program']
+            c_s_proj = shared_variables['c_s_proj']
+            c_s_ticket = shared_variables['c_s_ticket']
             dtf_out = f"{c_s_rootdir}\\{c_s_program}\\{c_s_proj}"
             file_base_name = f"{c_s_ticket}"
-            file_type = 'excel'
-
-            # Export invalid exclusions to GCS
-            mdo.write_df_to_gcs(
-                df=invalid_exclusions_df,
-                file_type=file_type,
-                gcs_dir=dtf_out,
-                file_name=file_base_name
-            )
+
+            # Export invalid exclusions to Excel and GCS
+            mrw.write_report_to_gcs(invalid_exclusions_df, f"{c_s_filedir}/{file_base_name}.xlsx",
+                                    "invalid_exclusions", dtf_out, file_base_name, report_sidecars)
 
             # Log error and handle abend
             error_message = f"ERROR: abend message 6 - {file_base_name}.xlsx"
             logging.error(error_message)
-            m_abend_handler(
+            m_abend_handler.m_abend_handler(
                 abend_message_id=6,
                 abend_report=f"{file_base_name}.xlsx"
             )
@@ -265,12 +407,19 @@ def m_validation_drug_intake(tdname, c_s_tdtempx, c_s_schema, table_out, c_s_dqi
     except Exception as e:
         logging.error(f"An error occurred during drug intake validation. Error: {e}")
         raise
+    finally:
+        # The match key and matched drug tables are only needed to build drug_validity
+        mdo.table_drop_passthrough(f"{c_s_tdtempx}.drug_match_keys_{tdname}")
+        mdo.table_drop_passthrough(f"{c_s_tdtempx}.drug_matched_{tdname}")
     logging.info("=========================================================")
     logging.info("m_validation_drug_intake completed successfully.")
     logging.info("=========================================================")
 if __name__ == "__main__":
     try:
-        m_validation_drug_intake(tdname, c_s_tdtempx, c_s_schema, table_out, c_s_dqi_campaign_id, c_s_filedir)
+        m_validation_drug_intake(tdname, c_s_tdtempx, c_s_schema, table_out, c_s_dqi_campaign_id, c_s_filedir,
+                                 drug_denorm_snapshot=c_s_drug_denorm_snapshot,
+                                 drug_denorm_cache=c_s_drug_denorm_cache,
+                                 drug_denorm_version_tables=c_s_drug_denorm_version_tables)
     except Exception as e:
         logging.error(f"Script execution failed with error: {e}")
         raise
\ No newline at end of file
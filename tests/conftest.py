@@ -0,0 +1,38 @@
+import importlib
+import os
+import sys
+
+import pytest
+import yaml
+
+# The modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import m_local_data_operations as mldo  # noqa: E402
+
+# Tests run offline: modules importing m_data_operations get the SQLite stand-in
+mldo.install(':memory:')
+
+
+@pytest.fixture
+def load_validator(tmp_path, monkeypatch):
+    """
+    Imports a validator module for a campaign, running in tmp_path on the SQLite stand-in.
+
+    Returns a function of (module_name, campaign_id, **shared_variables) that returns the
+    freshly imported module and its shared variables.
+    """
+    import m_benchmark_drug_validation as mbdv
+
+    monkeypatch.chdir(tmp_path)
+    mldo.configure(str(tmp_path / 'warehouse.db'))
+
+    def load(module_name, campaign_id, **overrides):
+        shared_variables = dict(mbdv._shared_variables(campaign_id, str(tmp_path)), **overrides)
+        with open('shared_variable.yaml', 'w') as f:
+            yaml.safe_dump(shared_variables, f)
+        # Module-level settings are read from shared_variable.yaml on import
+        monkeypatch.delitem(sys.modules, module_name, raising=False)
+        return importlib.import_module(module_name), shared_variables
+
+    return load
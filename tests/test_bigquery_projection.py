@@ -0,0 +1,25 @@
+"""
+Projected SELECTs of m_bigquery_projection.
+"""
+
+import pytest
+
+import m_bigquery_projection as mbqp
+
+TABLE_COLUMNS = ['rec_type', 'drug_code', 'retail_qty_Limit', 'gpi']
+
+
+def test_project_columns_keeps_table_order_and_spelling():
+    columns = mbqp.project_columns('p.d.t', ['GPI', 'retail_qty_limit'], TABLE_COLUMNS)
+    assert columns == ['retail_qty_Limit', 'gpi']
+
+
+def test_project_columns_names_missing_columns():
+    with pytest.raises(mbqp.MissingColumnsError, match='ndc11, ndc9'):
+        mbqp.project_columns('p.d.t', ['gpi', 'ndc9', 'ndc11'], TABLE_COLUMNS)
+
+
+def test_projected_select():
+    query = mbqp.projected_select('p.d.t', ['gpi', 'rec_type'], TABLE_COLUMNS, where="rec_type = 'I'",
+                                  order_by='gpi')
+    assert query == "SELECT `rec_type`, `gpi` FROM `p.d.t` WHERE rec_type = 'I' ORDER BY gpi"
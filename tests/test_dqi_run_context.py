@@ -0,0 +1,71 @@
+"""
+DqiRunContext derived settings, and the validators' requirement of an explicit context.
+"""
+
+import dataclasses
+import pickle
+import sys
+
+import pandas as pd
+import pytest
+
+import m_drug_quality_rules as mdqr
+import m_local_data_operations as mldo
+from m_dqi_run_context import DqiRunContext
+
+
+@pytest.mark.parametrize('parent, intake_file', [
+    ('m_intake_form_drug_fdro_ana', '8'), ('M_INTAKE_FORM_DRUG', '2'), ('', '2'),
+])
+def test_campaign_63_intake_file_follows_parent(parent, intake_file):
+    assert DqiRunContext(campaign_id=63, parent=parent).intake_file == intake_file
+
+
+def test_derived_flags():
+    assert DqiRunContext(campaign_id=30, parent='m_intake_form_drug').intake_form
+    assert not DqiRunContext(campaign_id=30, parent='m_intake_form_drug_acf').intake_form
+    assert DqiRunContext(campaign_id='554').balance_formulary_limits
+    assert DqiRunContext(campaign_id=20, clnt_spcfc_cmgpn='N').skip_quantity_limits
+    assert not DqiRunContext(campaign_id=20, clnt_spcfc_cmgpn='Y').skip_quantity_limits
+    assert DqiRunContext(campaign_id=66, clnt_spcfc_cmgpn='Y').skip_quantity_limits
+
+
+def test_parent_selects_rule_families():
+    families = {
+        parent: {compiled.rule.family for compiled in
+                 mdqr.resolve_drug_quality_rules(*DqiRunContext(campaign_id=30, parent=parent).rule_settings)}
+        for parent in ('', 'm_intake_form_drug')
+    }
+    assert 'INTAKE_FORM' in families['m_intake_form_drug']
+    assert 'INTAKE_FORM' not in families['']
+
+
+def test_from_shared_variables_is_frozen_and_picklable():
+    context = DqiRunContext.from_shared_variables(
+        {'c_s_dqi_campaign_id': 79, 'c_s_bob_run_type': 'BOB', 'c_s_run_type': 'CF'}, 'm_intake_form_drug_acf'
+    )
+    assert context.rule_settings == (79, 'M_INTAKE_FORM_DRUG_ACF', '', 'BOB', 'N')
+    assert pickle.loads(pickle.dumps(context)) == context
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        context.parent = ''
+
+
+def test_drug_quality_requires_context(load_validator):
+    mvdq, _ = load_validator('m_validation_drug_quality', 30)
+    with pytest.raises(ValueError, match='DqiRunContext'):
+        mvdq.m_validation_drug_quality()
+
+
+def test_drug_common_fields_require_context(tmp_path, monkeypatch):
+    pytest.importorskip('google.cloud.bigquery')
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'shared_variable.txt').write_text('c_s_dqi_campaign_id: 30\n')
+    monkeypatch.delitem(sys.modules, 'm_function_drug_common_fields', raising=False)
+    # The import replaces m_data_operations.fetch_bigquery_dataframe with its BigQuery client
+    monkeypatch.setattr(mldo, 'fetch_bigquery_dataframe', mldo.fetch_bigquery_dataframe)
+    import m_function_drug_common_fields as mfdcf
+
+    with pytest.raises(ValueError, match='DqiRunContext'):
+        mfdcf.m_function_drug_common_fields(pd.Series({'gpi': '1234'}, dtype=object))
+    with pytest.raises(ValueError, match='DqiRunContext'):
+        mfdcf.apply_drug_common_fields(pd.DataFrame({'gpi': ['1234']}, dtype=object))
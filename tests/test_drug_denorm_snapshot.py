@@ -0,0 +1,99 @@
+"""
+Drug denorm snapshots: versioning by the version tables, reuse, refresh and eviction.
+"""
+
+import os
+import sqlite3
+
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+import m_drug_denorm_snapshot as mdds
+import m_local_data_operations as mldo
+
+DRUG_DENORM = 'local.schema.v_drug_denorm'
+COLUMNS = ['drug_id', 'gpi_cd', 'DRUG_PROD_GID']
+
+
+@pytest.fixture
+def warehouse(tmp_path):
+    db_path = str(tmp_path / 'warehouse.db')
+    mldo.configure(db_path)
+    mldo.load_table('v_drug_denorm', pd.DataFrame({
+        'DRUG_PROD_GID': ['1', '2', '3'],
+        'drug_id': ['00002323330', '12345678901', None],
+        'gpi_cd': ['12345678901234', '21990000000000', '44440000000000'],
+        'OTC_DRUG_IND': ['N', 'Y', 'N'],
+    }))
+    mldo.load_table('drug_table', pd.DataFrame({'drug_id': ['00002323330']}))
+
+    def set_version(table_id, last_modified_time):
+        with sqlite3.connect(db_path) as conn:
+            conn.execute('UPDATE "__TABLES__" SET last_modified_time = ? WHERE table_id = ?',
+                         (last_modified_time, table_id))
+
+    set_version('drug_table', 1000)
+    return set_version
+
+
+def test_snapshot_is_reused_until_a_version_table_changes(warehouse, tmp_path):
+    cache_dir = str(tmp_path / 'snapshots')
+    snapshot_path = mdds.drug_denorm_snapshot(DRUG_DENORM, cache_dir, COLUMNS, ['drug_table'])
+    assert os.path.basename(snapshot_path).startswith('v_drug_denorm_1000_')
+    snapshot_df = pa.ipc.open_file(snapshot_path).read_all().to_pandas()
+    assert list(snapshot_df.columns) == COLUMNS and len(snapshot_df) == 3
+
+    # Same version and columns: the file is not rewritten
+    os.utime(snapshot_path, (1, os.path.getmtime(snapshot_path) - 60))
+    modified = os.path.getmtime(snapshot_path)
+    assert mdds.drug_denorm_snapshot(DRUG_DENORM, cache_dir, COLUMNS, ['drug_table']) == snapshot_path
+    assert os.path.getmtime(snapshot_path) == modified
+
+    # Another column set or a newer version table is another snapshot
+    other_columns = mdds.drug_denorm_snapshot(DRUG_DENORM, cache_dir, COLUMNS[:2], ['drug_table'])
+    warehouse('drug_table', 2000)
+    newer = mdds.drug_denorm_snapshot(DRUG_DENORM, cache_dir, COLUMNS, ['drug_table'])
+    assert len({snapshot_path, other_columns, newer}) == 3
+    assert os.path.basename(newer).startswith('v_drug_denorm_2000_')
+
+
+def test_snapshot_older_than_the_refresh_age_is_fetched_again(warehouse, tmp_path):
+    cache_dir = str(tmp_path / 'snapshots')
+    snapshot_path = mdds.drug_denorm_snapshot(DRUG_DENORM, cache_dir, COLUMNS, ['drug_table'])
+    os.utime(snapshot_path, (1, os.path.getmtime(snapshot_path) - 2 * 3600))
+    modified = os.path.getmtime(snapshot_path)
+    assert mdds.drug_denorm_snapshot(DRUG_DENORM, cache_dir, COLUMNS, ['drug_table'], max_age_hours=1) == snapshot_path
+    assert os.path.getmtime(snapshot_path) > modified
+
+
+@pytest.mark.parametrize('version_tables, message', [
+    ([], 'No version tables'),
+    (['drug_table', 'missing_table'], 'not found in local.schema: missing_table'),
+])
+def test_unknown_version_tables_raise(warehouse, tmp_path, version_tables, message):
+    with pytest.raises(ValueError, match=message):
+        mdds.drug_denorm_snapshot(DRUG_DENORM, str(tmp_path / 'snapshots'), COLUMNS, version_tables)
+
+
+def test_empty_drug_denorm_leaves_no_snapshot(warehouse, tmp_path):
+    mldo.load_table('v_drug_denorm', pd.DataFrame({column: pd.Series(dtype=object) for column in COLUMNS}))
+    cache_dir = tmp_path / 'snapshots'
+    with pytest.raises(ValueError, match='No rows returned'):
+        mdds.drug_denorm_snapshot(DRUG_DENORM, str(cache_dir), COLUMNS, ['drug_table'])
+    assert list(cache_dir.iterdir()) == []
+
+
+def test_eviction_keeps_the_newest_snapshots_and_the_one_in_use(tmp_path):
+    snapshots = []
+    for age in range(5):
+        snapshot_path = tmp_path / f"v_drug_denorm_{age}.arrow"
+        snapshot_path.write_bytes(b'x' * 100)
+        os.utime(snapshot_path, (1, 1e9 - age * 60))
+        snapshots.append(str(snapshot_path))
+
+    mdds.evict_drug_denorm_snapshots(str(tmp_path), keep=snapshots[4], max_versions=3)
+    assert sorted(str(path) for path in tmp_path.glob('*.arrow')) == sorted(snapshots[:2] + snapshots[4:])
+
+    mdds.evict_drug_denorm_snapshots(str(tmp_path), max_bytes=150)
+    assert [str(path) for path in tmp_path.glob('*.arrow')] == snapshots[:1]
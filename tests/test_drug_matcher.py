@@ -0,0 +1,72 @@
+"""
+Parity of DrugMatcher with the SQL LIKE join of m_validation_drug_intake, on SQLite.
+"""
+
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import m_drug_matcher as mdm
+
+DRUG_DENORM = pd.DataFrame({
+    'drug_row': [0, 1, 2, 3, 4, 5, 6, 7, 8, 9],
+    'drug_id': ['00002323330', '00002323331', '00002323430', '12345678901', '1234567890A',
+                '5555555555a', '55%55555555', '00002323330', None, '99999999999'],
+    'gpi_cd': ['12345678901234', '12345678901299', ' 1234567 ', '2199', '21990000000000',
+               None, '44%4', '12345678901234', '12345678901234', '88888888888888'],
+    'DRUG_PROD_GID': [1, 2, 3, 4, 5, 6, 7, None, 9, 10],
+})
+
+INTAKE_CODES = [
+    # Exact NDC11 and GPI codes
+    ('NDC11', '00002323330'), ('NDC11', '1234567890A'), ('GPI', '12345678901234'), ('GPI', '2199'),
+    # NDC9 codes, including one that looks like a wildcard
+    ('NDC9', '000023233'), ('NDC9', '123456789'), ('NDC9', '0000232_3'),
+    # '%' and '_' wildcards, and escaped wildcards
+    ('NDC11', '000023233%'), ('NDC11', '0000232_33_'), ('NDC11', '%0'), ('NDC11', '5555555555_'),
+    ('NDC11', '55\\%%'), ('NDC11', '%\\%%'), ('GPI', '1234567890129_'), ('GPI', '44\\%'),
+    ('GPI', '%4'), ('GPI', '_1'),
+    # Short and padded codes
+    ('NDC11', '0000232'), ('NDC11', '00002323330 '), ('GPI', '12'), ('GPI', ' 1234567 '),
+    ('GPI', '  2199'), ('GPI', '123456789012345'), ('GPI', ''),
+    # Case-sensitive matches, NULL codes and levels
+    ('NDC11', '5555555555A'), ('NDC11', None), ('GPI', None), (None, '00002323330'),
+]
+
+
+def _sql_matches(intake_df):
+    """(row_id, drug_row) pairs of the warehouse LIKE join, with BigQuery's case-sensitive LIKE."""
+    with sqlite3.connect(':memory:') as conn:
+        conn.execute('PRAGMA case_sensitive_like = ON')
+        intake_df.to_sql('intake', conn, index=False)
+        DRUG_DENORM.to_sql('drug_denorm', conn, index=False)
+        return pd.read_sql_query(r"""
+            SELECT mydrug.row_id, drug.drug_row
+            FROM intake mydrug
+            INNER JOIN drug_denorm drug
+            ON ((mydrug.druglvl = 'NDC11' AND drug.drug_id LIKE mydrug.drug_code ESCAPE '\')
+            OR (mydrug.druglvl = 'NDC9' AND mydrug.drug_code = SUBSTR(drug.drug_id, 1, 9))
+            OR (mydrug.druglvl = 'GPI' AND TRIM(drug.gpi_cd) LIKE TRIM(mydrug.drug_code) || '%' ESCAPE '\'))
+            WHERE drug.DRUG_PROD_GID IS NOT NULL
+            ORDER BY mydrug.row_id, drug.drug_row
+            """, conn)
+
+
+def _matcher_matches(intake_df):
+    matched = mdm.DrugMatcher(DRUG_DENORM).match(intake_df, ['drug_row'])
+    return matched[['row_id', 'drug_row']].astype('int64')
+
+
+@pytest.mark.parametrize('druglvl, drug_code', INTAKE_CODES)
+def test_drug_matcher_matches_sql_like(druglvl, drug_code):
+    intake_df = pd.DataFrame({'row_id': [0], 'druglvl': [druglvl], 'drug_code': [drug_code]}, dtype=object)
+    pd.testing.assert_frame_equal(_matcher_matches(intake_df), _sql_matches(intake_df), check_dtype=False)
+
+
+def test_drug_matcher_matches_sql_like_for_a_whole_intake():
+    intake_df = pd.DataFrame(INTAKE_CODES, columns=['druglvl', 'drug_code'], dtype=object)
+    intake_df.insert(0, 'row_id', range(len(intake_df)))
+    expected = _sql_matches(intake_df)
+    assert len(expected) > len(INTAKE_CODES) // 2, "the codes should match several drugs"
+    pd.testing.assert_frame_equal(_matcher_matches(intake_df), expected, check_dtype=False)
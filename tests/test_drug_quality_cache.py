@@ -0,0 +1,68 @@
+"""
+Revalidation cache: row digests, lookups, last-used marking and eviction.
+"""
+
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+
+import m_drug_quality_cache as mdqc
+
+
+def _intake(rows):
+    return pd.DataFrame({'gpi': [f"{i:014d}" for i in range(rows)], 'b_g': ['B'] * rows,
+                         'drug_desc': [f"drug {i}" for i in range(rows)]})
+
+
+def test_digest_depends_only_on_rule_columns():
+    intake_df = _intake(4)
+    row_hashes = mdqc.hash_drug_rows(intake_df, ['gpi', 'b_g'])
+    assert row_hashes.shape == (4, 2) and row_hashes.dtype == np.int64
+    assert len({tuple(row) for row in row_hashes}) == 4
+
+    # Other columns and column order do not matter; a rule column does
+    reordered = intake_df[['b_g', 'drug_desc', 'gpi']].assign(drug_desc='changed')
+    np.testing.assert_array_equal(mdqc.hash_drug_rows(reordered, ['b_g', 'gpi']), row_hashes)
+    changed = mdqc.hash_drug_rows(intake_df.assign(b_g=['B', 'G', 'B', 'B']), ['gpi', 'b_g'])
+    assert (changed != row_hashes).any(axis=1).tolist() == [False, True, False, False]
+
+
+def test_load_returns_hits_of_the_rules_version(tmp_path):
+    cache_path = str(tmp_path / 'cache.db')
+    row_hashes = mdqc.hash_drug_rows(_intake(5), ['gpi'])
+    mdqc.store_cached_messages(cache_path, 'v1', row_hashes[:3], ['', 'Invalid GPI', ''])
+
+    assert mdqc.load_cached_messages(cache_path, 'v1', row_hashes).tolist() == ['', 'Invalid GPI', '', None, None]
+    assert mdqc.load_cached_messages(cache_path, 'v2', row_hashes).tolist() == [None] * 5
+
+
+def test_load_marks_only_hits_as_used(tmp_path):
+    cache_path = str(tmp_path / 'cache.db')
+    row_hashes = mdqc.hash_drug_rows(_intake(4), ['gpi'])
+    mdqc.store_cached_messages(cache_path, 'v1', row_hashes, [''] * 4)
+    with sqlite3.connect(cache_path) as conn:
+        conn.execute("UPDATE drug_quality_cache SET last_used = 0")
+
+    mdqc.load_cached_messages(cache_path, 'v1', row_hashes[[1, 3]])
+    with sqlite3.connect(cache_path) as conn:
+        used = [row[0] > 0 for row in conn.execute("SELECT last_used FROM drug_quality_cache ORDER BY rowid")]
+    assert used == [False, True, False, True]
+
+
+def test_eviction_by_age_then_least_recently_used(tmp_path):
+    cache_path = str(tmp_path / 'cache.db')
+    row_hashes = mdqc.hash_drug_rows(_intake(6), ['gpi'])
+    mdqc.store_cached_messages(cache_path, 'v1', row_hashes, [''] * 6)
+    now = time.time()
+    with sqlite3.connect(cache_path) as conn:
+        # Rows 0-4 used from oldest to newest; row 5 not used for 40 days
+        for position, (h1, h2) in enumerate(row_hashes):
+            last_used = now - 40 * 86400 if position == 5 else now - (5 - position)
+            conn.execute("UPDATE drug_quality_cache SET last_used = ? WHERE row_hash = ? AND row_hash_2 = ?",
+                         (last_used, int(h1), int(h2)))
+
+    mdqc.evict_drug_quality_cache(cache_path, max_entries=3, max_age_days=30)
+    cached = mdqc.load_cached_messages(cache_path, 'v1', row_hashes)
+    assert [msg is not None for msg in cached] == [False, False, True, True, True, False]
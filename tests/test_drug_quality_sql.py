@@ -0,0 +1,81 @@
+"""
+Parity of compile_drug_quality_sql with the pandas rule evaluation, on the SQLite stand-in.
+"""
+
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import m_drug_quality_rules as mdqr
+import m_local_data_operations as mldo
+import m_synthetic_drug_intake as msdi
+
+# One or more campaigns per family, including the Balance Formulary and Health Exchange ones
+CAMPAIGNS = [20, 23, 26, 30, 52, 60, 66, 67, 566]
+
+
+def _pandas_messages(intake_df, rules):
+    rule_masks = mdqr.evaluate_drug_quality_rules(intake_df, rules)
+    return mdqr.build_validation_msg(intake_df.index, rule_masks)
+
+
+@pytest.mark.parametrize('campaign_id', CAMPAIGNS)
+def test_sqlite_pushdown_matches_pandas(tmp_path, campaign_id):
+    intake_df = msdi.generate_drug_intake(campaign_id, 2000, error_rate=0.05, seed=campaign_id)
+    intake_df.insert(0, 'row_id', range(len(intake_df)))
+    db_path = str(tmp_path / 'drug_quality.db')
+    mldo.configure(db_path)
+    mldo.load_table('drug_in', intake_df)
+
+    rules = mdqr.resolve_drug_quality_rules(campaign_id, '')
+    query = mdqr.compile_drug_quality_sql(rules, 'drug_in', intake_df.columns, dialect='sqlite')
+    with sqlite3.connect(db_path) as conn:
+        sql_df = pd.read_sql_query(query, conn)
+
+    expected = _pandas_messages(intake_df.drop(columns='row_id'), rules)
+    expected = expected[expected != '']
+    assert len(expected), "the synthetic intake should fail some rules"
+    actual = pd.Series(sql_df['validation_msg'].to_numpy(dtype=object), index=sql_df['row_id'].to_numpy())
+    pd.testing.assert_series_equal(actual.sort_index(), expected.sort_index(), check_dtype=False,
+                                   check_index_type=False, check_names=False)
+
+
+def test_sqlite_pushdown_limit(tmp_path):
+    intake_df = msdi.generate_drug_intake(30, 500, error_rate=0.2, seed=1)
+    db_path = str(tmp_path / 'drug_quality.db')
+    mldo.configure(db_path)
+    mldo.load_table('drug_in', intake_df)
+
+    rules = mdqr.resolve_drug_quality_rules(30, '')
+    query = mdqr.compile_drug_quality_sql(rules, 'drug_in', intake_df.columns, dialect='sqlite', limit=5)
+    with sqlite3.connect(db_path) as conn:
+        assert len(pd.read_sql_query(query, conn)) == 5
+
+
+def test_sqlite_pushdown_matches_pandas_for_intake_forms_with_null_identifiers(tmp_path):
+    parent = 'M_INTAKE_FORM_DRUG'
+    intake_df = msdi.generate_drug_intake(30, 1000, error_rate=0.02, seed=7, parent=parent)
+    # Identifiers populated, blank and NULL in every combination
+    identifier_values = ['12345678901', '', None]
+    combinations = [(a, b, c) for a in identifier_values for b in identifier_values for c in identifier_values]
+    for position, (ndc11, ndc9, gpi) in enumerate(combinations * 20):
+        intake_df.loc[position, ['ndc11', 'ndc9', 'gpi']] = [ndc11, ndc9 and ndc9[:9], gpi]
+    intake_df.insert(0, 'row_id', range(len(intake_df)))
+    db_path = str(tmp_path / 'drug_quality.db')
+    mldo.configure(db_path)
+    mldo.load_table('drug_in', intake_df)
+
+    rules = mdqr.resolve_drug_quality_rules(30, parent)
+    query = mdqr.compile_drug_quality_sql(rules, 'drug_in', intake_df.columns, dialect='sqlite')
+    with sqlite3.connect(db_path) as conn:
+        sql_df = pd.read_sql_query(query, conn)
+
+    # The rules see the intake as fetched from the warehouse, NULLs included
+    drug_in_df = mldo.fetch_bigquery_dataframe("SELECT * FROM drug_in")
+    expected = _pandas_messages(drug_in_df.drop(columns='row_id').set_index(drug_in_df['row_id']), rules)
+    expected = expected[expected != '']
+    assert expected.str.contains('Only 1 of NDC11, NDC9 or GPI can be populated').any()
+    actual = pd.Series(sql_df['validation_msg'].to_numpy(dtype=object), index=sql_df['row_id'].to_numpy())
+    pd.testing.assert_series_equal(actual.sort_index(), expected.sort_index(), check_dtype=False,
+                                   check_index_type=False, check_names=False)
@@ -0,0 +1,74 @@
+"""
+Column-wise drug common fields: parity with the row-wise scalar function.
+"""
+
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+import yaml
+
+import m_local_data_operations as mldo
+from m_dqi_run_context import DqiRunContext
+
+VALUES = {
+    'age_min': [None, np.nan, 0, '0', '18', 18, '', 65.0],
+    'age_max': [None, np.nan, '', 64, '99'],
+    'gpi': ['', '  ', None, '1234*', '12*34', '*12', ' 12345678 ', '12?4*', '12_4', '1234%', '1?', '123456789012'],
+    'ndc11': ['', None, '12345678901', '1234?678*', ' ', '12_45', '123%'],
+    'ndc9': ['', None, '123456789', '  ', '12345?'],
+    'b_g': ['', 'B', ' ', None, 'G'],
+    'ms_ss': ['', 'M', None, '  '],
+    'drug_category': ['', ' ANTI ', 'X'],
+    'retail_qty_limit': ['30', '', None, np.nan, 0, 30, 30.0, 'x' * 210, ' 5 '],
+    'retail_qty_unit': ['tabs', '', '.', None, np.nan],
+    'retail_qty_time': ['30', '', None, 'x' * 5],
+    'mail_qty_limit': ['90', '', None, np.nan, '.'],
+    'mail_qty_unit': ['tabs', '', '.', None],
+    'mail_qty_time': ['90', '', None],
+    'druglvl': ['OLD', None],
+}
+
+
+def _drug_lines(rows, seed):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({column: [values[i] for i in rng.integers(0, len(values), rows)]
+                         for column, values in VALUES.items()}, dtype=object)
+
+
+def _missing_as_none(df):
+    df = df.astype(object)
+    return df.where(df.notna(), None)
+
+
+@pytest.fixture
+def load_common_fields(tmp_path, monkeypatch):
+    pytest.importorskip('google.cloud.bigquery')
+    monkeypatch.chdir(tmp_path)
+
+    def load(campaign_id, clnt_spcfc_cmgpn):
+        with open('shared_variable.txt', 'w') as f:
+            yaml.safe_dump({'c_s_dqi_campaign_id': campaign_id, 'c_s_clnt_spcfc_cmgpn': clnt_spcfc_cmgpn}, f)
+        monkeypatch.delitem(sys.modules, 'm_function_drug_common_fields', raising=False)
+        # The import replaces m_data_operations.fetch_bigquery_dataframe with its BigQuery client
+        monkeypatch.setattr(mldo, 'fetch_bigquery_dataframe', mldo.fetch_bigquery_dataframe)
+        import m_function_drug_common_fields as mfdcf
+        return mfdcf
+
+    return load
+
+
+@pytest.mark.parametrize('parent', ['', 'm_intake_form_drug'])
+@pytest.mark.parametrize('campaign_id, clnt_spcfc_cmgpn', [(20, 'N'), (30, 'N'), (66, 'Y'), (67, 'N')])
+@pytest.mark.parametrize('dropped', [(), ('druglvl', 'b_g', 'drug_category', 'mail_qty_unit'), ('ndc11', 'ndc9')])
+def test_apply_matches_the_scalar_function(load_common_fields, campaign_id, clnt_spcfc_cmgpn, parent, dropped):
+    mfdcf = load_common_fields(campaign_id, clnt_spcfc_cmgpn)
+    context = DqiRunContext.from_shared_variables(mfdcf.shared_variables, parent)
+    drug_df = _drug_lines(100, campaign_id).drop(columns=list(dropped))
+
+    expected = drug_df.apply(lambda row: mfdcf.m_function_drug_common_fields(row.copy(), context), axis=1)
+    processed = mfdcf.apply_drug_common_fields(drug_df, context)
+    assert sorted(processed.columns) == sorted(expected.columns)
+    # df.apply rebuilds the rows, so missing values may come back as None or NaN
+    pd.testing.assert_frame_equal(_missing_as_none(processed[expected.columns]), _missing_as_none(expected))
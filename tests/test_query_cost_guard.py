@@ -0,0 +1,59 @@
+"""
+Query cost guard: dry-run estimates against the per-query limit and the run budget.
+"""
+
+import logging
+
+import pandas as pd
+import pytest
+
+import m_local_data_operations as mldo
+
+# 100 rows of 4 columns, as estimated by the stand-in's dry run
+TABLE_BYTES = 100 * 4 * mldo.DRY_RUN_BYTES_PER_CELL
+QUERY = "SELECT * FROM `local.tdtempx.drug_intake`"
+
+
+@pytest.fixture
+def load_guard(load_validator):
+    def load(**shared_variables):
+        mqcg, _ = load_validator('m_query_cost_guard', 30, **shared_variables)
+        mldo.load_table('drug_intake', pd.DataFrame({column: range(100) for column in 'abcd'}))
+        return mqcg
+    return load
+
+
+def test_estimates_are_totalled_without_limits(load_guard):
+    mqcg = load_guard()
+    assert mqcg.guard_query(QUERY, 'first') == TABLE_BYTES
+    assert mqcg.guard_query("SELECT 1", 'second') == 0
+    assert mqcg.query_cost_guard.total_bytes == TABLE_BYTES
+    assert mqcg.query_cost_guard.estimates == [('first', TABLE_BYTES), ('second', 0)]
+
+
+def test_flag_logs_statements_over_a_limit(load_guard, caplog):
+    mqcg = load_guard(c_s_query_max_bytes=TABLE_BYTES - 1, c_s_query_budget_bytes=TABLE_BYTES * 2)
+    with caplog.at_level(logging.WARNING):
+        mqcg.guard_query(QUERY, 'first')
+        mqcg.guard_query(QUERY, 'second')
+        mqcg.guard_query(QUERY, 'third')
+    warnings = [record.getMessage() for record in caplog.records if record.levelno == logging.WARNING]
+    assert len(warnings) == 3 and all('over the per-query limit' in warning for warning in warnings)
+    assert ['past the run budget' in warning for warning in warnings] == [False, False, True]
+    assert mqcg.query_cost_guard.total_bytes == TABLE_BYTES * 3
+
+
+def test_reject_raises_without_adding_to_the_total(load_guard):
+    mqcg = load_guard(c_s_query_budget_bytes=TABLE_BYTES * 2, c_s_query_cost_action='reject')
+    mqcg.guard_query(QUERY, 'first')
+    mqcg.guard_query(QUERY, 'second')
+    with pytest.raises(mqcg.QueryCostExceeded, match='third: rejected.*past the run budget'):
+        mqcg.guard_query(QUERY, 'third')
+    assert mqcg.query_cost_guard.total_bytes == TABLE_BYTES * 2
+    assert len(mqcg.query_cost_guard.estimates) == 3
+
+
+def test_unknown_action_is_refused(load_guard):
+    mqcg = load_guard()
+    with pytest.raises(ValueError, match="Unknown query cost action 'warn'"):
+        mqcg.QueryCostGuard(action='warn')
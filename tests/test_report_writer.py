@@ -0,0 +1,53 @@
+"""
+Streaming report writer: sheet contents, sidecars and the GCS upload of the written workbook.
+"""
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+
+import m_local_data_operations as mldo
+import m_report_writer as mrw
+
+
+def _chunks(rows, chunk_rows):
+    for start in range(0, rows, chunk_rows):
+        stop = min(start + chunk_rows, rows)
+        yield pd.DataFrame({'drug_code': [f"{i:011d}" for i in range(start, stop)],
+                            'retail_qty_limit': [np.nan if i % 3 == 0 else float(i) for i in range(start, stop)]})
+
+
+def _sheet_rows(file_path, sheet_name):
+    return list(load_workbook(file_path)[sheet_name].iter_rows(values_only=True))
+
+
+def test_write_report_streams_chunks(tmp_path):
+    file_path = str(tmp_path / 'report.xlsx')
+    assert mrw.write_report(_chunks(25, 10), file_path, 'validate_drug_quality', ('csv',)) == 25
+
+    sheet_rows = _sheet_rows(file_path, 'validate_drug_quality')
+    assert sheet_rows[0] == ('drug_code', 'retail_qty_limit')
+    assert sheet_rows[1] == ('00000000000', None)
+    assert sheet_rows[2] == ('00000000001', 1)
+    assert len(sheet_rows) == 26
+    assert len(pd.read_csv(tmp_path / 'report.csv')) == 25
+
+
+def test_rows_beyond_sheet_limit_reach_sidecars_only(tmp_path, monkeypatch):
+    monkeypatch.setattr(mrw, 'EXCEL_MAX_ROWS', 11)
+    file_path = str(tmp_path / 'report.xlsx')
+    assert mrw.write_report(_chunks(25, 7), file_path, 'report', ('csv',)) == 25
+
+    assert len(_sheet_rows(file_path, 'report')) == 11
+    assert len(pd.read_csv(tmp_path / 'report.csv')) == 25
+
+
+def test_write_report_to_gcs_uploads_the_written_workbook(tmp_path):
+    mldo.configure(str(tmp_path / 'warehouse.db'))
+    file_path = str(tmp_path / 'validate_drug_t1.xlsx')
+    rows = mrw.write_report_to_gcs(_chunks(12, 5), file_path, 'invalid_exclusions', 'root\\program\\proj',
+                                   'validate_drug_t1')
+
+    assert rows == 12
+    assert mldo.gcs_uploads == [('root\\program\\proj', 'validate_drug_t1.xlsx', 'file', file_path)]
+    assert len(_sheet_rows(file_path, 'invalid_exclusions')) == 13
@@ -0,0 +1,50 @@
+"""
+Row-hash deduplication: parity with drop_duplicates across chunks, and hash collisions.
+"""
+
+import numpy as np
+import pandas as pd
+
+import m_row_dedupe as mrd
+
+
+def _report_rows():
+    return pd.DataFrame({
+        'drug_id': ['001', '002', '001', None, '003', None, '002', '004', '001'],
+        'message': ['Invalid GPI', '', 'Invalid GPI', 'Missing NDC', '', 'Missing NDC', 'x', np.nan, 'Invalid GPI'],
+        'count': [1, 2, 1, 3, 4, 3, 2, 5, 1],
+    })
+
+
+def _unique_in_chunks(deduplicator, df, chunk_rows):
+    chunks = [deduplicator.unique_rows(df.iloc[start:start + chunk_rows]) for start in range(0, len(df), chunk_rows)]
+    return pd.concat(chunks)
+
+
+def test_unique_rows_match_drop_duplicates_across_chunks():
+    report_df = _report_rows()
+    expected = report_df.drop_duplicates(keep='first')
+    for chunk_rows in (1, 2, 4, len(report_df)):
+        deduplicator = mrd.RowHashDeduplicator()
+        pd.testing.assert_frame_equal(_unique_in_chunks(deduplicator, report_df, chunk_rows), expected)
+        assert (deduplicator.rows_seen, deduplicator.rows_kept, deduplicator.collisions) == (9, 6, 0)
+
+
+def test_empty_frames_are_counted_and_returned():
+    deduplicator = mrd.RowHashDeduplicator()
+    empty_df = _report_rows().iloc[:0]
+    assert deduplicator.unique_rows(empty_df).empty
+    assert deduplicator.unique_rows(_report_rows()).shape == (6, 3)
+    assert (deduplicator.rows_seen, deduplicator.rows_kept) == (9, 6)
+
+
+def test_hash_collisions_keep_distinct_rows(monkeypatch):
+    # Every row hashes alike, so only the value comparison tells rows apart
+    monkeypatch.setattr(pd.util, 'hash_pandas_object',
+                        lambda df, index=False: pd.Series(np.zeros(len(df), dtype=np.uint64)))
+    report_df = _report_rows()
+    expected = report_df.drop_duplicates(keep='first')
+    for chunk_rows in (1, 3, len(report_df)):
+        deduplicator = mrd.RowHashDeduplicator()
+        pd.testing.assert_frame_equal(_unique_in_chunks(deduplicator, report_df, chunk_rows), expected)
+        assert (deduplicator.rows_kept, deduplicator.collisions) == (6, 5)
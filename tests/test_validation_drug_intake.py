@@ -0,0 +1,85 @@
+"""
+Drug intake validation on the SQLite stand-in.
+"""
+
+import pandas as pd
+import pytest
+
+import m_local_data_operations as mldo
+import m_synthetic_drug_intake as msdi
+
+
+def _run_intake(mvdi, shared_variables, **options):
+    mvdi.m_validation_drug_intake(
+        shared_variables['tdname'], shared_variables['c_s_tdtempx'], shared_variables['c_s_schema'],
+        shared_variables['table_out'], shared_variables['c_s_dqi_campaign_id'], shared_variables['c_s_filedir'],
+        **options
+    )
+
+
+def _drug_validity(shared_variables):
+    drug_validity_df = mldo.fetch_bigquery_dataframe(f"SELECT * FROM drug_validity_{shared_variables['tdname']}")
+    return drug_validity_df.astype(str).sort_values(list(drug_validity_df.columns)).reset_index(drop=True)
+
+
+@pytest.fixture
+def drug_intake(load_validator):
+    mvdi, shared_variables = load_validator('m_validation_drug_intake', 30)
+    intake_df = msdi.generate_drug_intake(30, 400, error_rate=0.0, seed=3)
+    mldo.load_table(shared_variables['table_out'], intake_df)
+    mldo.load_table('v_drug_denorm', msdi.generate_drug_reference(intake_df, seed=3))
+    return mvdi, shared_variables
+
+
+def test_local_matching_builds_the_warehouse_drug_validity(drug_intake, tmp_path):
+    mvdi, shared_variables = drug_intake
+    _run_intake(mvdi, shared_variables)
+    warehouse_df = _drug_validity(shared_variables)
+
+    _run_intake(mvdi, shared_variables, drug_denorm_cache=str(tmp_path / 'drug_denorm_cache'),
+                drug_denorm_version_tables=['v_drug_denorm'])
+    assert len(list((tmp_path / 'drug_denorm_cache').glob('*.arrow'))) == 1
+    pd.testing.assert_frame_equal(_drug_validity(shared_variables), warehouse_df)
+
+
+def test_large_intake_is_counted_not_fetched(drug_intake, tmp_path, monkeypatch):
+    mvdi, shared_variables = drug_intake
+    monkeypatch.setattr(mvdi, 'LOCAL_MATCH_MAX_ROWS', 100)
+    queries = []
+    fetch = mldo.fetch_bigquery_dataframe
+
+    def recording_fetch(query, df_name=None):
+        queries.append(query)
+        return fetch(query, df_name)
+
+    monkeypatch.setattr(mldo, 'fetch_bigquery_dataframe', recording_fetch)
+
+    _run_intake(mvdi, shared_variables, drug_denorm_cache=str(tmp_path / 'drug_denorm_cache'),
+                drug_denorm_version_tables=['v_drug_denorm'])
+    intake_queries = [query for query in queries if shared_variables['table_out'] in query]
+    assert intake_queries == [f"SELECT COUNT(*) AS cnt FROM `local.{shared_variables['table_out']}`"]
+    assert not (tmp_path / 'drug_denorm_cache').exists()
+
+
+def test_only_invalid_exclusions_are_reported_in_drug_id_order(drug_intake):
+    mvdi, shared_variables = drug_intake
+    intake_df = mldo.fetch_bigquery_dataframe(f"SELECT * FROM `{shared_variables['table_out']}`")
+    reference_df = mldo.fetch_bigquery_dataframe("SELECT * FROM v_drug_denorm")
+    # Exclude three drugs no inclusion covers, in descending drug_id order, so the report has to sort them
+    invalid_ids = sorted(reference_df['drug_id'].iloc[-3:], reverse=True)
+    exclusions = intake_df.index[intake_df['rec_type'] == 'E'][:3]
+    assert len(exclusions) == 3 and (intake_df['rec_type'] == 'E').sum() > 3
+    intake_df.loc[exclusions, ['drug_code', 'ndc11']] = [[drug_id, drug_id] for drug_id in invalid_ids]
+    intake_df.loc[exclusions, ['b_g', 'ms_ss']] = 'A'
+    mldo.load_table(shared_variables['table_out'], intake_df)
+
+    with pytest.raises(Exception, match='abend message 6'):
+        _run_intake(mvdi, shared_variables, report_sidecars=('csv',))
+
+    ticket = shared_variables['c_s_ticket']
+    assert mldo.abend_calls == [(6, f'{ticket}.xlsx')]
+    assert [upload[1] for upload in mldo.gcs_uploads] == [f'{ticket}.xlsx']
+    report_df = pd.read_csv(f"{shared_variables['c_s_filedir']}/{ticket}.csv", dtype=str)
+    assert list(report_df['rec_type'].unique()) == ['E']
+    # drug_validity holds a PBM and an MDDB row per drug, and the report keeps both
+    assert list(report_df['drug_id']) == sorted(invalid_ids * 2)
@@ -0,0 +1,53 @@
+"""
+Drug quality validation on the SQLite stand-in: the report holds every row the rules fail.
+"""
+
+import os
+
+import pandas as pd
+import pytest
+
+import m_drug_quality_rules as mdqr
+import m_local_data_operations as mldo
+import m_synthetic_drug_intake as msdi
+from m_dqi_run_context import DqiRunContext
+
+
+def _typed_intake(campaign_id, rows):
+    """Synthetic intake whose quantity limits are integer columns with NULLs."""
+    intake_df = msdi.generate_drug_intake(campaign_id, rows, error_rate=0.05, seed=campaign_id)
+    for column in ('retail_qty_Limit', 'mail_qty_limit'):
+        limits = pd.to_numeric(intake_df[column], errors='coerce').astype('Int64')
+        limits[::7] = pd.NA
+        intake_df[column] = limits
+    return intake_df
+
+
+@pytest.mark.parametrize('options', [{}, {'chunk_rows': 300}, {'pushdown': True}, {'revalidation_cache': 'cache.db'}])
+def test_report_rows_match_engine_failures(load_validator, options):
+    mvdq, shared_variables = load_validator('m_validation_drug_quality', 23)
+    mldo.load_table(shared_variables['table_out'], _typed_intake(23, 1500))
+    context = DqiRunContext.from_shared_variables(shared_variables)
+
+    # The engine's failures over the intake as the warehouse returns it
+    drug_in_df = mldo.fetch_bigquery_dataframe(f"SELECT * FROM `{shared_variables['table_out']}`")
+    rules = mdqr.resolve_drug_quality_rules(*context.rule_settings)
+    validation_msg = mdqr.build_validation_msg(drug_in_df.index, mdqr.evaluate_drug_quality_rules(drug_in_df, rules))
+    failed = int((validation_msg != '').sum())
+    assert failed
+
+    with pytest.raises(Exception, match='abend message 21'):
+        mvdq.m_validation_drug_quality(report_sidecars=('csv',), context=context, **options)
+
+    report_df = pd.read_csv(os.path.join(shared_variables['c_s_filedir'], 'validate_drug_bench_23.csv'))
+    assert mldo.abend_calls == [(21, 'validate_drug_bench_23.xlsx')]
+    assert len(report_df) == failed
+    assert list(report_df.columns) == list(drug_in_df.columns) + ['validation_msg']
+
+
+def test_clean_intake_passes(load_validator):
+    mvdq, shared_variables = load_validator('m_validation_drug_quality', 30)
+    mldo.load_table(shared_variables['table_out'], msdi.generate_drug_intake(30, 500, error_rate=0.0, seed=1))
+
+    mvdq.m_validation_drug_quality(context=DqiRunContext.from_shared_variables(shared_variables))
+    assert mldo.abend_calls == []